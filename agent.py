@@ -1,7 +1,9 @@
-import numpy as np
+from collections import deque
+import math
 import random
 import uuid
 
+from behavior import BehaviorState
 from contact import *
 from objects import Object
 from direction import Direction
@@ -18,34 +20,73 @@ class Agent(Object):
     wish to move.
     """
 
+    # gid: Global index of the agent when the world is split into tiles (see
+    # domain.py)
+    __slots__ = ('cfg', 'gid')
+
     def __init__(self, parent, x:int, y:int, config:SimConfig):
         super().__init__(parent, x, y)
         self.cfg = config
 
-    def get_movement(self) -> np.array:
+    def get_movement(self, rng=random) -> tuple:
         """
         Function that should return a vector representing the movement the agent 
         will take. 
+
+        rng:    Random stream to draw from (see Environment.stream())
         """
         raise NotImplementedError
 
 
+    def get_movement_weights(self) -> list:
+        """
+        Get the relative likelihood of get_movement() returning each of the
+        directions in Direction.direction_list. By default, all directions are
+        equally likely.
+        """
+
+        return [1] * len(Direction.direction_list)
+
+
+    def get_restricted_movement(self, legal:list, rng=random) -> tuple:
+        """
+        Pick a movement from the same distribution as get_movement(), but
+        restricted to the legal directions. If none of the legal directions
+        could be picked by get_movement(), pick one of them at random instead.
+
+        legal:  List of booleans, one per direction in Direction.direction_list,
+                saying whether the agent may move that way
+        rng:    Random stream to draw from
+
+        returns: The movement vector; Direction.NONE if no move is legal
+        """
+
+        weights = [w if ok else 0 for w, ok in zip(self.get_movement_weights(), legal)]
+        if sum(weights) == 0:
+            weights = [1 if ok else 0 for ok in legal]
+            if sum(weights) == 0:
+                return Direction.NONE
+        return rng.choices(Direction.direction_list, weights=weights)[0]
+
+
 class MeanderingAgent(Agent):
     """
     Agent that moves about randomly, one space at a time.
     """
 
+    __slots__ = ()
+
     def __init__(self, parent, x:int, y:int):
         super().__init__(parent, x, y)
         
 
-    def get_movement(self) -> np.array:
+    def get_movement(self, rng=random) -> tuple:
         """
         Pick a cardinal direction to step in, at random.
         """
 
         dirs = [Direction.N, Direction.E, Direction.S, Direction.W]
-        return random.choice(dirs)
+        return rng.choice(dirs)
 
 
 class FocusedAgent(Agent):
@@ -58,7 +99,9 @@ class FocusedAgent(Agent):
     more likely it is to move towards it).
     """
 
-    def __init__(self, parent, x:int, y:int, home:np.array, work:np.array, 
+    __slots__ = ('home_point', 'work_point', 'focus_point', 'slack')
+
+    def __init__(self, parent, x:int, y:int, home:tuple, work:tuple, 
                     slack:int, config:SimConfig):
         """
         x:  Initial x coordiate of the agent
@@ -78,7 +121,7 @@ class FocusedAgent(Agent):
         self.slack = slack 
 
 
-    def get_movement(self) -> np.array:
+    def get_movement(self, rng=random) -> tuple:
         """
         Move, either directly towards the focus point, or erroneously (parallel
         or backwards). The chance of erroneous movement is inversely proportional 
@@ -94,78 +137,92 @@ class FocusedAgent(Agent):
         # [0,0], and so the agent will stay stuck on that point instead of 
         # orbiting around it. Let's allow it to move in any of the 8 directions,
         # with equal probability.     
-        if np.array_equal(target_direction, Direction.NONE):
-            return self.get_random_direction()
+        if target_direction == Direction.NONE:
+            return self.get_random_direction(rng)
 
         distance_factor = self.get_distance(target_vector) / self.slack
-        R = random.randint(0,299)
+        R = rng.randint(0,299)
         if R < 100 + 200 * distance_factor:
             # Move along the target vector directly towards focus point
             return target_direction
         elif R < 200 + 100 * distance_factor:
             # Move perpendicular to the target vector
             # 50/50 chance of moving 'right' or 'left' relative to the vector
-            rot = random.choice([Rotation.CCW_90, Rotation.CCW_270])
-            return np.dot(target_direction, rot)
+            rot = rng.choice([Rotation.CCW_90, Rotation.CCW_270])
+            return rot[target_direction]
         else:
             # Move along the target vector, away from the focus point
-            return np.dot(target_direction, Rotation.CW_180)
+            return Rotation.CW_180[target_direction]
+
+
+    def get_movement_weights(self) -> list:
+        """
+        Overrides Agent.get_movement_weights(), giving the distribution that
+        get_movement() samples from.
+        """
+
+        target_vector = self.get_target_vector()
+        target_direction = self.get_compass_direction(target_vector)
+        if target_direction == Direction.NONE:
+            return super().get_movement_weights()
+
+        # Number of the 300 possible values of R in get_movement() that lead
+        # to each kind of move
+        distance_factor = self.get_distance(target_vector) / self.slack
+        direct = min(300, math.ceil(100 + 200 * distance_factor))
+        perpendicular = max(0, min(300, math.ceil(200 + 100 * distance_factor)) - direct)
+        backwards = 300 - direct - perpendicular
+
+        weights = [0] * len(Direction.direction_list)
+        weights[Direction.index_of(target_direction)] += direct
+        for rot in (Rotation.CCW_90, Rotation.CCW_270):
+            weights[Direction.index_of(rot[target_direction])] += perpendicular / 2
+        weights[Direction.index_of(Rotation.CW_180[target_direction])] += backwards
+        return weights
 
 
-    def get_distance(self, vector:np.array) -> int:
+    def get_distance(self, vector:tuple) -> int:
         """
         Get the distance (as crow flies, not cartesian) of a vector.
-        
-        The built-in numpy function to get the magnitude of a vector,
-        np.linalg.norm(x), is apparently very slow. Credit to
-        https://stackoverflow.com/a/9184560, which uses the fact that the dot
-        product between a vector and itself is the magnitude squared, to make
-        this call that returns in 1/4 the time.
+
+        Vectors are plain (x, y) pairs, so this is cheaper with scalar math
+        than with any numpy call.
 
         vector: The vector/coordinate pair in question
 
         returns: The magnitude of the vector, rounded to the nearest integer
         """
 
-        return int(np.round(np.sqrt(vector.dot(vector))))
+        x, y = vector
+        return int(round(math.sqrt(x*x + y*y)))
 
 
-    def get_target_vector(self) -> np.array:
+    def get_target_vector(self) -> tuple:
         """
         Get a vector pointing from the agent towards its focus point.  
         """
 
-        return self.focus_point - self.pos
+        focus_x, focus_y = self.focus_point
+        return (focus_x - self.x, focus_y - self.y)
     
 
-    def get_compass_direction(self, vector:np.array) -> Direction:
+    def get_compass_direction(self, vector:tuple) -> tuple:
         """
         Return the direction of a vector, normalized to one of the eight compass
         directions.
         """
 
-        base_vector = Direction.NONE
-        
-        x, y = vector.tolist()
-        if x > 0:
-            base_vector = base_vector + Direction.E
-        elif x < 0:
-            base_vector = base_vector + Direction.W
-        
-        if y > 0:
-            base_vector = base_vector + Direction.S
-        elif y < 0:
-            base_vector = base_vector + Direction.N
+        x, y = vector
+        # Sign of each component; (1, 1) is Direction.SE, and so on
+        return ((x > 0) - (x < 0), (y > 0) - (y < 0))
 
-        return base_vector
 
-
-    def get_random_direction(self) -> np.array:
+    def get_random_direction(self, rng=random) -> tuple:
         """
         Pick a compass direction at random.
         """
         
-        return random.choice(Direction.direction_list)
+        return rng.choice(Direction.direction_list)
 
 
     def toggle_focus(self) -> None:
@@ -186,8 +243,10 @@ class BiologicalAgent(FocusedAgent):
     """
     Agent that is susceptible to catching and spreading disease.
     """
+
+    __slots__ = ('infection',)
     
-    def __init__(self, parent, x:int, y:int, home:np.array, work:np.array, 
+    def __init__(self, parent, x:int, y:int, home:tuple, work:tuple, 
                     slack:int, config:SimConfig):
         """
         x:  Initial x coordiate of the agent
@@ -247,23 +306,36 @@ class BiologicalAgent(FocusedAgent):
         return self.infection.status == sir.RECOVERED
 
 
-class BehaviorState(Enum):
-    IDLE = 1
-    AWAITING_TEST = 2
-    SELF_ISOLATING = 3
-    CAUTIOUS_ISOLATING = 4
-
-
 class IsolatingAgent(BiologicalAgent):
     """
     Agent with the capability to self-isolate upon becoming symptomatic.
     Used for simulation model B.
     """
+
+    __slots__ = ()
+
     def __init__(self, parent, x, y, home, work, slack, config):
         super().__init__(parent, x, y, home, work, slack, config)
 
-        self.behavior = BehaviorState.IDLE
-        self.testing_timer = 0
+    # The agent's behaviour state and timers live in its row of the
+    # environment's BehaviorTable, which steps them for all agents at once
+    # (see Environment.update_behavior()). A new row starts out IDLE.
+
+    @property
+    def behavior(self) -> BehaviorState:
+        return BehaviorState(int(self.parent.behaviors.state[self.index]))
+
+    @behavior.setter
+    def behavior(self, value:BehaviorState):
+        self.parent.behaviors.state[self.index] = value.value
+
+    @property
+    def testing_timer(self) -> int:
+        return int(self.parent.behaviors.testing_timer[self.index])
+
+    @testing_timer.setter
+    def testing_timer(self, value:int):
+        self.parent.behaviors.testing_timer[self.index] = value
 
     def self_isolate(self):
         self.behavior = BehaviorState.SELF_ISOLATING
@@ -299,30 +371,6 @@ class IsolatingAgent(BiologicalAgent):
     def is_isolating(self):
         return self.behavior == BehaviorState.SELF_ISOLATING
 
-    def tick(self):
-        """
-        Overrides BiologicalAgent.tick().
-        Agents will now begin self-isolating upon becoming symptomatic.
-        """
-        # Tick the infection forward (no effect if infection is inactive)
-        self.infection.tick()
-
-        if self.behavior == BehaviorState.IDLE:
-            # Get tested if symptomatic
-            if self.is_symptomatic():
-                self.wait_for_test()
-
-        elif self.behavior == BehaviorState.AWAITING_TEST:
-            self.testing_timer -= 1
-            if self.testing_timer <= 0:
-                # Go into self-isolation
-                self.self_isolate()
-
-        elif self.behavior == BehaviorState.SELF_ISOLATING:
-            # Go back to normal once the infection ends
-            if self.is_recovered():
-                self.stop_isolating()
-
 
 class TraceableAgent(IsolatingAgent):
     """
@@ -330,18 +378,19 @@ class TraceableAgent(IsolatingAgent):
     Used for simulation model C.
     """
 
-    def __init__(self, parent, x:int, y:int, home:np.array, work:np.array, 
+    __slots__ = ('agent_id',)
+
+    def __init__(self, parent, x:int, y:int, home:tuple, work:tuple, 
                     slack:int, config):
         super().__init__(parent, x, y, home, work, slack, config)
         # Unique ID to track each agent
         self.agent_id = uuid.uuid4()
-        # List of contacts with other agents
-        self.contacts = list()
 
 
     def register_contact(self, time, contacted_agent):
         """
-        Record a contact with another agent at a particular time.
+        Record a contact with another agent at a particular time, in the
+        environment's contact log.
         """
         if not contacted_agent.is_symptomatic():
             symptoms = SymptomLevel.NONE
@@ -350,66 +399,30 @@ class TraceableAgent(IsolatingAgent):
         elif contacted_agent.infection.status == sir.SYMPTOMATIC_SEVERE:
             symptoms = SymptomLevel.SEVERE
         
-        self.contacts.append(Contact(time, 
-                                    contacted_agent.pos,
-                                    contacted_agent.agent_id,
-                                    symptoms
-                                    ))
+        self.parent.record_contact(self, contacted_agent, symptoms)
+        if symptoms == SymptomLevel.MILD:
+            self.parent.behaviors.record_mild_contact(self.index, time)
 
 
-    def tick(self):
+    def get_contacted_agents(self, expiry:int) -> dict:
         """
-        Overrides IsolatingAgent.tick().
+        Get all the contacts this agent has made in the past {expiry} ticks,
+        oldest first, as a dict of arrays (see ContactLog.contacts_of()).
         """
-        # Tick the infection forward (no effect if infection is inactive)
-        self.infection.tick()
 
-        if self.behavior == BehaviorState.IDLE:
-            # Get tested if symptomatic
-            if self.is_symptomatic():
-                self.wait_for_test()
-                self.notify_contacts()
+        now = self.parent.current_time
+        return self.parent.contact_log.contacts_of(self.gid, now - expiry, now)
 
-        elif self.behavior == BehaviorState.AWAITING_TEST:
-            self.testing_timer -= 1
-            if self.testing_timer <= 0:
-                # Go into self-isolation
-                self.self_isolate()
 
-        elif self.behavior == BehaviorState.SELF_ISOLATING:
-            # Go back to normal once the infection ends
-            if self.is_recovered():
-                self.stop_isolating()
-        
-
-    def get_contacted_agents(self, expiry:int):
-        """
-        Get all the unique agents that this agent has come into contact with,
-        in the past {expiry} ticks.
-        """
-
-        contact_list = list()
-        for c in self.contacts:
-            time_delta = self.parent.current_time - c.time
-            if time_delta <= expiry:
-                contact_list.append(c)
-        return contact_list
-
-
-    def get_recent_contacts(self):
-        recent_contacts = self.get_contacted_agents(self.cfg.INCUBATION_SAFE_TIME
-                                                    + self.cfg.INCUBATION_CONTAGIOUS_TIME)
-        if self.cfg.CONTACT_CULLING:
-            self.contacts = recent_contacts
-        return recent_contacts
+    def get_recent_contacts(self) -> dict:
+        return self.get_contacted_agents(self.cfg.INCUBATION_SAFE_TIME
+                                         + self.cfg.INCUBATION_CONTAGIOUS_TIME)
 
     
     def notify_contacts(self):
-        contact_list = self.get_recent_contacts()
-        for c in contact_list:
-            uuid = c.contact_id
-            agent = self.parent.get_agent_by_uuid(uuid)
-            agent.notification_reaction()
+        contacts = self.get_recent_contacts()
+        for gid in contacts['b'].tolist():
+            self.parent.notify(gid)
 
 
     def notification_reaction(self):
@@ -422,64 +435,32 @@ class CautiousAgent(TraceableAgent):
     Agent that will preemptively isolate.
     Used for simulation model D.
     """
-    def __init__(self, parent, x, y, home, work, slack, config):
-        super().__init__(parent, x, y, home, work, slack, config)
-        self.caution_timer = 0
 
+    # contact_buckets: Recent contacts, indexed by location in a coarse grid
+    # of buckets (see bucket_of()), oldest first within each bucket
+    __slots__ = ('contact_buckets',)
 
-    def tick(self):
-        """
-        Overrides BiologicalAgent.tick().
-        Agents will now begin self-isolating upon becoming symptomatic.
-        """
-        # Tick the infection forward (no effect if infection is inactive)
-        self.infection.tick()
-
-        if self.behavior == BehaviorState.IDLE:
-            # Get tested if symptomatic
-            if self.is_symptomatic():
-                self.wait_for_test()
-                self.notify_contacts()
-
-            # Isolate if number of symptomatic contacts exceeds threshold
-            if self.get_infected_contacts() > self.cfg.CAUTION_THRESHOLD:
-                self.cautious_isolate()
-                self.geonotify()
+    def __init__(self, parent, x, y, home, work, slack, config):
+        super().__init__(parent, x, y, home, work, slack, config)
+        self.contact_buckets = dict()
 
-        elif self.behavior == BehaviorState.AWAITING_TEST:
-            self.testing_timer -= 1
-            if self.testing_timer <= 0:
-                # Go into self-isolation if test was prompted by symptoms
-                self.self_isolate()
+    @property
+    def caution_timer(self) -> int:
+        return int(self.parent.behaviors.caution_timer[self.index])
 
-        elif self.behavior == BehaviorState.SELF_ISOLATING:
-            # Go back to normal once the infection ends
-            if self.is_recovered():
-                self.stop_isolating()
-
-        elif self.behavior == BehaviorState.CAUTIOUS_ISOLATING:
-            # Go into self-isolation if symptoms develop
-            if self.is_symptomatic():
-                self.self_isolate()
-            else:
-                # Go back to normal if the caution period expires
-                self.caution_timer -= 1
-                if self.caution_timer <= 0:
-                    self.stop_isolating()
-                    self.parent.unnecessary_isolations += 1
-        
+    @caution_timer.setter
+    def caution_timer(self, value:int):
+        self.parent.behaviors.caution_timer[self.index] = value
 
     def get_infected_contacts(self):
         """
         Count all contacts with agents exhibiting mild symptoms, that occurred
         within the last {incubation period} ticks.
+
+        The count is kept up to date by the environment's behaviour table as
+        contacts are registered and age out, so this takes constant time.
         """
-        count = 0
-        contact_list = self.get_recent_contacts()
-        for c in contact_list:
-            if c.symptomatic == SymptomLevel.MILD:
-                count += 1
-        return count
+        return int(self.parent.behaviors.mild_contacts[self.index])
 
     def cautious_isolate(self):
         self.behavior = BehaviorState.CAUTIOUS_ISOLATING
@@ -516,48 +497,110 @@ class CautiousAgent(TraceableAgent):
     def geonotify(self):
         
         recent_contacts = self.get_recent_contacts()
-        sum_x = 0
-        sum_y = 0
-        n = len(recent_contacts)
-        for c in recent_contacts:
-            x, y = c.location.tolist()
-            sum_x += x
-            sum_y += y
-        avg_x = sum_x / n
-        avg_y = sum_y / n
-        avg_point = np.array([avg_x, avg_y])
-        for c in recent_contacts:
-            agent = self.parent.get_agent_by_uuid(c.contact_id)
-            agent.geonotification_reaction(avg_point)
-
-
-    def geonotification_reaction(self, point:np.array):
-        if self.check_for_local_contact(point):
+        n = len(recent_contacts['b'])
+        avg_x = int(recent_contacts['x'].sum()) / n
+        avg_y = int(recent_contacts['y'].sum()) / n
+        avg_point = (avg_x, avg_y)
+        for gid in recent_contacts['b'].tolist():
+            self.parent.notify(gid, avg_point)
+
+
+    def geonotification_reaction(self, points:list):
+        """
+        React to the geonotifications received this tick, about the given
+        points.
+        """
+        if any(self.check_for_local_contact(p) for p in points):
             self.self_isolate
             self.parent.num_geonotified += 1
         
 
 
-    def check_for_local_contact(self, notified_point:np.array):
+    def check_for_local_contact(self, notified_point:tuple):
         """
         Check to see if this agent has recently encountered contacts near 
         a given point.
-        """
-        recent_contacts = self.get_recent_contacts()
-        for c in recent_contacts:
-            vector = notified_point - c.location
-            if self.get_distance(vector) <= self.cfg.GEOLOCATION_DISTANCE:
-                return True
+
+        Only the buckets around the point are searched. Buckets are a little
+        larger than the geolocation distance (which get_distance() rounds), so
+        any contact near enough is in the point's bucket or one of the eight
+        around it.
+        """
+        notified_x, notified_y = notified_point
+        bx, by = self.bucket_of(notified_x, notified_y)
+        for key in ((bx + i, by + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            for _, contact_x, contact_y in self.prune_bucket(key):
+                vector = (notified_x - contact_x, notified_y - contact_y)
+                if self.get_distance(vector) <= self.cfg.GEOLOCATION_DISTANCE:
+                    return True
         return False
-        
+
+
+    def register_contact(self, time, contacted_agent):
+        """
+        Overrides TraceableAgent.register_contact(), also indexing the contact
+        by location.
+        """
+        super().register_contact(time, contacted_agent)
+        key = self.bucket_of(contacted_agent.x, contacted_agent.y)
+        bucket = self.contact_buckets.get(key)
+        if bucket is None:
+            # The agent has wandered into a new area; take the chance to
+            # forget about any areas it has not had contacts in for a while
+            for old_key in list(self.contact_buckets):
+                self.prune_bucket(old_key)
+            bucket = self.contact_buckets[key] = deque()
+        bucket.append((time, contacted_agent.x, contacted_agent.y))
+
+
+    def prune_bucket(self, key:tuple) -> deque:
+        """
+        Drop the contacts in a bucket that are no longer recent, deleting the
+        bucket if that empties it.
+
+        returns: The remaining contacts in the bucket, as (time, x, y)
+        """
+
+        bucket = self.contact_buckets.get(key)
+        if bucket is None:
+            return ()
+        expiry = self.cfg.INCUBATION_SAFE_TIME + self.cfg.INCUBATION_CONTAGIOUS_TIME
+        while bucket and self.parent.current_time - bucket[0][0] > expiry:
+            bucket.popleft()
+        if not bucket:
+            del self.contact_buckets[key]
+        return bucket
+
+
+    def rebucket(self) -> None:
+        """
+        Re-index the recent contacts, after the bucket size (which follows
+        GEOLOCATION_DISTANCE) has changed.
+        """
+
+        contacts = sorted(c for bucket in self.contact_buckets.values()
+                          for c in bucket)
+        self.contact_buckets = dict()
+        for time, x, y in contacts:
+            key = self.bucket_of(x, y)
+            self.contact_buckets.setdefault(key, deque()).append((time, x, y))
+
+
+    def bucket_of(self, x:float, y:float) -> tuple:
+        size = self.cfg.GEOLOCATION_DISTANCE + 1
+        return (math.floor(x / size), math.floor(y / size))
 
 
 class Rotation:
     """
-    Transformation matrices; multiply a vector by one of these matrices to
-    effect a rotation on that vector.
+    Rotation lookup tables; index one of these tables with a direction to get
+    that direction rotated. Equivalent to multiplying the direction (as a row
+    vector) by the corresponding rotation matrix, without doing the math.
     """
 
-    CCW_270 = np.array([[0, -1], [1, 0]])
-    CCW_90 = np.array([[0, 1], [-1, 0]])
-    CW_180 = np.array([[-1, 0], [0, -1]])
+    # [[0, -1], [1, 0]]
+    CCW_270 = {d: (d[1], -d[0]) for d in Direction.direction_list}
+    # [[0, 1], [-1, 0]]
+    CCW_90 = {d: (-d[1], d[0]) for d in Direction.direction_list}
+    # [[-1, 0], [0, -1]]
+    CW_180 = {d: (-d[0], -d[1]) for d in Direction.direction_list}
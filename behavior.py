@@ -0,0 +1,147 @@
+"""
+Behaviour state of agents that react to the disease (modes B-D).
+
+Rather than each agent holding its own state and walking its transitions one
+at a time, the state of a whole population is held in a BehaviorTable of
+parallel arrays, so that the environment can step every agent's behaviour at
+once with array masks (see Environment.update_behavior()).
+"""
+from enum import Enum
+import numpy as np
+
+
+class BehaviorState(Enum):
+    IDLE = 1
+    AWAITING_TEST = 2
+    SELF_ISOLATING = 3
+    CAUTIOUS_ISOLATING = 4
+
+
+class BehaviorTable:
+    """
+    Behaviour state, timers and SIR status of a population of agents, stored
+    in parallel arrays. Each agent owns the row given by its 'index' attribute.
+    Rows freed by agents leaving the population are reused by later arrivals.
+
+    The table also keeps a running count of each agent's recent contacts with
+    mildly symptomatic agents. Contacts are tallied in a ring of <window>
+    per-tick slots; each tick, the slot about to be reused holds the contacts
+    that have just aged out of the window, and is subtracted from the counts.
+    """
+
+    def __init__(self, capacity:int=64, window:int=1):
+        """
+        capacity:   Number of rows to allocate up front; the table grows as
+                    needed
+        window:     Number of ticks a contact counts towards the running count
+                    of mild contacts, including the tick it happened in
+        """
+
+        self.size = 0
+        self.free = list()
+        self.agents = list()
+        self.window = window
+
+        self.state = np.zeros(0, dtype=np.int8)
+        self.testing_timer = np.zeros(0, dtype=np.int32)
+        self.caution_timer = np.zeros(0, dtype=np.int32)
+        # Mirror of each agent's SIR_status value, kept up to date by its
+        # Infection
+        self.status = np.zeros(0, dtype=np.int8)
+        self.in_use = np.zeros(0, dtype=bool)
+        # Number of mildly symptomatic contacts within the window, and the
+        # ring of per-tick tallies they are made up of
+        self.mild_contacts = np.zeros(0, dtype=np.int32)
+        self.mild_ring = np.zeros((window, 0), dtype=np.int16)
+        self.grow(capacity)
+
+
+    def grow(self, capacity:int) -> None:
+        """
+        Reallocate the arrays to hold <capacity> rows.
+        """
+
+        def resized(array):
+            new = np.zeros(array.shape[:-1] + (capacity,), dtype=array.dtype)
+            new[..., :array.shape[-1]] = array
+            return new
+
+        self.state = resized(self.state)
+        self.testing_timer = resized(self.testing_timer)
+        self.caution_timer = resized(self.caution_timer)
+        self.status = resized(self.status)
+        self.in_use = resized(self.in_use)
+        self.mild_contacts = resized(self.mild_contacts)
+        self.mild_ring = resized(self.mild_ring)
+        self.agents.extend([None] * (capacity - len(self.agents)))
+
+
+    def add(self, agent) -> int:
+        """
+        Give an agent a row, starting out idle with no timers running.
+
+        returns: The agent's row
+        """
+
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == len(self.state):
+                self.grow(2 * self.size)
+            row = self.size
+            self.size += 1
+
+        self.agents[row] = agent
+        self.in_use[row] = True
+        self.state[row] = BehaviorState.IDLE.value
+        self.testing_timer[row] = 0
+        self.caution_timer[row] = 0
+        self.mild_contacts[row] = 0
+        self.mild_ring[:, row] = 0
+        infection = getattr(agent, 'infection', None)
+        self.status[row] = infection.status.value if infection else 0
+        return row
+
+
+    def remove(self, row:int) -> None:
+        self.agents[row] = None
+        self.in_use[row] = False
+        self.free.append(row)
+
+
+    def row_state(self, row:int) -> tuple:
+        """
+        Get the behaviour state, timers and mild contact tallies of a row, for
+        moving an agent to another table.
+        """
+
+        return (int(self.state[row]), int(self.testing_timer[row]),
+                int(self.caution_timer[row]), int(self.mild_contacts[row]),
+                self.mild_ring[:, row].tolist())
+
+
+    def restore(self, row:int, saved:tuple) -> None:
+        """
+        Restore the state saved by row_state(). Both tables must share the
+        same window, and have been aged to the same tick.
+        """
+
+        (self.state[row], self.testing_timer[row], self.caution_timer[row],
+         self.mild_contacts[row], self.mild_ring[:, row]) = saved
+
+
+    def record_mild_contact(self, row:int, time:int) -> None:
+        self.mild_ring[time % self.window, row] += 1
+        self.mild_contacts[row] += 1
+
+
+    def age_mild_contacts(self, time:int) -> None:
+        """
+        Drop the contacts that fall out of the window at <time>, freeing their
+        slot for contacts made at <time>. Must be called once every tick,
+        before any contacts are recorded for that tick.
+        """
+
+        slot = self.mild_ring[time % self.window]
+        self.mild_contacts[:self.size] -= slot[:self.size]
+        slot[:self.size] = 0
@@ -0,0 +1,283 @@
+"""
+Calibration of SimConfig parameters against a target curve, e.g. the
+infection rate of an observed outbreak, or of a log from another run:
+
+    python3 calibrate.py A 2 target.csv --param INFECTION_PROBABILITY=0.1:0.9
+        --param INCUBATION_CONTAGIOUS_TIME=20:100
+
+The target is a CSV file with a column of the same name as a log column
+(infection_rate by default, see logger.COLUMNS), one row per tick, as in the
+logs the simulation writes. Runs last as many ticks as the target has rows.
+
+Parameters are fitted with the cross-entropy method: each generation draws a
+population of candidates from a normal distribution per parameter, runs
+them, and refits the distributions to the best (elite) few, until they
+narrow around the parameters that fit best. Candidates are scored by the
+mean squared error of their curve against the target, averaged over a few
+replicate runs. Every candidate uses the same replicate seeds (common random
+numbers), so differences in score come from the parameters rather than the
+seeds.
+
+Candidates run in parallel worker processes. Since the squared error can
+only grow as a run goes on, a run is abandoned as soon as its error so far
+exceeds REJECT_FACTOR times the elite cutoff of the previous generation:
+such a candidate would not have been close to the elite anyway. Once the
+cutoff reaches zero, i.e. the elite fit the target exactly, there is no
+margin to reject by, and candidates run in full.
+"""
+import argparse
+import csv
+import math
+import multiprocessing
+import numpy as np
+
+from logger import COLUMNS
+from simulation import Simulation, make_config, parse_overrides
+
+# Ticks between checks of a candidate's error so far
+CHECK_INTERVAL = 100
+# A candidate is abandoned once its error so far exceeds this many times the
+# previous generation's elite cutoff
+REJECT_FACTOR = 4.0
+# Weight of the new elite in each update of the sampling distributions; the
+# rest is kept from the previous ones, so they do not collapse too early
+SMOOTHING = 0.7
+
+
+class Parameter:
+    """
+    A SimConfig parameter to calibrate, and the range it may take.
+    """
+
+    def __init__(self, name:str, low:float, high:float, integer:bool):
+        """
+        integer:    Whether the parameter takes integer values; candidates
+                    are rounded to the nearest one.
+        """
+
+        self.name = name
+        self.low = low
+        self.high = high
+        self.integer = integer
+
+    def value(self, x:float):
+        """
+        Get the value of the parameter for a sample <x> of its distribution.
+        """
+
+        x = min(max(x, self.low), self.high)
+        # Rounded past float noise, so that values such as midpoints print
+        # and compare cleanly
+        return int(round(x)) if self.integer else round(float(x), 12)
+
+
+def read_target(path:str, column:str) -> np.ndarray:
+    """
+    Read the target curve from a column of a CSV file.
+    """
+
+    with open(path, newline='') as f:
+        return np.array([float(row[column]) for row in csv.DictReader(f)])
+
+
+def rejection_limit(cutoff:float) -> float:
+    """
+    Get the mean squared error past which candidates are abandoned, given the
+    previous generation's elite cutoff (math.inf for none).
+    """
+
+    # A cutoff of zero would reject every candidate that is not an exact fit
+    if cutoff > 0:
+        return REJECT_FACTOR * cutoff
+    return math.inf
+
+
+# State of each worker process, set by init_worker()
+worker = dict()
+
+
+def init_worker(mode:str, severity:int, fixed:dict, target:np.ndarray,
+                column:str, seeds:list) -> None:
+    worker.update(mode=mode, severity=severity, fixed=fixed, target=target,
+                  column=column, seeds=seeds)
+
+
+def evaluate(task:tuple) -> tuple:
+    """
+    Score one candidate, in a worker process.
+
+    task:   (index, overrides, limit): the candidate's index in its
+            generation, its SimConfig overrides, and the mean squared error
+            past which it is abandoned (math.inf for none)
+
+    returns: (index, error, rejected). If the candidate was abandoned, the
+             error is the error so far, a lower bound of the full one.
+    """
+
+    index, overrides, limit = task
+    target = worker['target']
+    seeds = worker['seeds']
+    column = worker['column']
+
+    # The error summed over all replicates, past which a candidate is rejected
+    limit_sum = limit * len(target) * len(seeds)
+    total = 0.0
+    for seed in seeds:
+        config = make_config(worker['mode'], worker['severity'],
+                             dict(worker['fixed'], **overrides, RNG_SEED=seed,
+                                  MAXIMUM_TIME=len(target) - 1))
+        sim = Simulation(config)
+        done = 0
+        while not sim.env.complete:
+            curve = sim.run(CHECK_INTERVAL)[column]
+            error = float(np.sum((curve[done:] - target[done:len(curve)]) ** 2))
+            total += error
+            done = len(curve)
+            if total > limit_sum:
+                return index, total / (len(target) * len(seeds)), True
+    return index, total / (len(target) * len(seeds)), False
+
+
+def calibrate(mode:str, severity:int, target:np.ndarray, params:list,
+              fixed:dict=None, column:str='infection_rate',
+              population:int=32, elite:int=6,
+              generations:int=20, replicates:int=3, seed:int=2020,
+              workers:int=None, tolerance:float=1e-3) -> dict:
+    """
+    Fit parameters to a target curve with the cross-entropy method.
+
+    target:         Value of <column> in each tick
+    params:         Parameters to fit
+    fixed:          Other SimConfig overrides, the same for every candidate
+    population:     Candidates per generation
+    elite:          Number of best candidates the distributions are refitted to
+    generations:    Maximum number of generations
+    replicates:     Runs per candidate, with seeds seed, seed+1, ...
+    workers:        Worker processes; one per CPU by default
+    tolerance:      Stop early once the spread of every parameter is below
+                    this fraction of its range
+
+    returns: dict of the best candidate found: its parameter values under
+             their names, and its error under 'error'.
+    """
+
+    rng = np.random.default_rng(seed)
+    low = np.array([p.low for p in params], dtype=np.float64)
+    high = np.array([p.high for p in params], dtype=np.float64)
+    mean = (low + high) / 2
+    sd = (high - low) / 4
+    seeds = [seed + r for r in range(replicates)]
+
+    best = None
+    best_error = math.inf
+    cutoff = math.inf
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(mode, severity, fixed or dict(), target,
+                                        column, seeds)) as pool:
+        for generation in range(generations):
+            samples = rng.normal(mean, sd, size=(population, len(params)))
+            candidates = [{p.name: p.value(x) for p, x in zip(params, row)}
+                          for row in samples.tolist()]
+            # Samples as the simulation will see them, after rounding and
+            # clipping, for refitting the distributions
+            values = np.array([[c[p.name] for p in params] for c in candidates],
+                              dtype=np.float64)
+
+            limit = rejection_limit(cutoff)
+            errors = np.empty(population)
+            rejected = 0
+            tasks = [(i, c, limit) for i, c in enumerate(candidates)]
+            for i, error, abandoned in pool.imap_unordered(evaluate, tasks):
+                errors[i] = error
+                rejected += abandoned
+
+            # Rejected candidates have errors above the previous cutoff, so
+            # they only reach the elite if most of the generation is rejected
+            order = np.argsort(errors, kind='stable')
+            elites = values[order[:elite]]
+            cutoff = errors[order[elite - 1]]
+            if errors[order[0]] < best_error:
+                best_error = errors[order[0]]
+                best = candidates[order[0]]
+
+            mean = SMOOTHING * elites.mean(axis=0) + (1 - SMOOTHING) * mean
+            sd = SMOOTHING * elites.std(axis=0) + (1 - SMOOTHING) * sd
+
+            print(f'Generation {generation}: best error {errors[order[0]]:.6g}, '
+                  f'elite cutoff {cutoff:.6g}, {rejected} rejected')
+            print('\t' + ', '.join(f'{p.name}={m:.4g}±{s:.2g}'
+                                   for p, m, s in zip(params, mean, sd)))
+
+            if np.all(sd < tolerance * (high - low)):
+                break
+
+    return dict(best, error=best_error)
+
+
+def parse_param(spec:str, mode:str, severity:int, fixed:dict) -> Parameter:
+    """
+    Parse a NAME=LOW:HIGH parameter range. The parameter takes integer values
+    if its default does.
+    """
+
+    name, _, bounds = spec.partition('=')
+    name = name.strip()
+    low, _, high = bounds.partition(':')
+    low, high = float(low), float(high)
+    if low >= high:
+        raise ValueError(f'Empty range for {name}')
+    default = getattr(make_config(mode, severity, fixed), name, None)
+    if not isinstance(default, (int, float)) or isinstance(default, bool):
+        raise ValueError(f'Cannot calibrate {name}')
+    return Parameter(name, low, high, isinstance(default, int))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fit SimConfig parameters to a target curve')
+    parser.add_argument('mode')
+    parser.add_argument('severity', type=int)
+    parser.add_argument('target', help='CSV file holding the target curve')
+    parser.add_argument('--param', action='append', required=True,
+                        metavar='NAME=LOW:HIGH',
+                        help='parameter to fit, and its range; may be given '
+                             'several times')
+    parser.add_argument('--set', action='append', default=list(),
+                        metavar='NAME=VALUE[,...]',
+                        help='other parameters to override in every run, e.g. '
+                             'NUM_AGENTS=2000,WORLD_WIDTH=1200')
+    parser.add_argument('--column', default='infection_rate', choices=COLUMNS,
+                        help='column of the target and the logs to fit')
+    parser.add_argument('--population', type=int, default=32)
+    parser.add_argument('--elite', type=int, default=6)
+    parser.add_argument('--generations', type=int, default=20)
+    parser.add_argument('--replicates', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=2020)
+    parser.add_argument('--workers', type=int,
+                        help='worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    if not 0 < args.elite <= args.population:
+        parser.error('--elite must be between 1 and --population')
+    try:
+        fixed = dict()
+        for spec in args.set:
+            fixed.update(parse_overrides(spec))
+        params = [parse_param(spec, args.mode, args.severity, fixed)
+                  for spec in args.param]
+    except ValueError as e:
+        parser.error(str(e))
+    target = read_target(args.target, args.column)
+
+    best = calibrate(args.mode, args.severity, target, params, fixed=fixed,
+                     column=args.column, population=args.population,
+                     elite=args.elite, generations=args.generations,
+                     replicates=args.replicates, seed=args.seed,
+                     workers=args.workers)
+    print('Best fit:')
+    for name, value in best.items():
+        print(f'\t{name} = {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,10 @@ class SymptomLevel(Enum):
     MILD = 1
     SEVERE = 2
 class Contact:
+    __slots__ = ('time', 'contact_id', 'location', 'symptomatic')
+
     def __init__(self, time, loc, ID, sym):
         self.time = time
         self.contact_id = ID
         self.location = loc
-        self.symptomatic = sym
\ No newline at end of file
+        self.symptomatic = sym
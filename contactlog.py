@@ -0,0 +1,214 @@
+"""
+Engine-level record of the contacts between agents.
+
+Contacts are stored as parallel arrays (tick, a, b, x, y, symptoms), where
+agent <a> met agent <b> (both given by global index) at tick <tick>, with <b>
+standing at (x, y) and showing <symptoms> (a SymptomLevel value). Each tick's
+contacts are appended as one chunk, sorted by <a>, so that the contacts in a
+range of ticks can be found without scanning the whole log, and those of one
+agent by binary search within each chunk.
+"""
+import numpy as np
+import os
+
+COLUMNS = ('tick', 'a', 'b', 'x', 'y', 'symptoms')
+DTYPES = (np.int32, np.int32, np.int32, np.int32, np.int32, np.int8)
+
+
+def spans(column:np.ndarray, agents:np.ndarray) -> list:
+    """
+    Find the runs of the given agents in the <a> column of a part, which is
+    sorted by agent.
+
+    agents: Sorted array of global indices
+
+    returns: (agent, start, stop) of each agent found, in order
+    """
+
+    starts = np.searchsorted(column, agents, side='left')
+    stops = np.searchsorted(column, agents, side='right')
+    return [(int(agents[i]), int(starts[i]), int(stops[i]))
+            for i in np.flatnonzero(stops > starts).tolist()]
+
+
+class ContactLog:
+
+    def __init__(self, retention:int=None):
+        """
+        retention:  Number of ticks of contacts to keep, counting back from
+                    the latest tick appended. If None, every contact is kept.
+        """
+
+        self.retention = retention
+        # Chunks keyed by tick. A tick may be made up of several parts, as
+        # contacts can be imported for ticks that have already been appended.
+        self.chunks = dict()
+        # Earliest tick that may still have a chunk
+        self.first_tick = None
+
+
+    def append(self, tick:int, a, b, x, y, symptoms) -> None:
+        """
+        Append the contacts made at <tick>, given as sequences of equal length.
+        """
+
+        columns = [np.full(len(a), tick, dtype=np.int32)]
+        columns += [np.asarray(col, dtype=dtype)
+                    for col, dtype in zip((a, b, x, y, symptoms), DTYPES[1:])]
+        self.add_part(tick, columns)
+
+        if self.first_tick is None:
+            self.first_tick = tick
+        if self.retention is not None:
+            while self.first_tick <= tick - self.retention:
+                self.chunks.pop(self.first_tick, None)
+                self.first_tick += 1
+
+
+    def add_part(self, tick:int, columns:list) -> None:
+        """
+        Add contacts made at <tick>, as a list of arrays in COLUMNS order.
+        """
+
+        if len(columns[0]) == 0:
+            return
+        order = np.argsort(columns[1], kind='stable')
+        if (order != np.arange(len(order))).any():
+            columns = [col[order] for col in columns]
+        self.chunks.setdefault(tick, list()).append(columns)
+
+
+    def parts(self, t0:int, t1:int):
+        """
+        Iterate over the chunk parts of ticks t0 <= tick <= t1.
+        """
+
+        if self.first_tick is not None:
+            t0 = max(t0, self.first_tick)
+        for tick in range(t0, t1 + 1):
+            yield from self.chunks.get(tick, ())
+
+
+    def window(self, t0:int, t1:int) -> dict:
+        """
+        Get all contacts made in ticks t0 <= tick <= t1, as a dict of arrays
+        keyed by column name.
+        """
+
+        parts = list(self.parts(t0, t1))
+        return {name: np.concatenate([p[i] for p in parts])
+                        if parts else np.zeros(0, dtype=dtype)
+                for i, (name, dtype) in enumerate(zip(COLUMNS, DTYPES))}
+
+
+    def contacts_of(self, a:int, t0:int, t1:int) -> dict:
+        """
+        Get the contacts agent <a> made in ticks t0 <= tick <= t1, oldest
+        first, as a dict of arrays keyed by column name.
+        """
+
+        slices = list()
+        for part in self.parts(t0, t1):
+            start, stop = np.searchsorted(part[1], (a, a + 1))
+            if start < stop:
+                slices.append([col[start:stop] for col in part])
+
+        return {name: np.concatenate([s[i] for s in slices])
+                        if slices else np.zeros(0, dtype=dtype)
+                for i, (name, dtype) in enumerate(zip(COLUMNS, DTYPES))}
+
+
+    def adjacency(self, t0:int, t1:int, num_agents:int) -> tuple:
+        """
+        Get the contacts made in ticks t0 <= tick <= t1 as a compressed sparse
+        row (CSR) adjacency structure: the agents met by agent <a> are
+        indices[indptr[a]:indptr[a+1]], met at ticks[indptr[a]:indptr[a+1]].
+
+        num_agents: Number of agents (rows) in the adjacency
+
+        returns: (indptr, indices, ticks)
+        """
+
+        contacts = self.window(t0, t1)
+        order = np.argsort(contacts['a'], kind='stable')
+        counts = np.bincount(contacts['a'], minlength=num_agents)
+        indptr = np.zeros(num_agents + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return indptr, contacts['b'][order], contacts['tick'][order]
+
+
+    def extract(self, agents) -> dict:
+        """
+        Get every retained contact made by the given agents (by global index),
+        as a list of arrays in COLUMNS order per agent, keyed by agent, e.g.
+        to move the agents to another log (see insert()). Each part of the
+        log is searched once for all of the agents.
+        """
+
+        agents = np.unique(np.asarray(list(agents), dtype=np.int32))
+        slices = {a: list() for a in agents.tolist()}
+        if len(agents):
+            for parts in self.chunks.values():
+                for part in parts:
+                    for a, start, stop in spans(part[1], agents):
+                        slices[a].append([col[start:stop] for col in part])
+
+        # One array per column, ticks and all, rather than a part per tick
+        return {a: [np.concatenate([p[i] for p in parts]) if parts
+                    else np.zeros(0, dtype=dtype)
+                    for i, dtype in enumerate(DTYPES)]
+                for a, parts in slices.items()}
+
+
+    def insert(self, columns:list) -> None:
+        """
+        Add contacts moved from another log, of any ticks, as a list of arrays
+        in COLUMNS order (see extract()). They are merged with the parts
+        already held for their ticks, so that ticks do not splinter into many
+        small parts as agents come and go.
+        """
+
+        if len(columns[0]) == 0:
+            return
+        order = np.argsort(columns[0], kind='stable')
+        columns = [col[order] for col in columns]
+        ticks, starts = np.unique(columns[0], return_index=True)
+        stops = list(starts[1:]) + [len(columns[0])]
+        for tick, start, stop in zip(ticks.tolist(), starts.tolist(), stops):
+            merged = self.chunks.pop(tick, list())
+            merged.append([col[start:stop] for col in columns])
+            self.add_part(tick, [np.concatenate([p[i] for p in merged])
+                                 for i in range(len(COLUMNS))])
+
+
+    def remove(self, agents) -> None:
+        """
+        Forget every contact made by the given agents (by global index).
+        """
+
+        agents = np.unique(np.asarray(list(agents), dtype=np.int32))
+        if not len(agents):
+            return
+        for parts in self.chunks.values():
+            for i, part in enumerate(parts):
+                found = spans(part[1], agents)
+                if found:
+                    keep = np.ones(len(part[1]), dtype=bool)
+                    for _, start, stop in found:
+                        keep[start:stop] = False
+                    parts[i] = [col[keep] for col in part]
+
+
+    def save(self, directory:str) -> None:
+        """
+        Save every retained contact to <directory>, as one .npy file per
+        column (contacts_tick.npy, contacts_a.npy, ...), ordered by tick.
+        """
+
+        if self.chunks:
+            contacts = self.window(min(self.chunks), max(self.chunks))
+        else:
+            contacts = self.window(0, -1)
+        for name in COLUMNS:
+            np.save(os.path.join(directory, f'contacts_{name}.npy'),
+                    contacts[name])
@@ -1,17 +1,26 @@
-import numpy as np
-
 class Direction:
     # Cardinal directions
-    N = np.array([0,-1])
-    E = np.array([1,0])
-    S = np.array([0,1])
-    W = np.array([-1,0])
+    N = (0,-1)
+    E = (1,0)
+    S = (0,1)
+    W = (-1,0)
     # Diagonal directions
-    NE = np.array([1,-1])
-    SE = np.array([1,1])
-    SW = np.array([-1,1])
-    NW = np.array([-1,-1])
+    NE = (1,-1)
+    SE = (1,1)
+    SW = (-1,1)
+    NW = (-1,-1)
+
+    NONE = (0,0)
+
+    direction_list = [N,E,S,W,NE,SE,SW,NW]
+
+    # Position of each direction in direction_list
+    indices = {d: i for i, d in enumerate(direction_list)}
 
-    NONE = np.array([0,0])
+    @staticmethod
+    def index_of(vector:tuple) -> int:
+        """
+        Get the position of a direction vector in direction_list.
+        """
 
-    direction_list = [N,E,S,W,NE,SE,SW,NW]
\ No newline at end of file
+        return Direction.indices[vector]
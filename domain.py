@@ -0,0 +1,1104 @@
+"""
+Spatial domain decomposition of an Environment across worker processes.
+
+The world is split into a grid of rectangular tiles, each owned by one worker
+process running a TileEnvironment over just its own tile. Every tick, each
+worker publishes the strips of cells lying within INFECTION_RADIUS of the
+edges its tile shares with other tiles into a shared memory block, and reads
+its neighbours' strips to build a halo around its tile. Agents near a boundary
+can therefore see (and register contact with) agents owned by a neighbouring
+tile, and agents that step across a boundary are migrated to the tile that
+owns their destination.
+
+A TiledEnvironment coordinates the workers from the main process, and exposes
+the same tick()/complete interface as an Environment so that window.py can
+drive it in headless mode. It sends each worker one message per tick, and gets
+one reply, with the worker's counts for the log; migrants are handed straight
+from tile to tile, through a pair of queues per tile. Within a tick, each
+worker:
+
+1. Reads its halo, and steps its agents, holding back moves into other tiles
+2. Hands those agents to the tiles that own their destinations
+3. Admits the agents handed to it, and tells each neighbour which it admitted
+4. Removes its own agents that were admitted elsewhere
+5. Publishes its boundary strips for the next tick, and replies
+
+Neighbours wait on each other's messages in steps 3 and 4, so no worker
+publishes its strips before all of its neighbours have read them.
+
+For a given RNG seed and tile layout, runs are reproducible: each worker
+seeds its own random stream from (seed, tile), processes its agents in a fixed
+order, and all cross-tile exchanges are applied in sorted order.
+"""
+import bisect
+import io
+import multiprocessing
+from multiprocessing import connection, shared_memory
+import numpy as np
+import pickle
+import random
+import traceback
+import uuid
+
+from environment import Environment, MINUTES_PER_DAY
+from logger import Logger, LogEntry
+from plotter import Plotter
+from simulation_parameters import SimConfig, SimulationMode
+from streams import KeyedStreams
+from sir import SIR_status as sir
+
+
+class TileLayout:
+    """
+    Splits a width x height world into tiles_x by tiles_y rectangular tiles.
+    Tiles are numbered row by row, starting from the top-left corner.
+    """
+
+    def __init__(self, width:int, height:int, tiles_x:int, tiles_y:int,
+                    halo:int):
+        """
+        width:      Width of the world, in cells
+        height:     Height of the world, in cells
+        tiles_x:    Number of tiles across
+        tiles_y:    Number of tiles down
+        halo:       Width of the strip shared with neighbouring tiles
+        """
+
+        self.width = width
+        self.height = height
+        self.tiles_x = tiles_x
+        self.tiles_y = tiles_y
+        self.halo = halo
+
+        # Tile edges along each axis; tile (i, j) covers
+        # [x_edges[i], x_edges[i+1]) x [y_edges[j], y_edges[j+1])
+        self.x_edges = [width * i // tiles_x for i in range(tiles_x + 1)]
+        self.y_edges = [height * j // tiles_y for j in range(tiles_y + 1)]
+
+        narrowest = min(min(np.diff(self.x_edges)), min(np.diff(self.y_edges)))
+        if narrowest < max(halo, 1):
+            raise ValueError(f'Tiles must be at least {max(halo, 1)} cells '
+                             f'wide, but a {tiles_x}x{tiles_y} layout of a '
+                             f'{width}x{height} world gives {narrowest}')
+
+    @property
+    def num_tiles(self) -> int:
+        return self.tiles_x * self.tiles_y
+
+
+    def bounds(self, tile:int) -> tuple:
+        """
+        Get the area covered by a tile, as (x0, y0, x1, y1) with the upper
+        bounds exclusive.
+        """
+
+        i = tile % self.tiles_x
+        j = tile // self.tiles_x
+        return (self.x_edges[i], self.y_edges[j],
+                self.x_edges[i+1], self.y_edges[j+1])
+
+
+    def tile_of(self, x:int, y:int) -> int:
+        """
+        Get the tile that owns the cell at (x, y).
+        """
+
+        i = bisect.bisect_right(self.x_edges, x) - 1
+        j = bisect.bisect_right(self.y_edges, y) - 1
+        return j * self.tiles_x + i
+
+
+    def edges(self, tile:int) -> list:
+        """
+        Get the edges of a tile ('top', 'bottom', 'left', 'right') that it
+        shares with another tile, rather than with the edge of the world.
+        """
+
+        i = tile % self.tiles_x
+        j = tile // self.tiles_x
+        edges = list()
+        if j > 0:
+            edges.append('top')
+        if j < self.tiles_y - 1:
+            edges.append('bottom')
+        if i > 0:
+            edges.append('left')
+        if i < self.tiles_x - 1:
+            edges.append('right')
+        return edges
+
+
+    def neighbours(self, tile:int) -> list:
+        """
+        Get the (up to eight) tiles bordering a tile, as (tile, dx, dy) where
+        dx and dy give the neighbour's position relative to the tile.
+        """
+
+        i = tile % self.tiles_x
+        j = tile // self.tiles_x
+        neighbours = list()
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                if 0 <= i + dx < self.tiles_x and 0 <= j + dy < self.tiles_y:
+                    neighbours.append(((j + dy) * self.tiles_x + i + dx, dx, dy))
+        return neighbours
+
+
+class HaloBuffer:
+    """
+    The boundary strips of one tile, held in a shared memory block so that
+    neighbouring workers can read them. Only edges shared with another tile
+    have a strip; nothing crosses the edge of the world.
+
+    Each strip stores, for every cell within <halo> cells of that edge of the
+    tile, the global index (plus one, so that 0 means empty) of the agent in
+    that cell, and that agent's SIR status value.
+    """
+
+    def __init__(self, bounds:tuple, halo:int, edges:list, name:str=None):
+        """
+        bounds: Area covered by the tile, as (x0, y0, x1, y1)
+        halo:   Width of each strip, in cells
+        edges:  Edges of the tile to keep strips for (see TileLayout.edges())
+        name:   Name of an existing block to attach to; if None, a new block
+                is created
+        """
+
+        x0, y0, x1, y1 = bounds
+        # Strips overlap at the corners, which keeps every region a neighbour
+        # might need inside a single strip.
+        rects = {
+            'top':      (x0, y0, x1, y0 + halo),
+            'bottom':   (x0, y1 - halo, x1, y1),
+            'left':     (x0, y0, x0 + halo, y1),
+            'right':    (x1 - halo, y0, x1, y1),
+        }
+        self.rects = {key: rects[key] for key in edges}
+        shapes = {key: (r[3] - r[1], r[2] - r[0]) for key, r in self.rects.items()}
+        cells = sum(h * w for h, w in shapes.values())
+        id_bytes = np.dtype(np.int32).itemsize
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=max(1, cells * (id_bytes + 1)))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.ids = dict()
+        self.status = dict()
+        offset = 0
+        for key, shape in shapes.items():
+            self.ids[key] = np.ndarray(shape, dtype=np.int32,
+                                       buffer=self.shm.buf, offset=offset)
+            offset += shape[0] * shape[1] * id_bytes
+        for key, shape in shapes.items():
+            self.status[key] = np.ndarray(shape, dtype=np.int8,
+                                          buffer=self.shm.buf, offset=offset)
+            offset += shape[0] * shape[1]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+
+    @staticmethod
+    def strip_facing(dx:int, dy:int) -> str:
+        """
+        Get the strip of a neighbouring tile that faces a tile, given the
+        neighbour's position (dx, dy) relative to that tile.
+        """
+
+        if dy == -1:
+            return 'bottom'
+        elif dy == 1:
+            return 'top'
+        elif dx == -1:
+            return 'right'
+        else:
+            return 'left'
+
+
+    def read(self, key:str, rect:tuple) -> tuple:
+        """
+        Get the agent ids and statuses stored for an area inside a strip.
+
+        key:    The strip to read from
+        rect:   The area to read, as (x0, y0, x1, y1) in world coordinates
+        """
+
+        sx0, sy0, _, _ = self.rects[key]
+        x0, y0, x1, y1 = rect
+        rows = slice(y0 - sy0, y1 - sy0)
+        cols = slice(x0 - sx0, x1 - sx0)
+        return self.ids[key][rows, cols], self.status[key][rows, cols]
+
+
+    def close(self, unlink:bool=False) -> None:
+        # The array views must be released before the block can be closed
+        self.ids = None
+        self.status = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class GhostInfection:
+    """
+    Infection status of a GhostAgent.
+    """
+
+    def __init__(self, status:sir):
+        self.status = status
+
+
+class GhostAgent:
+    """
+    Read-only stand-in for an agent owned by a neighbouring tile, built from
+    that tile's published halo strips. Only supports what a worker needs to
+    register contact with, and be infected by, the agent.
+    """
+
+    def __init__(self, gid:int, x:int, y:int, status:sir):
+        self.gid = gid
+        self.x = x
+        self.y = y
+        self.agent_id = tile_agent_id(gid)
+        self.infection = GhostInfection(status)
+
+    def is_susceptible(self) -> bool:
+        # Ghosts are never infected from this side of the boundary; their own
+        # tile rolls against this tile's contagious agents instead.
+        return False
+
+    def is_contagious(self) -> bool:
+        return self.infection.status in (sir.INCUBATING_CONTAGIOUS,
+                                        sir.SYMPTOMATIC_MILD,
+                                        sir.SYMPTOMATIC_SEVERE)
+
+    def is_symptomatic(self) -> bool:
+        return self.infection.status in (sir.SYMPTOMATIC_MILD,
+                                        sir.SYMPTOMATIC_SEVERE)
+
+
+class RemoteAgent:
+    """
+    Stand-in for an agent owned by another tile, returned when a worker looks
+    up an agent it does not own. Reactions are posted to the coordinator,
+    which delivers them to the owning tile at the start of the next tick.
+    """
+
+    def __init__(self, env, gid:int):
+        self.env = env
+        self.gid = gid
+
+    def notification_reaction(self):
+        self.env.outbox.append((self.gid, 'trace', None))
+
+    def geonotification_reaction(self, points:list):
+        self.env.outbox.append((self.gid, 'geo', points))
+
+
+def tile_agent_id(gid:int) -> uuid.UUID:
+    """
+    Agent IDs in a tiled run are derived from each agent's global index, so
+    that they are reproducible and can be recovered from the halo strips.
+    """
+
+    return uuid.UUID(int=gid + 1)
+
+
+class AgentPickler(pickle.Pickler):
+    """
+    Pickler for migrating agents; references to the owning environment and
+    its config are replaced by placeholders, to be re-linked on arrival.
+    """
+
+    def __init__(self, file, env):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.env = env
+
+    def persistent_id(self, obj):
+        if obj is self.env:
+            return 'env'
+        elif obj is self.env.cfg:
+            return 'cfg'
+        return None
+
+
+class AgentUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, env):
+        super().__init__(file)
+        self.env = env
+
+    def persistent_load(self, pid):
+        if pid == 'env':
+            return self.env
+        elif pid == 'cfg':
+            return self.env.cfg
+        raise pickle.UnpicklingError(f'Unknown persistent id {pid}')
+
+
+class TileEnvironment(Environment):
+    """
+    Environment covering one tile of a TileLayout, run inside a worker
+    process. Occupancy of the tile, plus a halo of <halo> cells around it, is
+    held in an array of global agent indices (plus one; 0 means empty).
+    """
+
+    def __init__(self, layout:TileLayout, tile:int, config:SimConfig,
+                    halos:dict, queues:list=None):
+        """
+        layout: Layout of the whole world
+        tile:   The tile this environment owns
+        config: Simulation parameters
+        halos:  HaloBuffers of this tile and its neighbours, keyed by tile
+        queues: Inboxes of every tile, as (migrants, admitted) pairs of
+                multiprocessing queues, indexed by tile (see migrate())
+        """
+
+        self.layout = layout
+        self.tile = tile
+        self.x0, self.y0, self.x1, self.y1 = layout.bounds(tile)
+        self.halo = layout.halo
+        self.halos = halos
+        # Inboxes of every tile, as (migrants, admitted) queue pairs
+        self.queues = queues
+
+        super().__init__(layout.width, layout.height, config, None)
+
+        # Agents owned by this tile, keyed by global index
+        self.members = dict()
+        # Behaviour table row of each member, by global index
+        self.rows = np.zeros(config.NUM_AGENTS, dtype=np.int64)
+        # Agents owned by neighbouring tiles and visible in the halo this tick
+        self.ghosts = dict()
+        # Reactions destined for agents owned by other tiles
+        self.outbox = list()
+        # Moves into neighbouring tiles, awaiting approval by their owners
+        self.proposals = list()
+
+
+    def create_logger(self) -> None:
+        # The coordinator logs the combined counts of all tiles
+        return None
+
+
+    def build_grid(self) -> None:
+        r = self.halo
+        self.grid = np.zeros((self.y1 - self.y0 + 2*r, self.x1 - self.x0 + 2*r),
+                             dtype=np.int32)
+
+
+    def local(self, x:int, y:int) -> tuple:
+        """
+        Convert world coordinates to (row, column) indices into the grid.
+        """
+
+        return y - self.y0 + self.halo, x - self.x0 + self.halo
+
+
+    def owns(self, x:int, y:int) -> bool:
+        return self.x0 <= x < self.x1 and self.y0 <= y < self.y1
+
+
+    def near_edge(self, x:int, y:int) -> bool:
+        """
+        Check whether a cell of this tile is within the halo of its edges,
+        where agents owned by other tiles may be in reach.
+        """
+
+        r = self.halo
+        return (x < self.x0 + r or x >= self.x1 - r
+                or y < self.y0 + r or y >= self.y1 - r)
+
+
+    def add_object(self, obj, x:int, y:int) -> None:
+        j, i = self.local(x, y)
+        if self.grid[j, i]:
+            raise RuntimeError('Cell is already occupied')
+        self.grid[j, i] = obj.gid + 1
+        obj.x = x
+        obj.y = y
+
+
+    def move_object(self, obj, new_x:int, new_y:int) -> None:
+        """
+        Overrides Environment.move_object(). Moves into a neighbouring tile are
+        held back as proposals, which the owner of the destination accepts or
+        rejects once all of its own agents have moved.
+        """
+
+        if not self.owns(new_x, new_y):
+            self.proposals.append((obj, new_x, new_y))
+            return
+
+        # Every agent moves every tick, so this is done inline rather than
+        # through local() and add_object(); choose_move() has already checked
+        # that the destination is free
+        x, y = obj.x, obj.y
+        r = self.halo
+        grid = self.grid
+        grid[y - self.y0 + r, x - self.x0 + r] = 0
+        grid[new_y - self.y0 + r, new_x - self.x0 + r] = obj.gid + 1
+        obj.old_x, obj.old_y = x, y
+        obj.x, obj.y = new_x, new_y
+
+
+    def validate_move(self, x:int, y:int) -> bool:
+        if (x >= self.canvas_size_x or y >= self.canvas_size_y
+            or x < 0 or y < 0): # out of bounds
+            return False
+        r = self.halo
+        return not self.grid.item(y - self.y0 + r, x - self.x0 + r)
+
+
+    def localized_search(self, agent, radius:int) -> list:
+        """
+        Overrides Environment.localized_search(), returning GhostAgents for any
+        nearby agents that belong to a neighbouring tile.
+        """
+
+        x, y = agent.x, agent.y
+        # Get bounds of the search area, accounting for edges of the map
+        min_x = max(0, x - radius)
+        max_x = min(x + radius, self.canvas_size_x-1)
+        min_y = max(0, y - radius)
+        max_y = min(y + radius, self.canvas_size_y-1)
+
+        j0, i0 = self.local(min_x, min_y)
+        j1, i1 = self.local(max_x, max_y)
+        # Transposed, to visit cells column by column like the base class
+        window = self.grid[j0:j1, i0:i1].T
+
+        local_agents = list()
+        for code in window[window.nonzero()].tolist():
+            gid = code - 1
+            # Ensure the agent does not count itself
+            if gid == agent.gid:
+                continue
+            if gid in self.members:
+                local_agents.append(self.members[gid])
+            else:
+                local_agents.append(self.ghosts[gid])
+
+        return local_agents
+
+
+    def get_agent_by_uuid(self, id):
+        return self.id_lookup[id]
+
+
+    def get_agent_by_gid(self, gid:int):
+        if gid in self.members:
+            return self.members[gid]
+        return RemoteAgent(self, gid)
+
+
+    def spawn(self, specs:list) -> None:
+        """
+        Create this tile's share of the initial population.
+
+        specs:  List of AgentSpecs for agents whose home point is on this tile
+        """
+
+        for spec in specs:
+            x, y = spec.home_point
+            agent = self.create_agent(x, y, spec.home_point, spec.work_point)
+            agent.gid = spec.gid
+            if hasattr(agent, 'agent_id'):
+                agent.agent_id = tile_agent_id(spec.gid)
+            self.add_object(agent, x, y)
+            self.enlist(agent)
+            if spec.infected:
+                self.infect_agent(agent)
+
+
+    def enlist(self, agent, self_isolating:int=0, cautious:int=0,
+                behavior:tuple=None) -> None:
+        """
+        Register an agent placed on this tile in the environment's lists.
+
+        self_isolating: Number of entries the agent has in curr_self_isolating
+        cautious:       Number of entries the agent has in curr_cautious_isolating
+        behavior:       The agent's behaviour state and timers on its previous
+                        tile, from BehaviorTable.row_state()
+        """
+
+        self.members[agent.gid] = agent
+        self.agents.append(agent)
+        agent.index = self.behaviors.add(agent)
+        self.rows[agent.gid] = agent.index
+        if behavior is not None:
+            self.behaviors.restore(agent.index, behavior)
+
+        if agent.infection.status == sir.SUSCEPTIBLE:
+            self.susceptible_agents.append(agent)
+        elif agent.infection.status == sir.RECOVERED:
+            self.recovered_agents.append(agent)
+        else:
+            self.infected_agents.append(agent)
+            if agent.is_contagious():
+                self.contagious_agents[agent] = None
+
+        self.curr_self_isolating.extend([agent] * self_isolating)
+        self.curr_cautious_isolating.extend([agent] * cautious)
+
+        if self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING,
+                            SimulationMode.PREEMPTIVE_ISOLATION):
+            self.id_lookup[agent.agent_id] = agent
+
+
+    def depart(self, gids:list) -> None:
+        """
+        Remove agents that have been accepted into neighbouring tiles.
+        """
+
+        if not gids:
+            return
+        leaving = [self.members.pop(gid) for gid in gids]
+        for agent in leaving:
+            j, i = self.local(agent.x, agent.y)
+            self.grid[j, i] = 0
+            self.behaviors.remove(agent.index)
+            self.contagious_agents.pop(agent, None)
+            self.id_lookup.pop(getattr(agent, 'agent_id', None), None)
+        # The agents' contacts went with them
+        self.contact_log.remove(gids)
+
+        # Filtered in one pass each, keeping the order of the agents that stay
+        gone = set(leaving)
+        self.agents = [a for a in self.agents if a not in gone]
+        self.susceptible_agents = [a for a in self.susceptible_agents if a not in gone]
+        self.infected_agents = [a for a in self.infected_agents if a not in gone]
+        self.recovered_agents = [a for a in self.recovered_agents if a not in gone]
+        self.curr_self_isolating = [a for a in self.curr_self_isolating
+                                    if a not in gone]
+        self.curr_cautious_isolating = [a for a in self.curr_cautious_isolating
+                                        if a not in gone]
+
+
+    def publish(self) -> None:
+        """
+        Write the boundary strips of this tile to its HaloBuffer.
+        """
+
+        buf = self.halos[self.tile]
+        for key, (x0, y0, x1, y1) in buf.rects.items():
+            j, i = self.local(x0, y0)
+            ids = self.grid[j:j + y1 - y0, i:i + x1 - x0]
+            buf.ids[key][:] = ids
+            status = buf.status[key]
+            status[:] = 0
+            # Statuses are mirrored in the behaviour table (see mirror_status())
+            occupied = ids != 0
+            status[occupied] = self.behaviors.status[self.rows[ids[occupied] - 1]]
+
+
+    def read_halo(self) -> None:
+        """
+        Fill the halo around this tile from the neighbours' boundary strips.
+        """
+
+        r = self.halo
+        self.grid[:r, :] = 0
+        self.grid[-r:, :] = 0
+        self.grid[:, :r] = 0
+        self.grid[:, -r:] = 0
+        self.ghosts = dict()
+
+        for n, dx, dy in self.layout.neighbours(self.tile):
+            nx0, ny0, nx1, ny1 = self.layout.bounds(n)
+            # Part of the neighbour that falls inside this tile's halo
+            rect = (max(nx0, self.x0 - r), max(ny0, self.y0 - r),
+                    min(nx1, self.x1 + r), min(ny1, self.y1 + r))
+            ids, status = self.halos[n].read(HaloBuffer.strip_facing(dx, dy), rect)
+            j, i = self.local(rect[0], rect[1])
+            self.grid[j:j + ids.shape[0], i:i + ids.shape[1]] = ids
+            rows, cols = ids.nonzero()
+            for code, x, y, value in zip(ids[rows, cols].tolist(),
+                                         (rect[0] + cols).tolist(),
+                                         (rect[1] + rows).tolist(),
+                                         status[rows, cols].tolist()):
+                self.ghosts[code - 1] = GhostAgent(code - 1, x, y, sir(value))
+
+
+    def deliver(self, notices:list) -> None:
+        """
+        Apply reactions posted by other tiles to agents owned by this tile.
+        """
+
+        for gid, kind, points in notices:
+            if gid not in self.members:
+                continue
+            if kind == 'trace':
+                self.notify(gid)
+            else:
+                for point in points:
+                    self.notify(gid, point)
+        self.deliver_notifications()
+
+
+    def step(self, current_time:int, toggle:bool, notices:list) -> tuple:
+        """
+        Advance this tile by one tick; the equivalent of the agent loop in
+        Environment.tick().
+
+        current_time:   The simulation clock, as advanced by the coordinator
+        toggle:         Whether agents should switch focus this tick
+        notices:        Reactions posted by other tiles last tick
+
+        returns: (proposals, outbox), where proposals lists moves into other
+                 tiles as (gid, x, y, payload) and outbox lists reactions for
+                 agents owned by other tiles.
+        """
+
+        self.current_time = current_time
+        if toggle:
+            self.daytime = not self.daytime
+            for agent in self.agents:
+                agent.toggle_focus()
+
+        if self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING,
+                                      SimulationMode.PREEMPTIVE_ISOLATION):
+            self.behaviors.age_mild_contacts(current_time)
+        self.deliver(notices)
+        self.read_halo()
+        self.proposals = list()
+
+        tracing = self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING,
+                                             SimulationMode.PREEMPTIVE_ISOLATION)
+        contagious = self.contagious_agents
+        for agent in self.agents:
+            # Outside modes C and D, only contagious agents, and agents near
+            # the edges that may roll against ghosts, need their neighbours.
+            # Anyone else would make no draws, so skipping them changes
+            # nothing.
+            if not (tracing or agent in contagious
+                    or (self.near_edge(agent.x, agent.y) and not agent.is_infected())):
+                agent.tick()
+                continue
+
+            # Find all nearby agents and register contact
+            nearby_agents = self.localized_search(agent, self.cfg.INFECTION_RADIUS)
+            if tracing:
+                for n in nearby_agents:
+                    agent.register_contact(self.current_time, n)
+
+            if agent.is_infected():
+                # If the agent is contagious, roll to infect nearby agents.
+                if agent.is_contagious():
+                    for n in nearby_agents:
+                        roll = self.stream('infect', n, agent).random() # value between 0 and 1
+                        if roll <= self.cfg.INFECTION_PROBABILITY and n.is_susceptible():
+                            self.infect_agent(n)
+            else:
+                # Agents on the far side of a boundary cannot be infected from
+                # here, so instead roll to be infected by each of them.
+                for n in nearby_agents:
+                    if n.gid in self.ghosts and n.is_contagious():
+                        roll = self.stream('infect', agent, n).random()
+                        if roll <= self.cfg.INFECTION_PROBABILITY and agent.is_susceptible():
+                            self.infect_agent(agent)
+
+            # Update the agent's state
+            agent.tick()
+
+        if tracing:
+            self.log_contacts()
+        self.update_behavior()
+        self.deliver_notifications()
+
+        for agent in self.agents:
+            # Execute the move
+            new_x, new_y = self.choose_move(agent)
+            self.move_object(agent, new_x, new_y)
+
+        # Agents are packed only once the whole tile has been updated, so that
+        # anything that happened to them later in the tick goes with them.
+        contacts = self.contact_log.extract(agent.gid for agent, _, _ in self.proposals)
+        proposals = [(agent.gid, x, y, self.pack(agent, contacts[agent.gid]))
+                     for agent, x, y in self.proposals]
+        outbox = self.outbox
+        self.outbox = list()
+        return proposals, outbox
+
+
+    def admit(self, migrants:list) -> list:
+        """
+        Accept or reject agents proposing to move onto this tile, in order of
+        global index. A migrant is rejected if its destination is occupied.
+
+        returns: Global indices of the accepted agents
+        """
+
+        accepted = list()
+        contacts = list()
+        for gid, x, y, payload in sorted(migrants, key=lambda m: m[0]):
+            if not self.validate_move(x, y):
+                continue
+            agent, self_isolating, cautious, behavior, columns = self.unpack(payload)
+            old_x, old_y = agent.x, agent.y
+            self.add_object(agent, x, y)
+            agent.old_x, agent.old_y = old_x, old_y
+            self.enlist(agent, self_isolating, cautious, behavior)
+            contacts.append(columns)
+            accepted.append(gid)
+        if contacts:
+            self.contact_log.insert([np.concatenate(col) for col in zip(*contacts)])
+        return accepted
+
+
+    def migrate(self, proposals:list) -> None:
+        """
+        Hand the agents proposing to leave this tile to the neighbours that
+        own their destinations, admit the agents the neighbours hand over in
+        turn, and remove this tile's agents that were admitted elsewhere.
+
+        Every neighbour is sent exactly one message (possibly empty) in each
+        direction, on the migrants queue and then on the admitted queue of its
+        inbox, so each worker knows how many messages to wait for.
+
+        proposals:  Moves into other tiles, as returned by step()
+        """
+
+        neighbours = [n for n, _, _ in self.layout.neighbours(self.tile)]
+        outgoing = {n: list() for n in neighbours}
+        for proposal in proposals:
+            _, x, y, _ = proposal
+            outgoing[self.layout.tile_of(x, y)].append(proposal)
+        for n, migrants in outgoing.items():
+            self.queues[n][0].put((self.tile, migrants))
+
+        # Origin of every migrant, to tell it which of its agents were admitted
+        origins = dict()
+        incoming = list()
+        for _ in neighbours:
+            origin, migrants = self.queues[self.tile][0].get()
+            for gid, _, _, _ in migrants:
+                origins[gid] = origin
+            incoming.extend(migrants)
+
+        admitted = {n: list() for n in neighbours}
+        for gid in self.admit(incoming):
+            admitted[origins[gid]].append(gid)
+        for n, gids in admitted.items():
+            self.queues[n][1].put(gids)
+
+        departed = list()
+        for _ in neighbours:
+            departed.extend(self.queues[self.tile][1].get())
+        self.depart(departed)
+
+
+    def pack(self, agent, contacts:list) -> bytes:
+        """
+        Pickle an agent to move it to another tile, along with its contacts,
+        as extracted from the contact log (see ContactLog.extract()).
+        """
+
+        f = io.BytesIO()
+        AgentPickler(f, self).dump((
+            agent,
+            sum(a is agent for a in self.curr_self_isolating),
+            sum(a is agent for a in self.curr_cautious_isolating),
+            self.behaviors.row_state(agent.index),
+            contacts))
+        return f.getvalue()
+
+
+    def unpack(self, payload:bytes) -> tuple:
+        return AgentUnpickler(io.BytesIO(payload), self).load()
+
+
+    def counts(self) -> tuple:
+        """
+        Get this tile's contribution to the log, in LogEntry order (minus the
+        time and infection rate).
+        """
+
+        return (len(self.susceptible_agents),
+                len(self.infected_agents),
+                len(self.recovered_agents),
+                self.num_notified_through_tracing,
+                len(self.curr_self_isolating),
+                self.num_self_isolated,
+                len(self.curr_cautious_isolating),
+                self.num_cautious_isolated,
+                self.num_geonotified,
+                self.unnecessary_isolations)
+
+
+def run_tile_worker(layout:TileLayout, tile:int, config:SimConfig, conn,
+                    halo_names:list, queues:list, seed) -> None:
+    """
+    Entry point of a worker process; serves commands from the coordinator
+    until told to stop. If anything goes wrong, the worker replies with a
+    RuntimeError carrying its traceback, for the coordinator to raise, and
+    exits.
+    """
+
+    if seed is not None:
+        random.seed(f'{seed}:{tile}')
+
+    halos = dict()
+    try:
+        for n in [tile] + [n for n, _, _ in layout.neighbours(tile)]:
+            halos[n] = HaloBuffer(layout.bounds(n), layout.halo, layout.edges(n),
+                                  halo_names[n])
+        env = TileEnvironment(layout, tile, config, halos, queues)
+
+        while True:
+            command, payload = conn.recv()
+            if command == 'spawn':
+                env.spawn(payload)
+                env.publish()
+                conn.send((env.counts(), list()))
+            elif command == 'tick':
+                proposals, outbox = env.step(*payload)
+                env.migrate(proposals)
+                env.publish()
+                conn.send((env.counts(), outbox))
+            elif command == 'stop':
+                break
+    except BaseException:
+        conn.send(RuntimeError(f'Worker of tile {tile} failed:\n'
+                               f'{traceback.format_exc()}'))
+    finally:
+        for buf in halos.values():
+            buf.close()
+        conn.close()
+
+
+class AgentSpec:
+    """
+    Everything needed to create an agent on its home tile.
+    """
+
+    def __init__(self, gid:int, home_point:tuple, work_point:tuple):
+        self.gid = gid
+        self.home_point = home_point
+        self.work_point = work_point
+        self.infected = False
+
+
+class TiledEnvironment:
+    """
+    Coordinator for a world split into tiles, each simulated by a worker
+    process. Agents are added (and initially infected) as with an Environment;
+    the workers are started on the first tick.
+    """
+
+    def __init__(self, width:int, height:int, config:SimConfig,
+                    run_identifier:str, tiles_x:int, tiles_y:int):
+        # Flag for end of simulation
+        self.complete = False
+
+        self.canvas_size_x = width
+        self.canvas_size_y = height
+        self.cfg = config
+        self.iden = run_identifier
+
+        if config.INFECTION_STAGE != 'pairwise':
+            raise ValueError('Tiled environments only support the pairwise '
+                             'infection stage')
+        if config.SAVE_CONTACT_LOG:
+            raise ValueError('Tiled environments cannot save the contact log')
+        if config.HEATMAP_BIN_SIZE is not None:
+            raise ValueError('Tiled environments cannot accumulate heatmaps')
+        self.layout = TileLayout(width, height, tiles_x, tiles_y,
+                                 config.INFECTION_RADIUS)
+
+        # AgentSpecs, in order of global index
+        self.agents = list()
+
+        # Kept for parity with Environment; not used by the tiled mode
+        self.home_points = list()
+        self.work_points = list()
+
+        self.logger = Logger(self.iden)
+        self.logger.create_log_file()
+
+        self.current_time = 0
+        self.daytime = True
+
+        # Keyed random streams, for spawning agents with common random numbers
+        # (see streams.py). Each worker makes its own for the simulation.
+        if config.COMMON_RANDOM_NUMBERS:
+            if config.RNG_SEED is None:
+                raise ValueError('Common random numbers need an RNG_SEED')
+            self.streams = KeyedStreams(config.RNG_SEED)
+        else:
+            self.streams = None
+
+        self.workers = None
+        self.pipes = list()
+        self.halos = list()
+        # Each tile's counts for the log, as of the end of the last tick
+        self.counts = None
+        # Reactions to deliver to their recipients' tiles next tick
+        self.notices = list()
+
+
+    def add_agent(self, home_point:tuple, work_point:tuple) -> None:
+        self.agents.append(AgentSpec(len(self.agents), home_point, work_point))
+
+
+    def stream(self, kind:str, agent=None, other=None):
+        return Environment.stream(self, kind, agent, other)
+
+
+    def infect_agent(self, spec:AgentSpec) -> None:
+        # Applied when the agent is created on its tile
+        spec.infected = True
+
+
+    def start(self) -> None:
+        """
+        Allocate the shared halo strips, launch one worker per tile, and hand
+        each worker the agents whose home point lies on its tile. If any of
+        that fails, whatever was started is stopped and released again.
+        """
+
+        try:
+            self.launch()
+        except BaseException:
+            self.shutdown(force=True)
+            raise
+
+
+    def launch(self) -> None:
+        """
+        Do the work of start().
+        """
+
+        for tile in range(self.layout.num_tiles):
+            self.halos.append(HaloBuffer(self.layout.bounds(tile), self.layout.halo,
+                                         self.layout.edges(tile)))
+        names = [buf.name for buf in self.halos]
+        # Migrants, and the replies saying which were admitted, go straight
+        # from worker to worker
+        queues = [(multiprocessing.Queue(), multiprocessing.Queue())
+                  for _ in range(self.layout.num_tiles)]
+
+        self.workers = list()
+        for tile in range(self.layout.num_tiles):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=run_tile_worker,
+                args=(self.layout, tile, self.cfg, child_conn, names, queues,
+                      self.cfg.RNG_SEED),
+                daemon=True)
+            worker.start()
+            # Only the worker holds its end, so that its exit is noticed
+            child_conn.close()
+            self.workers.append(worker)
+            self.pipes.append(parent_conn)
+
+        specs = [list() for _ in range(self.layout.num_tiles)]
+        for spec in self.agents:
+            x, y = spec.home_point
+            specs[self.layout.tile_of(x, y)].append(spec)
+        self.counts = [counts for counts, _ in self.scatter('spawn', specs)]
+
+
+    def scatter(self, command:str, payloads:list) -> list:
+        """
+        Send each worker its own payload, and collect the replies in tile order.
+
+        raises: RuntimeError with the worker's traceback if a worker fails,
+                or if one exits without replying. Replies are collected as
+                they arrive, so that a failed worker is noticed even while
+                its neighbours wait on it.
+        """
+
+        for conn, payload in zip(self.pipes, payloads):
+            conn.send((command, payload))
+
+        replies = [None] * len(self.pipes)
+        pending = {conn: tile for tile, conn in enumerate(self.pipes)}
+        while pending:
+            for conn in connection.wait(list(pending)):
+                tile = pending.pop(conn)
+                try:
+                    reply = conn.recv()
+                except EOFError:
+                    raise RuntimeError(f'Worker of tile {tile} exited unexpectedly')
+                if isinstance(reply, BaseException):
+                    raise reply
+                replies[tile] = reply
+        return replies
+
+
+    def broadcast(self, command:str, payload) -> list:
+        return self.scatter(command, [payload] * len(self.pipes))
+
+
+    def tick(self) -> None:
+        """
+        Tick the simulation forward one step. See Environment.tick().
+        """
+
+        if self.workers is None:
+            self.start()
+
+        totals = [sum(c) for c in zip(*self.counts)]
+        infection_rate = round(totals[1] / self.cfg.NUM_AGENTS, 2)
+        self.logger.log_line(LogEntry(self.current_time, *totals[:3],
+                                      infection_rate, *totals[3:]))
+
+        # Advance clock by one minute
+        self.current_time += 1
+        if self.current_time > self.cfg.MAXIMUM_TIME:
+            self.end_simulation()
+            return
+
+        toggle = self.current_time % int(MINUTES_PER_DAY/2) == 0
+        if toggle:
+            self.daytime = not self.daytime
+
+        # One message to each worker, which steps its tile, trades migrants
+        # with its neighbours, and publishes its strips before replying
+        try:
+            results = self.broadcast('tick', (self.current_time, toggle,
+                                              self.notices))
+        except BaseException:
+            self.shutdown(force=True)
+            raise
+        self.counts = [counts for counts, _ in results]
+        self.notices = [notice for _, outbox in results for notice in outbox]
+
+
+    def shutdown(self, force:bool=False) -> None:
+        """
+        Stop the workers and release the shared halo strips.
+
+        force:  Terminate the workers rather than asking them to stop, as
+                after a failure, when some may be stuck waiting on a failed
+                neighbour
+        """
+
+        if self.workers is not None:
+            if not force:
+                for conn in self.pipes:
+                    conn.send(('stop', None))
+            for worker in self.workers:
+                if force and worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            self.workers = None
+        for conn in self.pipes:
+            conn.close()
+        self.pipes = list()
+        for buf in self.halos:
+            buf.close(unlink=True)
+        self.halos = list()
+
+
+    def end_simulation(self):
+        self.complete = True
+        self.shutdown()
+        path = self.logger.filename
+        p = Plotter(path, self.iden)
@@ -0,0 +1,539 @@
+"""
+Ensembles of replicate runs, simulated together.
+
+Replicates of one configuration differ only in their random seed, so rather
+than building a world of Agent objects for each, an Ensemble holds the state
+of every agent of every replicate in arrays with a leading replicate axis,
+shape (replicates, agents), and steps them all with the same array operations.
+Only modes A and B are supported, as the contact tracing of modes C and D
+works agent by agent.
+
+Each replicate has its own random generator, occupancy layer and log, so a
+replicate's run depends only on its own seed, not on how many other
+replicates it is simulated alongside. Runs follow the same rules as an
+Environment's, with one difference: agents move simultaneously rather than
+one after another. An agent may only move into a space that was free at the
+start of the tick, and if several agents pick the same space, one of them
+(chosen at random) gets it and the others stay put. Ensembles are therefore
+statistically equivalent to, but not reproductions of, Environment runs with
+the same configuration.
+"""
+import numpy as np
+
+from behavior import BehaviorState
+from direction import Direction
+from environment import MINUTES_PER_DAY
+from logger import Logger, LogEntry
+from plotter import Plotter
+from simulation_parameters import SimConfig, SimulationMode
+from sir import SIR_status as sir
+
+# Per-tick counts kept for each replicate, in order
+LOG_COLUMNS = ('susceptible', 'infected', 'recovered', 'curr_isolated',
+               'total_isolated')
+
+# Largest number of spaces, over all replicates, for which the 'auto'
+# occupancy backend keeps a dense layer of flags (one byte per space)
+DENSE_LAYER_LIMIT = 1 << 28
+
+# Direction.direction_list as arrays of x and y components
+DIRECTION_X = np.array([d[0] for d in Direction.direction_list], dtype=np.int32)
+DIRECTION_Y = np.array([d[1] for d in Direction.direction_list], dtype=np.int32)
+
+
+class Ensemble:
+    """
+    A set of replicate runs of one configuration. The state of agent i of
+    replicate r is kept at position r * agents + i of flat arrays; the
+    (replicates, agents) views of these are available through view().
+    """
+
+    def __init__(self, config:SimConfig, run_identifier:str, replicates:int,
+                    seeds:list=None):
+        """
+        config:         Simulation parameters shared by every replicate. The
+                        world size is taken from WORLD_WIDTH and WORLD_HEIGHT.
+        run_identifier: Identifies the run; replicate r logs to
+                        <run_identifier>_rep<r>
+        replicates:     Number of replicates to simulate
+        seeds:          Seed of each replicate's random generator. By default
+                        the seeds are derived from config.RNG_SEED.
+        """
+
+        if config.RESPONSE_MODE not in (SimulationMode.NO_REACTION,
+                                        SimulationMode.SELF_ISOLATION):
+            raise ValueError('Ensembles only support modes A and B')
+        if config.INFECTION_STAGE not in ('pairwise', 'field'):
+            raise ValueError(f'Unknown infection stage: {config.INFECTION_STAGE}')
+        if not config.NUM_AGENTS * 2 < config.WORLD_WIDTH * config.WORLD_HEIGHT:
+            raise ValueError('Not enough world space to spawn provided number of agents')
+
+        self.cfg = config
+        self.iden = run_identifier
+        self.complete = False
+        self.current_time = 0
+        self.daytime = True
+
+        self.width = config.WORLD_WIDTH
+        self.height = config.WORLD_HEIGHT
+        self.replicates = replicates
+        self.num_agents = config.NUM_AGENTS
+
+        if seeds is None:
+            seeds = np.random.SeedSequence(config.RNG_SEED).spawn(replicates)
+        elif len(seeds) != replicates:
+            raise ValueError(f'Expected {replicates} seeds, got {len(seeds)}')
+        self.rngs = [np.random.default_rng(seed) for seed in seeds]
+
+        # Agent state
+        size = replicates * self.num_agents
+        self.replicate_of = np.repeat(np.arange(replicates, dtype=np.int64),
+                                      self.num_agents)
+        self.x = np.zeros(size, dtype=np.int32)
+        self.y = np.zeros(size, dtype=np.int32)
+        self.home_x = np.zeros(size, dtype=np.int32)
+        self.home_y = np.zeros(size, dtype=np.int32)
+        self.work_x = np.zeros(size, dtype=np.int32)
+        self.work_y = np.zeros(size, dtype=np.int32)
+        # Whether each agent is headed home rather than to work
+        self.focus_home = np.zeros(size, dtype=bool)
+        self.status = np.full(size, sir.SUSCEPTIBLE.value, dtype=np.int8)
+        self.infection_ticks = np.zeros(size, dtype=np.int32)
+        self.tick_threshold = np.zeros(size, dtype=np.int32)
+        self.behavior = np.full(size, BehaviorState.IDLE.value, dtype=np.int8)
+        self.testing_timer = np.zeros(size, dtype=np.int32)
+        self.num_self_isolated = np.zeros(replicates, dtype=np.int64)
+
+        # Occupancy layers of all the replicates, indexed by key (see keys()):
+        # either dense flags, or the sorted keys of the occupied spaces when
+        # the flags would take too much memory
+        backend = config.OCCUPANCY_BACKEND
+        if backend == 'auto':
+            if replicates * self.width * self.height <= DENSE_LAYER_LIMIT:
+                backend = 'dense'
+            else:
+                backend = 'sparse'
+        if backend == 'dense':
+            self.occupied = np.zeros(replicates * self.width * self.height, dtype=bool)
+        else:
+            self.occupied = None
+        self.occupied_keys = None
+
+        # Counts logged at every tick, for each replicate
+        self.log = np.zeros((replicates, config.MAXIMUM_TIME + 1, len(LOG_COLUMNS)),
+                            dtype=np.int64)
+        self.loggers = [self.create_logger(f'{run_identifier}_rep{r}')
+                        for r in range(replicates)]
+
+        self.spawn_agents()
+
+
+    def create_logger(self, ident:str) -> Logger:
+        """
+        Create the Logger that one replicate writes its counts to.
+        """
+
+        logger = Logger(ident)
+        logger.create_log_file()
+        return logger
+
+
+    def view(self, array:np.ndarray) -> np.ndarray:
+        """
+        Get a (replicates, agents) view of one of the flat agent arrays.
+        """
+
+        return array.reshape(self.replicates, self.num_agents)
+
+
+    def spawn_agents(self) -> None:
+        """
+        Give the agents of each replicate distinct home and work points, place
+        them at home, and infect the first INITIAL_INFECTED_PERCENT of them.
+        """
+
+        n = self.num_agents
+        for r, rng in enumerate(self.rngs):
+            points = rng.choice(self.width * self.height, size=2 * n, replace=False)
+            agents = slice(r * n, (r + 1) * n)
+            self.home_x[agents], self.home_y[agents] = points[:n] % self.width, points[:n] // self.width
+            self.work_x[agents], self.work_y[agents] = points[n:] % self.width, points[n:] // self.width
+        self.x[:] = self.home_x
+        self.y[:] = self.home_y
+        keys = self.keys(self.replicate_of, self.x, self.y)
+        if self.occupied is not None:
+            self.occupied[keys] = True
+        else:
+            self.occupied_keys = np.sort(keys)
+
+        initial = int(np.ceil(n * self.cfg.INITIAL_INFECTED_PERCENT))
+        self.infect(self.view(np.arange(len(self.x)))[:, :initial].ravel())
+
+
+    def keys(self, replicate:np.ndarray, x:np.ndarray, y:np.ndarray) -> np.ndarray:
+        """
+        Pack replicates and coordinates into keys unique across the ensemble.
+        """
+
+        return (replicate * self.height + y) * self.width + x
+
+
+    def is_free(self, replicate:np.ndarray, x:np.ndarray, y:np.ndarray) -> np.ndarray:
+        """
+        Check which of the given spaces are within the world and unoccupied;
+        the array equivalent of Environment.validate_move().
+        """
+
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        keys = self.keys(replicate, np.clip(x, 0, self.width - 1),
+                         np.clip(y, 0, self.height - 1))
+        if self.occupied is not None:
+            taken = self.occupied[keys]
+        else:
+            found = np.searchsorted(self.occupied_keys, keys)
+            found = np.minimum(found, len(self.occupied_keys) - 1)
+            taken = self.occupied_keys[found] == keys
+        return inside & ~taken
+
+
+    def tick(self) -> None:
+        """
+        Tick every replicate forward one step; see Environment.tick().
+        """
+
+        self.log_counts()
+
+        # Advance clock by one minute
+        self.current_time += 1
+        if self.current_time > self.cfg.MAXIMUM_TIME:
+            self.end_simulation()
+            return
+
+        # Upon day/night transition, have agents shift from work to home or
+        # vice versa, unless they are isolating at home
+        if self.current_time % int(MINUTES_PER_DAY/2) == 0:
+            self.daytime = not self.daytime
+            toggling = self.behavior != BehaviorState.SELF_ISOLATING.value
+            self.focus_home[toggling] = ~self.focus_home[toggling]
+
+        self.spread_infection()
+        self.progress_infections()
+        if self.cfg.RESPONSE_MODE == SimulationMode.SELF_ISOLATION:
+            self.update_behavior()
+        self.move_agents()
+
+
+    def log_counts(self) -> None:
+        status = self.view(self.status)
+        infected = ((status == sir.INCUBATING_SAFE.value)
+                    | (status == sir.INCUBATING_CONTAGIOUS.value)
+                    | (status == sir.SYMPTOMATIC_MILD.value)
+                    | (status == sir.SYMPTOMATIC_SEVERE.value))
+        isolating = self.view(self.behavior) == BehaviorState.SELF_ISOLATING.value
+        row = self.log[:, self.current_time]
+        row[:, 0] = np.count_nonzero(status == sir.SUSCEPTIBLE.value, axis=1)
+        row[:, 1] = np.count_nonzero(infected, axis=1)
+        row[:, 2] = np.count_nonzero(status == sir.RECOVERED.value, axis=1)
+        row[:, 3] = np.count_nonzero(isolating, axis=1)
+        row[:, 4] = self.num_self_isolated
+
+
+    def infect(self, agents:np.ndarray) -> None:
+        """
+        Infect the given agents (an index or mask into the agent arrays), which
+        must be susceptible.
+        """
+
+        self.status[agents] = sir.INCUBATING_SAFE.value
+        self.infection_ticks[agents] = 0
+        self.tick_threshold[agents] = self.cfg.INCUBATION_SAFE_TIME
+
+
+    def spread_infection(self) -> None:
+        """
+        Give every susceptible agent its chance of catching the disease from
+        each contagious agent whose search area it is in. The search area is
+        that of Environment.localized_search() for the 'pairwise' infection
+        stage, and the (2r+1)x(2r+1) box of Environment.infect_by_pressure()
+        for 'field'; either way, an agent exposed to k contagious agents is
+        infected with probability 1-(1-p)^k.
+        """
+
+        contagious = np.flatnonzero((self.status == sir.INCUBATING_CONTAGIOUS.value)
+                                    | (self.status == sir.SYMPTOMATIC_SEVERE.value))
+        if len(contagious) == 0:
+            return
+
+        radius = self.cfg.INFECTION_RADIUS
+        if self.cfg.INFECTION_STAGE == 'pairwise':
+            # localized_search() covers x - r <= x' < x + r, and never reaches
+            # the last column or row of the world
+            offsets = np.arange(-radius, radius, dtype=np.int32)
+            max_x, max_y = self.width - 1, self.height - 1
+        else:
+            offsets = np.arange(-radius, radius + 1, dtype=np.int32)
+            max_x, max_y = self.width, self.height
+
+        # Key of every space within reach of each contagious agent, and how
+        # many contagious agents reach it
+        reach = len(offsets)
+        source_x = (self.x[contagious][:, None] + np.tile(offsets, reach)).ravel()
+        source_y = (self.y[contagious][:, None] + np.repeat(offsets, reach)).ravel()
+        source_r = np.repeat(self.replicate_of[contagious], reach * reach)
+        reached = ((source_x >= 0) & (source_x < max_x)
+                   & (source_y >= 0) & (source_y < max_y))
+        keys = self.keys(source_r[reached], source_x[reached], source_y[reached])
+        keys, counts = np.unique(keys, return_counts=True)
+
+        susceptible = np.flatnonzero(self.status == sir.SUSCEPTIBLE.value)
+        target = self.keys(self.replicate_of[susceptible], self.x[susceptible],
+                           self.y[susceptible])
+        found = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+        exposed = keys[found] == target
+        agents = susceptible[exposed]
+        exposures = counts[found[exposed]]
+
+        # One draw per exposed agent, from its own replicate's generator;
+        # agents are listed replicate by replicate
+        draws = np.empty(len(agents))
+        bounds = np.searchsorted(agents, np.arange(self.replicates + 1) * self.num_agents)
+        for r in np.unique(self.replicate_of[agents]).tolist():
+            start, stop = bounds[r], bounds[r + 1]
+            draws[start:stop] = self.rngs[r].random(stop - start)
+        chance = 1 - (1 - self.cfg.INFECTION_PROBABILITY) ** exposures
+        self.infect(agents[draws < chance])
+
+
+    def progress_infections(self) -> None:
+        """
+        Tick every active infection forward, advancing those whose current
+        stage is over; the array equivalent of Infection.tick().
+        """
+
+        status = self.status
+        active = status != sir.SUSCEPTIBLE.value
+        self.infection_ticks[active] += 1
+        done = active & (self.infection_ticks >= self.tick_threshold)
+        if not done.any():
+            return
+        self.infection_ticks[done] = 0
+
+        # Decide every transition before making any of them
+        contagious = done & (status == sir.INCUBATING_SAFE.value)
+        symptomatic = done & (status == sir.INCUBATING_CONTAGIOUS.value)
+        recovered = done & (status == sir.SYMPTOMATIC_SEVERE.value)
+        susceptible = done & (status == sir.RECOVERED.value)
+
+        status[contagious] = sir.INCUBATING_CONTAGIOUS.value
+        self.tick_threshold[contagious] = self.cfg.INCUBATION_CONTAGIOUS_TIME
+        status[symptomatic] = sir.SYMPTOMATIC_SEVERE.value
+        self.tick_threshold[symptomatic] = self.cfg.SYMPTOMATIC_TIME
+        status[recovered] = sir.RECOVERED.value
+        self.tick_threshold[recovered] = self.cfg.IMMUNITY_DURATION
+        status[susceptible] = sir.SUSCEPTIBLE.value
+
+
+    def update_behavior(self) -> None:
+        """
+        Step the behaviour of every agent in mode B; the same transitions as
+        Environment.update_behavior(), decided by the state each agent started
+        the tick in.
+        """
+
+        state = self.behavior
+        status = self.status
+        symptomatic = status == sir.SYMPTOMATIC_SEVERE.value
+        idle = state == BehaviorState.IDLE.value
+        awaiting = state == BehaviorState.AWAITING_TEST.value
+        isolating = state == BehaviorState.SELF_ISOLATING.value
+
+        self.testing_timer[awaiting] -= 1
+        tested = awaiting & (self.testing_timer <= 0)
+        recovered = isolating & (status == sir.RECOVERED.value)
+
+        # Go into self-isolation once test results are in
+        state[tested] = BehaviorState.SELF_ISOLATING.value
+        self.focus_home[tested] = True
+        self.num_self_isolated += np.count_nonzero(self.view(tested), axis=1)
+
+        # Go back to normal once the infection ends, in step with the
+        # day/night cycle
+        state[recovered] = BehaviorState.IDLE.value
+        self.focus_home[recovered] = not self.daytime
+
+        # Get tested if symptomatic
+        waiting = idle & symptomatic
+        state[waiting] = BehaviorState.AWAITING_TEST.value
+        self.testing_timer[waiting] = self.cfg.SYMPTOM_TESTING_LAG
+
+
+    def move_agents(self) -> None:
+        """
+        Have every agent pick a move, as FocusedAgent.get_movement() and
+        Environment.choose_move() would, and make the moves that are possible.
+        Agents move simultaneously; see the module docstring.
+        """
+
+        # Uniform draws for each agent: how to move, which way to turn, which
+        # random direction to take, which restricted move to take, and its
+        # priority for a contested space
+        draws = np.concatenate([rng.random((5, self.num_agents)) for rng in self.rngs],
+                               axis=1)
+
+        x, y = self.x, self.y
+        target_x = np.where(self.focus_home, self.home_x, self.work_x) - x
+        target_y = np.where(self.focus_home, self.home_y, self.work_y) - y
+        sign_x = np.sign(target_x)
+        sign_y = np.sign(target_y)
+        distance = np.rint(np.hypot(target_x, target_y))
+        distance_factor = distance / self.cfg.AGENT_SLACK
+
+        # Move directly towards the focus point, perpendicular to it, or away
+        # from it, as in FocusedAgent.get_movement()
+        roll = np.floor(draws[0] * 300)
+        direct = roll < 100 + 200 * distance_factor
+        perpendicular = ~direct & (roll < 200 + 100 * distance_factor)
+        # Rotate counter-clockwise by 90 or 270 degrees
+        turn = np.where(draws[1] < 0.5, np.int32(1), np.int32(-1))
+        dx = np.where(direct, sign_x, np.where(perpendicular, -turn * sign_y, -sign_x))
+        dy = np.where(direct, sign_y, np.where(perpendicular, turn * sign_x, -sign_y))
+
+        # Agents on their focus point step in any direction
+        on_focus = np.flatnonzero((sign_x == 0) & (sign_y == 0))
+        random_direction = (draws[2][on_focus] * len(DIRECTION_X)).astype(np.intp)
+        dx[on_focus] = DIRECTION_X[random_direction]
+        dy[on_focus] = DIRECTION_Y[random_direction]
+
+        # Agents whose move is blocked pick again from their distribution,
+        # restricted to the free spaces around them
+        blocked = np.flatnonzero(~self.is_free(self.replicate_of, x + dx, y + dy))
+        if len(blocked):
+            dx[blocked], dy[blocked] = self.restricted_moves(
+                blocked, sign_x[blocked], sign_y[blocked],
+                distance_factor[blocked], draws[3][blocked])
+
+        # Of the agents headed for the same space, the one with the lowest
+        # priority draw gets it
+        movers = np.flatnonzero((dx != 0) | (dy != 0))
+        new_x = x[movers] + dx[movers]
+        new_y = y[movers] + dy[movers]
+        keys = self.keys(self.replicate_of[movers], new_x, new_y)
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        contested = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1])
+        if len(contested):
+            # Only the few agents in contested spaces need sorting by priority
+            losers = self.contest_losers(movers, keys, order, sorted_keys,
+                                         contested, draws[4])
+            keep = np.ones(len(movers), dtype=bool)
+            keep[losers] = False
+            movers, keys = movers[keep], keys[keep]
+            new_x, new_y = new_x[keep], new_y[keep]
+
+        if self.occupied is not None:
+            self.occupied[self.keys(self.replicate_of[movers], x[movers], y[movers])] = False
+            self.occupied[keys] = True
+        x[movers] = new_x
+        y[movers] = new_y
+        if self.occupied is None:
+            self.occupied_keys = np.sort(self.keys(self.replicate_of, x, y))
+
+
+    def contest_losers(self, movers:np.ndarray, keys:np.ndarray, order:np.ndarray,
+                        sorted_keys:np.ndarray, contested:np.ndarray,
+                        priorities:np.ndarray) -> np.ndarray:
+        """
+        Find the movers that lose out on a space another mover with a lower
+        priority draw is also headed for.
+
+        movers:         Agents that are moving
+        keys:           Key of each mover's destination
+        order:          Order that sorts <keys>
+        sorted_keys:    keys[order]
+        contested:      Positions i in <sorted_keys> where sorted_keys[i] equals
+                        sorted_keys[i + 1]
+        priorities:     Priority draw of every agent
+
+        returns: Positions in <movers> of the losers
+        """
+
+        spaces = np.unique(sorted_keys[contested])
+        start = np.searchsorted(sorted_keys, spaces, side='left')
+        stop = np.searchsorted(sorted_keys, spaces, side='right')
+        # Positions in <movers> of every agent headed for a contested space
+        lengths = stop - start
+        contenders = order[np.repeat(start - np.cumsum(lengths) + lengths, lengths)
+                           + np.arange(lengths.sum())]
+        ranked = contenders[np.lexsort((priorities[movers[contenders]], keys[contenders]))]
+        first = np.ones(len(ranked), dtype=bool)
+        first[1:] = keys[ranked[1:]] != keys[ranked[:-1]]
+        return ranked[~first]
+
+
+    def restricted_moves(self, blocked:np.ndarray, sign_x:np.ndarray,
+                            sign_y:np.ndarray, distance_factor:np.ndarray,
+                            draws:np.ndarray) -> tuple:
+        """
+        Pick moves for blocked agents from their movement distributions,
+        restricted to the free spaces around them; the array equivalent of
+        Agent.get_restricted_movement(), with weights as given by
+        FocusedAgent.get_movement_weights().
+
+        returns: (dx, dy) of each agent's move, (0, 0) if it has no free space
+        """
+
+        x = self.x[blocked][:, None]
+        y = self.y[blocked][:, None]
+        legal = self.is_free(self.replicate_of[blocked][:, None],
+                             x + DIRECTION_X, y + DIRECTION_Y)
+
+        # Weight of each direction; those of agents on their focus point are
+        # all equal
+        direct = np.minimum(300, np.ceil(100 + 200 * distance_factor))
+        perpendicular = np.maximum(0, np.minimum(300, np.ceil(200 + 100 * distance_factor)) - direct)
+        backwards = 300 - direct - perpendicular
+        on_focus = (sign_x == 0) & (sign_y == 0)
+        weights = np.repeat(on_focus[:, None], len(DIRECTION_X), axis=1).astype(np.float64)
+        weights += direct[:, None] * ((DIRECTION_X == sign_x[:, None])
+                                      & (DIRECTION_Y == sign_y[:, None]))
+        weights += perpendicular[:, None] / 2 * ((DIRECTION_X == -sign_y[:, None])
+                                                 & (DIRECTION_Y == sign_x[:, None]))
+        weights += perpendicular[:, None] / 2 * ((DIRECTION_X == sign_y[:, None])
+                                                 & (DIRECTION_Y == -sign_x[:, None]))
+        weights += backwards[:, None] * ((DIRECTION_X == -sign_x[:, None])
+                                         & (DIRECTION_Y == -sign_y[:, None]))
+
+        weights *= legal
+        # If none of the legal directions could be picked, pick one of them
+        # at random instead
+        unweighted = weights.sum(axis=1) == 0
+        weights[unweighted] = legal[unweighted]
+
+        totals = weights.sum(axis=1)
+        cumulative = np.cumsum(weights, axis=1)
+        choice = (cumulative <= (draws * totals)[:, None]).sum(axis=1)
+        choice = np.minimum(choice, len(DIRECTION_X) - 1)
+        stuck = totals == 0
+        dx = np.where(stuck, 0, DIRECTION_X[choice])
+        dy = np.where(stuck, 0, DIRECTION_Y[choice])
+        return dx, dy
+
+
+    def end_simulation(self) -> None:
+        """
+        Write every replicate's log, and plot it as Environment does, to
+        plot/<run_identifier>_rep<r>/.
+        """
+
+        self.complete = True
+        for r, logger in enumerate(self.loggers):
+            logger.log_lines([LogEntry( time,
+                                        s, i, rec,
+                                        round(i / self.num_agents, 2),
+                                        0,
+                                        curr_isolated,
+                                        total_isolated,
+                                        0, 0, 0, 0)
+                              for time, (s, i, rec, curr_isolated, total_isolated)
+                              in enumerate(self.log[r].tolist())])
+            Plotter(logger.filename, logger.ident)
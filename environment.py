@@ -1,22 +1,55 @@
 """
-An environment manages a grid of Cells, which contain Objects (which can be 
-agents, walls, etc). When its tick() method is called, it will execute an
+An environment manages a grid of cells, which contain Objects (which can be 
+agents, walls, etc). Which object is in each cell is tracked by an occupancy
+backend (see occupancy.py). When its tick() method is called, it will execute an
 update on the system, where all the agents will execute a movement based on
 their own logic.
 """
+import copy
+import numpy as np
+import os
+import random
+import sys
+import traceback
+
 from agent import *
-from cell import Cell
+from behavior import BehaviorState, BehaviorTable
+from contactlog import ContactLog
+from direction import Direction
+from heatmap import HeatmapAccumulator
 from logger import *
+from neighbours import NeighbourLists
 from objects import *
+from observer import Observer
+from occupancy import MemmapOccupancy, create_occupancy
+from pressure import exposure_counts, infection_chances, infection_draws
 from plotter import Plotter
 from simulation_parameters import SimConfig, SimulationMode
+from streams import KeyedStreams
 
-MAXIMUM_MOVEMENT_ATTEMPTS = 20
 MINUTES_PER_DAY = 1440
 
+# Parameters that shape the environment when it is built, and so cannot be
+# overridden by a branch of a running simulation (see run_branches())
+FIXED_PARAMETERS = ('NUM_AGENTS', 'WORLD_WIDTH', 'WORLD_HEIGHT', 'RESPONSE_MODE',
+                    'INCUBATION_SAFE_TIME', 'INCUBATION_CONTAGIOUS_TIME',
+                    'OCCUPANCY_BACKEND', 'NEIGHBOUR_SEARCH', 'CONTACT_CULLING',
+                    'SAVE_CONTACT_LOG', 'COMMON_RANDOM_NUMBERS', 'RNG_SEED',
+                    'HEATMAP_BIN_SIZE')
+
 class Environment:
 
-    def __init__(self, width:int, height:int, config:SimConfig, run_identifier:str):
+    def __init__(self, width:int, height:int, config:SimConfig, run_identifier:str,
+                 output:bool=True):
+        """
+        width, height:  Dimensions of the world
+        config:         Simulation parameters
+        run_identifier: Name of the run, used for its log
+        output:         Whether to write the log, plot and contact log to
+                        log/<run_identifier>/. If not, the log is only kept in
+                        memory (self.logger.arrays()).
+        """
+
         # Flag for end of simulation
         self.complete = False
 
@@ -24,7 +57,7 @@ class Environment:
         self.canvas_size_x = width
         self.canvas_size_y = height
 
-        self.cells = list() # 2D list, forming a grid
+        self.occupancy = None
         self.agents = list()
 
         # Lists of home and work points, used by the GUI to display
@@ -34,15 +67,18 @@ class Environment:
         # String that identifies the parameters this run was launched with
         # (e.g. modeA_sev1, for agent mode A and severity 1)
         self.iden = run_identifier
+        self.output = output
 
         # Logger that tracks the counts of susceptible, infected, and recovered
         # agents
-        self.logger = Logger(self.iden)
-        self.logger.create_log_file()
+        self.logger = self.create_logger()
 
         self.susceptible_agents = list()
         self.infected_agents = list()
         self.recovered_agents = list()
+        # Agents currently able to infect others, in the order they became
+        # contagious. A dict is used as an insertion-ordered set.
+        self.contagious_agents = dict()
 
         # Number of direct contact-tracing notifications sent
         self.num_notified_through_tracing = 0
@@ -63,6 +99,12 @@ class Environment:
 
         self.id_lookup = dict()
 
+        # Notifications posted this tick, awaiting delivery, keyed by the
+        # global index of the recipient. Contact-tracing notifications carry
+        # nothing, and geonotifications the points they were sent about.
+        self.traced = dict()
+        self.geonotified = dict()
+
         # Current "simulation time", in minutes. One tick advances this clock
         # by one minute. Wraps to 0 at 1440 minutes (i.e. every 24 hours).
         self.current_time = 0
@@ -73,15 +115,78 @@ class Environment:
 
         self.cfg = config
 
-        # Build and populate a grid of Cells
-        for y in range(self.canvas_size_y):
-            row = list()
-            for x in range(self.canvas_size_x):
-                row.append(Cell())
-            self.cells.append(row)
+        # Behaviour state and SIR status of every agent, as arrays. Contacts
+        # count towards caution for as long as they count as recent (see
+        # TraceableAgent.get_recent_contacts()).
+        recent = self.cfg.INCUBATION_SAFE_TIME + self.cfg.INCUBATION_CONTAGIOUS_TIME + 1
+        self.behaviors = BehaviorTable(window=recent)
+
+        # Every contact between agents (modes C and D). Unless the whole log is
+        # to be saved, only recent contacts are kept if culling is enabled.
+        if self.cfg.CONTACT_CULLING and not self.cfg.SAVE_CONTACT_LOG:
+            self.contact_log = ContactLog(retention=recent)
+        else:
+            self.contact_log = ContactLog()
+        # Contacts registered this tick, column by column, appended to the log
+        # once every agent has registered its contacts
+        self.new_contacts = tuple(list() for _ in range(5))
+
+        if self.cfg.INFECTION_STAGE not in ('pairwise', 'field'):
+            raise ValueError(f'Unknown infection stage: {self.cfg.INFECTION_STAGE}')
+        # Generator for vectorized random draws, created on first use
+        self.np_random = None
+
+        # Keyed random streams, if draws are to be common to runs of every
+        # mode (see streams.py)
+        if self.cfg.COMMON_RANDOM_NUMBERS:
+            if self.cfg.RNG_SEED is None:
+                raise ValueError('Common random numbers need an RNG_SEED')
+            self.streams = KeyedStreams(self.cfg.RNG_SEED)
+        else:
+            self.streams = None
+
+        if self.cfg.NEIGHBOUR_SEARCH not in ('grid', 'verlet'):
+            raise ValueError(f'Unknown neighbour search: {self.cfg.NEIGHBOUR_SEARCH}')
+        # Cached neighbour lists, if used (see neighbours.py)
+        self.neighbour_lists = None
+
+        # Observers notified at the end of every tick (see observer.py)
+        self.observers = list()
+        # Accumulated heatmaps, if enabled; also an observer
+        self.heatmaps = None
+        if self.cfg.HEATMAP_BIN_SIZE is not None:
+            self.heatmaps = HeatmapAccumulator(self.cfg.HEATMAP_BIN_SIZE)
+            self.add_observer(self.heatmaps)
+
+        self.build_grid()
+
+
+    def build_grid(self) -> None:
+        """
+        Create the occupancy backend covering the whole world.
+        """
+
+        self.occupancy = create_occupancy(self.canvas_size_x, self.canvas_size_y,
+                                          self.cfg, self.agents)
+        if self.cfg.NEIGHBOUR_SEARCH == 'verlet':
+            self.neighbour_lists = NeighbourLists(self.canvas_size_x,
+                                                  self.canvas_size_y,
+                                                  self.cfg.INFECTION_RADIUS,
+                                                  self.cfg.NEIGHBOUR_SKIN)
 
 
-    def add_agent(self, home_point:np.array, work_point:np.array) -> None:
+    def create_logger(self) -> MemoryLogger:
+        """
+        Create the Logger that this environment writes its per-tick counts to,
+        or a MemoryLogger if output is disabled.
+        """
+
+        logger = Logger(self.iden) if self.output else MemoryLogger(self.iden)
+        logger.create_log_file()
+        return logger
+
+
+    def add_agent(self, home_point:tuple, work_point:tuple) -> None:
         """
         Spawn in an agent of the appropriate type for this simulation mode.
 
@@ -90,7 +195,31 @@ class Environment:
         """
 
         # Agent spawns at home, default focus is work
-        x, y = home_point.tolist()
+        x, y = home_point
+
+        new_agent = self.create_agent(x, y, home_point, work_point)
+        # Row in the behaviour table. Rows are handed out in order, so this is
+        # also the agent's position in self.agents, used by sparse occupancy
+        # backends.
+        new_agent.index = self.behaviors.add(new_agent)
+        new_agent.gid = new_agent.index
+
+        self.add_object(new_agent, x, y)
+        self.agents.append(new_agent)
+
+        self.susceptible_agents.append(new_agent)
+
+        if self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING, 
+                            SimulationMode.PREEMPTIVE_ISOLATION):
+            self.id_lookup[new_agent.agent_id] = new_agent
+
+
+    def create_agent(self, x:int, y:int, home_point:tuple,
+                        work_point:tuple) -> BiologicalAgent:
+        """
+        Construct (but do not place) an agent of the appropriate type for this
+        simulation mode.
+        """
 
         if self.cfg.RESPONSE_MODE == SimulationMode.NO_REACTION:
             new_agent = BiologicalAgent(
@@ -105,14 +234,7 @@ class Environment:
             new_agent = CautiousAgent(
                 self, x, y, home_point, work_point, self.cfg.AGENT_SLACK, self.cfg)
 
-        self.add_object(new_agent, x, y)
-        self.agents.append(new_agent)
-
-        self.susceptible_agents.append(new_agent)
-
-        if self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING, 
-                            SimulationMode.PREEMPTIVE_ISOLATION):
-            self.id_lookup[new_agent.agent_id] = new_agent
+        return new_agent
 
 
     def add_object(self, obj:Object, x:int, y:int) -> None:
@@ -127,8 +249,11 @@ class Environment:
         y:      The y coordinate at which to place the object
         """
 
-        self.cells[y][x].add_object(obj)
-        obj.pos = np.array([x, y])
+        self.occupancy.add_object(obj, x, y)
+        obj.x = x
+        obj.y = y
+        if self.neighbour_lists is not None:
+            self.neighbour_lists.moved(obj)
 
 
     def move_object(self, obj:Object, new_x:int, new_y:int) -> None:
@@ -144,11 +269,13 @@ class Environment:
         raises: RuntimeError, if the destination is occupied.
         """
         try:
-            x, y = obj.pos.tolist()
-            self.cells[y][x].remove_object()
-            obj.old_pos = np.array([x, y])
-            obj.pos = np.array([new_x, new_y])
-            self.cells[new_y][new_x].add_object(obj)
+            x, y = obj.x, obj.y
+            self.occupancy.remove_object(x, y)
+            obj.old_x, obj.old_y = x, y
+            obj.x, obj.y = new_x, new_y
+            self.occupancy.add_object(obj, new_x, new_y)
+            if self.neighbour_lists is not None:
+                self.neighbour_lists.moved(obj)
             
         except RuntimeError:
             print(f'Cannot place object at {x},{y}: cell occupied.')
@@ -194,43 +321,508 @@ class Environment:
             for agent in self.agents:
                 agent.toggle_focus()
 
-        for agent in self.agents:
-            # Find all nearby agents and register contact
-            nearby_agents = self.localized_search(agent, self.cfg.INFECTION_RADIUS)
-            if self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING, SimulationMode.PREEMPTIVE_ISOLATION):
+        # Once nothing more can happen to the epidemic, either end the run
+        # early or skip everything but the agents' own updates and movement
+        quiescent = self.cfg.QUIESCENCE is not None and self.is_quiescent()
+        if quiescent and self.cfg.QUIESCENCE == 'stop':
+            self.fast_forward()
+            return
+
+        # The tick runs in phases, each visiting only the agents it concerns:
+        # contact registration (every agent, but only in modes C and D),
+        # infection (contagious agents only), the agents' own updates (every
+        # agent's infection, then everyone's behaviour at once), and movement.
+        tracing = self.cfg.RESPONSE_MODE in (SimulationMode.CONTACT_TRACING,
+                                             SimulationMode.PREEMPTIVE_ISOLATION)
+        pairwise = self.cfg.INFECTION_STAGE == 'pairwise'
+        visiting_order = self.occupancy.visiting_order(self.agents)
+
+        # Neighbours of contagious agents found while registering contacts,
+        # kept for the infection phase
+        contagious_neighbours = dict()
+        if tracing and not quiescent:
+            self.behaviors.age_mild_contacts(self.current_time)
+            for agent in visiting_order:
+                # Find all nearby agents and register contact
+                nearby_agents = self.localized_search(agent, self.cfg.INFECTION_RADIUS)
                 for n in nearby_agents:
                     agent.register_contact(self.current_time, n)
+                if pairwise and agent in self.contagious_agents:
+                    contagious_neighbours[agent] = nearby_agents
+            self.log_contacts()
+
+        if quiescent:
+            pass
+        elif pairwise:
+            for agent in list(self.contagious_agents):
+                nearby_agents = contagious_neighbours.get(agent)
+                if nearby_agents is None:
+                    nearby_agents = self.localized_search(agent, self.cfg.INFECTION_RADIUS)
+                # Roll to infect nearby agents.
+                for n in nearby_agents:
+                    roll = self.stream('infect', n, agent).random() # value between 0 and 1
+                    if roll <= self.cfg.INFECTION_PROBABILITY and n.is_susceptible():
+                        self.infect_agent(n)
+        else:
+            self.infect_by_pressure()
+
+        # Update the agents' state
+        for agent in visiting_order:
+            agent.tick()
+        if not quiescent:
+            self.update_behavior()
+            self.deliver_notifications()
 
-            if agent.is_infected():
-                # If the agent is contagious, roll to infect nearby agents.
-                if agent.is_contagious():
-                    for n in nearby_agents:
-                        roll = random.random() # value between 0 and 1
-                        if roll <= self.cfg.INFECTION_PROBABILITY and n.is_susceptible():
-                            self.infect_agent(n)
+        self.move_agents(visiting_order)
 
-            # Update the agent's state
-            agent.tick()
+        for observer in self.observers:
+            observer.observe(self)
 
 
-            # Generate a move repeatedly until a valid one is found
-            attempts = 0 # Number of times we've tried to find a legal move
-            while True:
-                attempts += 1
-                if attempts < MAXIMUM_MOVEMENT_ATTEMPTS:
-                    move = agent.get_movement()
-                else:
-                    # Pick a move at random to try to break the deadlock.
-                    move = random.choice(Direction.direction_list)
-                    
-                new_pos = agent.pos + move
-                new_x, new_y = new_pos.tolist()
-                if self.validate_move(new_x, new_y):
-                    break
+    def move_agents(self, visiting_order:list) -> None:
+        """
+        Have every agent choose and make its move for this tick.
+        """
+
+        for agent in visiting_order:
             # Execute the move
+            new_x, new_y = self.choose_move(agent)
             self.move_object(agent, new_x, new_y)
 
 
+    def add_observer(self, observer:Observer) -> None:
+        self.observers.append(observer)
+        observer.attach(self)
+
+
+    def run_branches(self, overrides:list, labels:list=None) -> None:
+        """
+        Split the run at the current tick into branches, one per dict of
+        SimConfig overrides (e.g. {'CAUTION_THRESHOLD': 3}), and run each of
+        them to the end. The ticks so far are only simulated once. Each branch
+        logs to <iden>_<label>, starting with a copy of the log so far.
+
+        Where os.fork() is available, each branch runs in a child process that
+        shares this one's memory copy-on-write, with up to one branch per CPU
+        running at a time. Otherwise, each branch runs in turn on a deep copy
+        of the environment. Either way, every branch starts from the same
+        random state, so branches differ only by their overrides and what
+        follows from them. Observers are not carried into the branches.
+
+        This environment is left complete, and is not ticked any further. Its
+        observers and occupancy backend are closed as at the end of a run
+        (see close_run()), but its log so far is not plotted.
+
+        overrides:  SimConfig attributes to set in each branch
+        labels:     Name of each branch; branch<i> by default
+
+        raises: ValueError if an override is unknown or in FIXED_PARAMETERS,
+                or the memmap occupancy backend is in use; FileExistsError if
+                the log directory of a branch already exists; RuntimeError if
+                any branch fails.
+        """
+
+        if labels is None:
+            labels = [f'branch{i}' for i in range(len(overrides))]
+        if len(labels) != len(overrides):
+            raise ValueError(f'Expected {len(overrides)} labels, got {len(labels)}')
+        for override in overrides:
+            for name in override:
+                if name in FIXED_PARAMETERS or not hasattr(self.cfg, name):
+                    raise ValueError(f'Cannot override {name} in a branch')
+        if isinstance(self.occupancy, MemmapOccupancy):
+            # Branches would all write to the same chunk files
+            raise ValueError('Cannot branch with the memmap occupancy backend')
+        for label in labels:
+            # Fail here, before anything is forked, rather than in every branch
+            self.check_branch_log(label)
+
+        failed = list()
+        state = random.getstate()
+        if hasattr(os, 'fork'):
+            running = dict()
+            for label, override in zip(labels, overrides):
+                if len(running) >= (os.cpu_count() or 1):
+                    pid, status = os.wait()
+                    if status != 0:
+                        failed.append(running[pid])
+                    del running[pid]
+                sys.stdout.flush()
+                pid = os.fork()
+                if pid == 0:
+                    code = 0
+                    try:
+                        # The random module reseeds itself in forked children
+                        random.setstate(state)
+                        self.become_branch(label, override)
+                        while not self.complete:
+                            self.tick()
+                    except BaseException:
+                        traceback.print_exc()
+                        code = 1
+                    finally:
+                        sys.stdout.flush()
+                        os._exit(code)
+                running[pid] = label
+            for pid, label in running.items():
+                _, status = os.waitpid(pid, 0)
+                if status != 0:
+                    failed.append(label)
+        else:
+            observers, self.observers = self.observers, list()
+            for label, override in zip(labels, overrides):
+                random.setstate(state)
+                branch = copy.deepcopy(self)
+                try:
+                    branch.become_branch(label, override)
+                    while not branch.complete:
+                        branch.tick()
+                except Exception:
+                    traceback.print_exc()
+                    failed.append(label)
+            self.observers = observers
+            random.setstate(state)
+
+        # The run so far ends here, unplotted; its branches carry it on
+        self.close_run()
+        if failed:
+            raise RuntimeError(f'Branches failed: {", ".join(failed)}')
+
+
+    def check_branch_log(self, label:str) -> None:
+        """
+        Check that a branch can log to log/<iden>_<label>.
+
+        raises: FileExistsError if that directory already exists, e.g. from
+                an earlier run with the same branches.
+        """
+
+        directory = os.path.join('log', f'{self.iden}_{label}')
+        if self.output and os.path.exists(directory):
+            raise FileExistsError(f'Log directory of branch {label} already '
+                                  f'exists: {directory}')
+
+
+    def become_branch(self, label:str, overrides:dict) -> None:
+        """
+        Turn this environment into a branch of the run it has simulated so
+        far (see run_branches()): apply the overrides, and continue the log
+        under a new identifier.
+        """
+
+        self.check_branch_log(label)
+        prefix = self.logger
+        self.iden = f'{self.iden}_{label}'
+        self.logger = self.create_logger()
+        self.logger.rows = list(prefix.rows)
+        if self.output:
+            with open(prefix.filename) as f:
+                # Skip the header, which the new log already has
+                rows = f.readlines()[1:]
+            with open(self.logger.filename, 'a') as f:
+                f.writelines(rows)
+        # Heatmaps carry on from the run so far, as the log does
+        self.observers = [self.heatmaps] if self.heatmaps is not None else list()
+
+        old_distance = self.cfg.GEOLOCATION_DISTANCE
+        for name, value in overrides.items():
+            setattr(self.cfg, name, value)
+        if self.cfg.GEOLOCATION_DISTANCE != old_distance:
+            # Contacts are indexed by buckets of this size
+            for agent in self.agents:
+                if isinstance(agent, CautiousAgent):
+                    agent.rebucket()
+
+
+    def is_quiescent(self) -> bool:
+        """
+        Check whether the epidemic is over, for now: no agent is infected, so
+        none can be infected from here on, and no agent is still reacting to
+        it (awaiting a test, cautiously isolating, about to stop isolating, or
+        counting mild contacts), nor has a notification waiting. The only
+        changes still to come are recovered agents becoming susceptible again,
+        on fixed timers.
+
+        Agents self-isolating without having been infected stay isolated until
+        they recover from an infection, which can no longer happen, so they
+        do not count as reacting.
+        """
+
+        if self.infected_agents or self.traced or self.geonotified:
+            return False
+        table = self.behaviors
+        n = table.size
+        state = table.state[:n]
+        pending = table.in_use[:n] & (
+            (state == BehaviorState.AWAITING_TEST.value)
+            | (state == BehaviorState.CAUTIOUS_ISOLATING.value)
+            | ((state == BehaviorState.SELF_ISOLATING.value)
+               & (table.status[:n] == sir.RECOVERED.value)))
+        return not pending.any() and not table.mild_contacts[:n].any()
+
+
+    def fast_forward(self) -> None:
+        """
+        End a quiescent run (see is_quiescent()) straight away. The remaining
+        log rows are worked out from the recovered agents' immunity timers
+        rather than simulated, and the agents' infections are advanced to
+        where they would have been at the end of the run; agents do not move.
+        """
+
+        remaining = self.cfg.MAXIMUM_TIME - self.current_time + 1
+
+        # Number of the remaining ticks after which each recovered agent has
+        # become susceptible again, as counted in the log
+        regained = [0] * (remaining + 1)
+        for agent in list(self.recovered_agents):
+            infection = agent.infection
+            wait = max(1, infection.tick_threshold - infection.ticks)
+            if wait <= remaining:
+                regained[wait] += 1
+                infection.progress()
+            else:
+                infection.ticks += remaining
+
+        susceptible_count = len(self.susceptible_agents) - sum(regained)
+        recovered_count = len(self.recovered_agents) + sum(regained)
+        for i in range(1, remaining + 1):
+            susceptible_count += regained[i]
+            recovered_count -= regained[i]
+            self.logger.log_line(LogEntry(  self.current_time + i - 1,
+                                            susceptible_count,
+                                            0,
+                                            recovered_count,
+                                            0.0,
+                                            self.num_notified_through_tracing,
+                                            len(self.curr_self_isolating),
+                                            self.num_self_isolated,
+                                            len(self.curr_cautious_isolating),
+                                            self.num_cautious_isolated,
+                                            self.num_geonotified,
+                                            self.unnecessary_isolations
+                                            ))
+
+        self.current_time = self.cfg.MAXIMUM_TIME + 1
+        self.end_simulation()
+
+
+    def update_behavior(self) -> None:
+        """
+        Step the behaviour of every agent (modes B-D) at once, using masks over
+        the arrays of the behaviour table:
+
+        - Idle agents showing symptoms wait for a test, and in modes C and D
+          notify their recent contacts.
+        - In mode D, idle agents with too many mildly symptomatic contacts
+          isolate cautiously, and geonotify.
+        - Agents awaiting a test count down, and self-isolate once it is in.
+        - Self-isolating agents stop once they have recovered.
+        - Cautiously isolating agents self-isolate if they develop symptoms,
+          and otherwise stop once their caution period runs out.
+
+        Every agent makes at most one transition per tick, decided by the
+        state it started the tick in. Notifications sent to other agents are
+        only queued, to be delivered by deliver_notifications().
+        """
+
+        mode = self.cfg.RESPONSE_MODE
+        if mode == SimulationMode.NO_REACTION:
+            return
+
+        table = self.behaviors
+        n = table.size
+        state = table.state[:n]
+        status = table.status[:n]
+        testing_timer = table.testing_timer[:n]
+        caution_timer = table.caution_timer[:n]
+        in_use = table.in_use[:n]
+
+        symptomatic = ((status == sir.SYMPTOMATIC_MILD.value)
+                       | (status == sir.SYMPTOMATIC_SEVERE.value))
+        idle = in_use & (state == BehaviorState.IDLE.value)
+        awaiting = in_use & (state == BehaviorState.AWAITING_TEST.value)
+        isolating = in_use & (state == BehaviorState.SELF_ISOLATING.value)
+        cautious = in_use & (state == BehaviorState.CAUTIOUS_ISOLATING.value)
+
+        # Count down test results, and the caution period of agents that have
+        # not developed symptoms
+        testing_timer[awaiting] -= 1
+        waiting = cautious & ~symptomatic
+        caution_timer[waiting] -= 1
+
+        tested = awaiting & (testing_timer <= 0)
+        escalated = cautious & symptomatic
+        recovered = isolating & (status == sir.RECOVERED.value)
+        expired = waiting & (caution_timer <= 0)
+        symptomatic_idle = idle & symptomatic
+
+        # Go into self-isolation once test results are in, or if symptoms
+        # develop during cautious isolation
+        self.isolate_rows(np.flatnonzero(tested | escalated).tolist())
+
+        # Go back to normal once the infection or the caution period ends
+        for row in np.flatnonzero(recovered | expired).tolist():
+            table.agents[row].stop_isolating()
+        self.unnecessary_isolations += int(np.count_nonzero(expired))
+
+        # Get tested if symptomatic
+        rows = np.flatnonzero(symptomatic_idle)
+        state[rows] = BehaviorState.AWAITING_TEST.value
+        testing_timer[rows] = self.cfg.SYMPTOM_TESTING_LAG
+        if mode in (SimulationMode.CONTACT_TRACING,
+                    SimulationMode.PREEMPTIVE_ISOLATION):
+            for row in rows.tolist():
+                table.agents[row].notify_contacts()
+
+        # Isolate if number of symptomatic contacts exceeds threshold. This
+        # applies to every agent that started the tick idle, unless it has
+        # since been sent into isolation by a notification.
+        if mode == SimulationMode.PREEMPTIVE_ISOLATION:
+            undisturbed = idle & ((state == BehaviorState.IDLE.value)
+                                  | (symptomatic_idle
+                                     & (state == BehaviorState.AWAITING_TEST.value)))
+            alarmed = undisturbed & (table.mild_contacts[:n] > self.cfg.CAUTION_THRESHOLD)
+            for row in np.flatnonzero(alarmed).tolist():
+                agent = table.agents[row]
+                agent.cautious_isolate()
+                agent.geonotify()
+
+
+    def record_contact(self, agent:Agent, contacted_agent:Agent,
+                        symptoms:SymptomLevel) -> None:
+        """
+        Note a contact for the contact log; see log_contacts().
+        """
+
+        a, b, x, y, sym = self.new_contacts
+        a.append(agent.gid)
+        b.append(contacted_agent.gid)
+        x.append(contacted_agent.x)
+        y.append(contacted_agent.y)
+        sym.append(symptoms.value)
+
+
+    def log_contacts(self) -> None:
+        """
+        Append the contacts recorded this tick to the contact log, as one chunk.
+        """
+
+        self.contact_log.append(self.current_time, *self.new_contacts)
+        self.new_contacts = tuple(list() for _ in range(5))
+
+
+    def notify(self, gid:int, point:tuple=None) -> None:
+        """
+        Queue a notification for the agent with the given global index, to be
+        delivered along with all the others posted this tick.
+
+        point:  None for a contact-tracing notification, or the point a
+                geonotification was sent about
+        """
+
+        if point is None:
+            self.traced[gid] = None
+        else:
+            self.geonotified.setdefault(gid, []).append(point)
+
+
+    def deliver_notifications(self) -> None:
+        """
+        Deliver the notifications queued this tick. Each recipient reacts once
+        to each kind of notification, however many agents notified it, and
+        recipients react in order of global index rather than the order they
+        were notified in.
+        """
+
+        traced = sorted(self.traced)
+        geonotified = sorted(self.geonotified.items())
+        self.traced = dict()
+        self.geonotified = dict()
+
+        for gid in traced:
+            self.get_agent_by_gid(gid).notification_reaction()
+        for gid, points in geonotified:
+            self.get_agent_by_gid(gid).geonotification_reaction(points)
+
+
+    def isolate_rows(self, rows:list) -> None:
+        """
+        Send the agents in the given rows of the behaviour table into
+        self-isolation; the bulk equivalent of IsolatingAgent.self_isolate().
+        """
+
+        if not rows:
+            return
+        self.behaviors.state[rows] = BehaviorState.SELF_ISOLATING.value
+        agents = [self.behaviors.agents[row] for row in rows]
+        for agent in agents:
+            agent.focus_point = agent.home_point
+        self.curr_self_isolating.extend(agents)
+        self.num_self_isolated += len(agents)
+
+
+    def infect_by_pressure(self) -> None:
+        """
+        Alternative to the pairwise infection rolls in tick(), used when
+        config.INFECTION_STAGE is 'field'. The contagious agents around every
+        susceptible agent are counted in one pass over the grid, and each
+        susceptible agent is then infected with probability 1-(1-p)^k, where
+        k is its number of contagious neighbours, in one vectorized draw.
+
+        Unlike localized_search(), this counts every agent in the
+        (2r+1)x(2r+1) box around the susceptible agent.
+        """
+
+        contagious = list(self.contagious_agents)
+        if not contagious or not self.susceptible_agents:
+            return
+
+        if self.np_random is None and self.streams is None:
+            self.np_random = np.random.default_rng(random.getrandbits(64))
+
+        susceptible = list(self.susceptible_agents)
+        exposures = exposure_counts(
+            np.fromiter((a.x for a in contagious), dtype=np.int64, count=len(contagious)),
+            np.fromiter((a.y for a in contagious), dtype=np.int64, count=len(contagious)),
+            np.fromiter((a.x for a in susceptible), dtype=np.int64, count=len(susceptible)),
+            np.fromiter((a.y for a in susceptible), dtype=np.int64, count=len(susceptible)),
+            self.cfg.INFECTION_RADIUS, self.canvas_size_x, self.canvas_size_y)
+
+        if self.streams is not None:
+            draws = self.streams.uniforms('infect', self.current_time,
+                                          [a.gid for a in susceptible])
+            infected = draws < infection_chances(exposures,
+                                                 self.cfg.INFECTION_PROBABILITY)
+        else:
+            infected = infection_draws(exposures, self.cfg.INFECTION_PROBABILITY,
+                                       self.np_random)
+        for i in np.flatnonzero(infected).tolist():
+            self.infect_agent(susceptible[i])
+
+
+    def choose_move(self, agent:Agent) -> tuple:
+        """
+        Generate a valid move for an agent. If the agent's preferred move is
+        blocked, it picks again from its movement distribution restricted to
+        the neighbouring spaces that are free, and stays put if there are none.
+        This is equivalent to retrying until a valid move is found, but takes
+        at most one lookup of the agent's neighbourhood.
+
+        returns: The (x, y) destination of the move
+        """
+
+        x, y = agent.x, agent.y
+        rng = self.stream('move', agent)
+        dx, dy = agent.get_movement(rng)
+        if self.validate_move(x + dx, y + dy):
+            return x + dx, y + dy
+
+        legal = [self.validate_move(x + dx, y + dy)
+                 for dx, dy in Direction.direction_list]
+        dx, dy = agent.get_restricted_movement(legal, rng)
+        return x + dx, y + dy
+
+
     def validate_move(self, x:int, y:int) -> bool:
         """
         Check whether a position would be valid to put an object in, using the 
@@ -245,12 +837,29 @@ class Environment:
         if (x >= self.canvas_size_x or y >= self.canvas_size_y 
             or x < 0 or y < 0): # out of bounds
             return False
-        if self.cells[y][x].is_occupied(): # i.e. there is already something in that square
+        if self.occupancy.is_occupied(x, y): # i.e. there is already something in that square
             return False
 
         return True
     
 
+    def stream(self, kind:str, agent:Agent=None, other:Agent=None):
+        """
+        Get the random stream to make a draw of the given kind (see
+        streams.KINDS) from, this tick. Draws about an agent are keyed by its
+        global index, and infection rolls by the agent at risk (<agent>) and
+        the one it might catch the disease from (<other>).
+
+        Without common random numbers, this is always the global `random`
+        stream.
+        """
+
+        if self.streams is None:
+            return random
+        ids = [a.gid for a in (agent, other) if a is not None]
+        return self.streams.stream(kind, self.current_time, *ids)
+
+
     def infect_agent(self, agent:TraceableAgent):
         try:
             agent.infect()
@@ -268,10 +877,27 @@ class Environment:
     def register_infected(self, agent):
         self.susceptible_agents.remove(agent)
         self.infected_agents.append(agent)
+        if self.heatmaps is not None:
+            self.heatmaps.infected(agent.x, agent.y)
+
+    def mirror_status(self, agent) -> None:
+        """
+        Copy an agent's SIR status into the behaviour table. Agents that do not
+        have a row yet pick up their status when they are given one.
+        """
+
+        row = getattr(agent, 'index', None)
+        if (row is not None and row < self.behaviors.size
+                and self.behaviors.agents[row] is agent):
+            self.behaviors.status[row] = agent.infection.status.value
+
+    def register_contagious(self, agent):
+        self.contagious_agents[agent] = None
 
     def register_recovered(self, agent):
         self.infected_agents.remove(agent)
         self.recovered_agents.append(agent)
+        self.contagious_agents.pop(agent, None)
 
     
     def localized_search(self, agent:Agent, radius:int):
@@ -280,7 +906,11 @@ class Environment:
         (i.e. within <radius> tiles, counting diagonals as 1).
         """
 
-        x, y = agent.pos.tolist()
+        lists = self.neighbour_lists
+        if lists is not None and radius == lists.radius:
+            return lists.search(agent, radius)
+
+        x, y = agent.x, agent.y
         # Get bounds of the search area, accounting for edges of the map
         min_x = max(0, x - radius)
         max_x = min(x + radius, self.canvas_size_x-1)
@@ -289,21 +919,38 @@ class Environment:
 
         local_agents = list()
 
-        for i in range(min_x, max_x):
-            for j in range(min_y, max_y):
-                    cell = self.cells[j][i]
-                    if cell.is_occupied():
-                        # Ensure the agent does not count itself
-                        if not cell.object is agent:
-                            local_agents.append(cell.object)
+        for obj in self.occupancy.objects_in(min_x, max_x, min_y, max_y):
+            # Ensure the agent does not count itself
+            if not obj is agent:
+                local_agents.append(obj)
 
         return local_agents
 
     
     def end_simulation(self):
-        self.complete = True
+        self.close_run()
+        if not self.output:
+            return
         path = self.logger.filename
         p = Plotter(path, self.iden)
 
+    def close_run(self) -> None:
+        """
+        Mark the run complete and release what it holds: close the occupancy
+        backend and every observer, and save the contact log if asked to.
+        Used at the end of a run, and by run_branches() once this run has
+        been split into branches.
+        """
+
+        self.complete = True
+        self.occupancy.close()
+        for observer in self.observers:
+            observer.close(self)
+        if self.output and self.cfg.SAVE_CONTACT_LOG:
+            self.contact_log.save(self.logger.subfolder)
+
     def get_agent_by_uuid(self, id):
         return self.id_lookup[id]
+
+    def get_agent_by_gid(self, gid:int):
+        return self.agents[gid]
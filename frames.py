@@ -0,0 +1,184 @@
+"""
+Headless export of a run as images or video, straight from the state of the
+agents, without opening a display.
+
+A FrameExporter draws the world every <every> ticks, as window.py would
+(see render.rasterize()), and writes each frame as it goes, so memory use
+stays constant however long the run:
+
+- To a video file (e.g. run.mp4), through an ffmpeg process reading raw
+  frames from a pipe, if ffmpeg is installed. Encoding happens in that
+  process, alongside the simulation.
+- Otherwise, to a directory of numbered images, PNG by default or PPM.
+"""
+import numpy as np
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import zlib
+
+from observer import Observer
+from render import agent_positions, agent_status, overview, rasterize
+
+# File extensions written through ffmpeg
+VIDEO_FORMATS = ('.mp4', '.mkv', '.webm', '.avi', '.mov', '.gif')
+# zlib level of PNG frames; low, for speed
+PNG_COMPRESSION = 3
+
+
+def write_png(path:str, frame:np.ndarray) -> None:
+    """
+    Write an RGB image (uint8 array of shape (height, width, 3)) as a PNG.
+    """
+
+    height, width, _ = frame.shape
+    # Each row is preceded by its filter type, 0 (none)
+    rows = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = frame.reshape(height, width * 3)
+
+    def chunk(kind:bytes, data:bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), PNG_COMPRESSION)))
+        f.write(chunk(b'IEND', b''))
+
+
+def write_ppm(path:str, frame:np.ndarray) -> None:
+    """
+    Write an RGB image (uint8 array of shape (height, width, 3)) as a binary
+    PPM.
+    """
+
+    height, width, _ = frame.shape
+    with open(path, 'wb') as f:
+        f.write(f'P6 {width} {height} 255\n'.encode())
+        f.write(frame.tobytes())
+
+
+class FrameExporter(Observer):
+    """
+    Observer that exports a frame of the world every few ticks.
+    """
+
+    def __init__(self, path:str, every:int=1, factor:int=1, zoom:int=1,
+                 fps:int=30, image_format:str='png'):
+        """
+        path:           Video file to write (one of VIDEO_FORMATS), or
+                        directory to write numbered images to. Without
+                        ffmpeg, a video path is replaced by a directory of
+                        the same name, less the extension.
+        every:          Export a frame every this many ticks
+        factor:         Cells per pixel; above 1, frames show a binned
+                        overview (see render.overview()), for large worlds
+        zoom:           Pixels per cell, for small worlds; ignored if factor
+                        is above 1
+        fps:            Frame rate of videos
+        image_format:   'png' or 'ppm', for image sequences
+        """
+
+        if image_format not in ('png', 'ppm'):
+            raise ValueError(f'Unknown image format: {image_format}')
+        self.path = path
+        self.every = every
+        self.factor = factor
+        self.zoom = zoom if factor == 1 else 1
+        self.fps = fps
+        self.image_format = image_format
+
+        # Home and work point of each agent, drawn under them
+        self.home = None
+        self.work = None
+        self.ffmpeg = None
+        self.directory = None
+        self.frames = 0
+
+
+    def attach(self, env) -> None:
+        self.home = np.array([a.home_point for a in env.agents], dtype=np.int32)
+        self.work = np.array([a.work_point for a in env.agents], dtype=np.int32)
+
+        root, ext = os.path.splitext(self.path)
+        if ext.lower() in VIDEO_FORMATS:
+            if shutil.which('ffmpeg') is not None:
+                self.open_video(env)
+            else:
+                print(f'ffmpeg not found; writing frames to {root}/ instead',
+                      file=sys.stderr)
+                self.directory = root
+        else:
+            self.directory = self.path
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+        self.frames = 0
+        self.export(env)
+
+
+    def frame_size(self, env) -> tuple:
+        """
+        Get the (width, height) of frames, in pixels.
+        """
+
+        if self.factor > 1:
+            return (-(-env.canvas_size_x // self.factor),
+                    -(-env.canvas_size_y // self.factor))
+        return env.canvas_size_x * self.zoom, env.canvas_size_y * self.zoom
+
+
+    def open_video(self, env) -> None:
+        width, height = self.frame_size(env)
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                   '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-']
+        if not self.path.lower().endswith('.gif'):
+            # Most codecs need even dimensions in yuv420p, which players
+            # expect
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                        '-pix_fmt', 'yuv420p']
+        command.append(self.path)
+        self.ffmpeg = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+
+    def observe(self, env) -> None:
+        if env.current_time % self.every == 0:
+            self.export(env)
+
+
+    def export(self, env) -> None:
+        positions = agent_positions(env)
+        status = agent_status(env)
+        width, height = env.canvas_size_x, env.canvas_size_y
+        if self.factor > 1:
+            frame = overview(positions, status, (0, 0, width, height),
+                             self.factor, env.daytime)
+        else:
+            frame = rasterize(width, height, positions, status, self.home,
+                              self.work, env.daytime)
+            if self.zoom > 1:
+                frame = frame.repeat(self.zoom, axis=0).repeat(self.zoom, axis=1)
+
+        if self.ffmpeg is not None:
+            self.ffmpeg.stdin.write(frame.tobytes())
+        else:
+            name = os.path.join(self.directory,
+                                f'frame_{self.frames:06d}.{self.image_format}')
+            if self.image_format == 'png':
+                write_png(name, frame)
+            else:
+                write_ppm(name, frame)
+        self.frames += 1
+
+
+    def close(self, env) -> None:
+        if self.ffmpeg is not None:
+            self.ffmpeg.stdin.close()
+            if self.ffmpeg.wait() != 0:
+                raise RuntimeError(f'ffmpeg failed to write {self.path}')
+            self.ffmpeg = None
@@ -0,0 +1,104 @@
+"""
+Heatmaps of where things happen in a run, accumulated over the whole run on
+a coarse grid of bins of HEATMAP_BIN_SIZE x HEATMAP_BIN_SIZE cells:
+
+- occupancy:    Agent-ticks spent in each bin
+- contacts:     Contacts registered in each bin, at the contacted agent's
+                position (modes C and D only; other modes register none,
+                nor do ticks that QUIESCENCE skips)
+- infections:   Agents infected in each bin, where they were when infected,
+                including the initial infections
+- isolation:    Agent-ticks spent isolating in each bin
+
+The occupancy, contacts and isolation grids are updated once per tick with
+one np.bincount() over the agents' bins; infections are added as they
+happen, as the environment reports them (see Environment.register_infected()).
+Grids are saved at the end of the run as heatmap_<name>.npy, an array of
+shape (bins down, bins across), in the run's log directory.
+"""
+import numpy as np
+import os
+
+from observer import Observer
+from render import agent_positions
+
+# Names of the grids, in the order they are saved
+GRIDS = ('occupancy', 'contacts', 'infections', 'isolation')
+
+
+class HeatmapAccumulator(Observer):
+    """
+    Observer that accumulates the heatmaps of a run. Environment attaches one
+    itself if HEATMAP_BIN_SIZE is set.
+    """
+
+    def __init__(self, bin_size:int):
+        """
+        bin_size:   Width and height of each bin, in cells
+        """
+
+        self.bin_size = bin_size
+        self.shape = None
+        self.grids = dict()
+
+
+    def attach(self, env) -> None:
+        self.shape = (-(-env.canvas_size_y // self.bin_size),
+                      -(-env.canvas_size_x // self.bin_size))
+        size = self.shape[0] * self.shape[1]
+        self.grids = {name: np.zeros(size, dtype=np.int64) for name in GRIDS}
+
+
+    def bins_of(self, x:np.ndarray, y:np.ndarray) -> np.ndarray:
+        """
+        Get the flat index of the bin of each position.
+        """
+
+        return (y // self.bin_size) * self.shape[1] + x // self.bin_size
+
+
+    def add(self, name:str, bins:np.ndarray) -> None:
+        if len(bins):
+            self.grids[name] += np.bincount(bins, minlength=len(self.grids[name]))
+
+
+    def infected(self, x:int, y:int) -> None:
+        """
+        Count an infection at (x, y).
+        """
+
+        self.grids['infections'][self.bins_of(x, y)] += 1
+
+
+    def observe(self, env) -> None:
+        positions = agent_positions(env)
+        bins = self.bins_of(positions[:, 0], positions[:, 1])
+        self.add('occupancy', bins)
+
+        for part in env.contact_log.parts(env.current_time, env.current_time):
+            # Columns (tick, a, b, x, y, symptoms); see contactlog.py
+            self.add('contacts', self.bins_of(part[3], part[4]))
+
+        isolating = [a.gid for a in env.curr_self_isolating]
+        isolating += [a.gid for a in env.curr_cautious_isolating]
+        if isolating:
+            self.add('isolation', bins[np.array(isolating, dtype=np.int64)])
+
+
+    def arrays(self) -> dict:
+        """
+        Get the grids accumulated so far, as arrays of shape (bins down, bins
+        across), keyed by name.
+        """
+
+        return {name: grid.reshape(self.shape) for name, grid in self.grids.items()}
+
+
+    def save(self, directory:str) -> None:
+        for name, grid in self.arrays().items():
+            np.save(os.path.join(directory, f'heatmap_{name}.npy'), grid)
+
+
+    def close(self, env) -> None:
+        if env.output:
+            self.save(env.logger.subfolder)
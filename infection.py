@@ -1,4 +1,3 @@
-import random
 import warnings
 
 from simulation_parameters import SimConfig
@@ -6,13 +5,27 @@ from sir import SIR_status as sir
 
 class Infection():
 
+    __slots__ = ('_status', 'tick_threshold', 'ticks', 'active', 'parent', 'cfg')
+
     def __init__(self, parent, config):
+        self.parent = parent
+        self.cfg = config
         self.status = sir.SUSCEPTIBLE
         self.tick_threshold = None
         self.ticks = None
         self.active = False
-        self.parent = parent
-        self.cfg = config
+
+
+    @property
+    def status(self) -> sir:
+        return self._status
+
+    @status.setter
+    def status(self, value:sir):
+        self._status = value
+        # Mirror the status into the environment, which steps the behaviour of
+        # all agents at once
+        self.parent.parent.mirror_status(self.parent)
 
     
     def activate(self):
@@ -59,6 +72,7 @@ class Infection():
         if self.status == sir.INCUBATING_SAFE:
             self.status = sir.INCUBATING_CONTAGIOUS
             self.tick_threshold = self.cfg.INCUBATION_CONTAGIOUS_TIME
+            self.parent.parent.register_contagious(self.parent)
         # Become symptomatic
         elif self.status == sir.INCUBATING_CONTAGIOUS:
             self.status = sir.SYMPTOMATIC_SEVERE
@@ -84,6 +98,9 @@ class TwoStageInfection(Infection):
     """
     Infection behaviour for model D.
     """
+
+    __slots__ = ()
+
     def __init__(self, parent, config):
         super().__init__(parent, config)
 
@@ -98,13 +115,14 @@ class TwoStageInfection(Infection):
         if self.status == sir.INCUBATING_SAFE:
             self.status = sir.INCUBATING_CONTAGIOUS
             self.tick_threshold = self.cfg.MODEL_D_CONTAGIOUS_TIME
+            self.parent.parent.register_contagious(self.parent)
         # Become symptomatic
         elif self.status == sir.INCUBATING_CONTAGIOUS:
             self.status = sir.SYMPTOMATIC_MILD
             self.tick_threshold = self.cfg.MILD_SYMPTOM_TIME
         # Chance to progress from mild to severe, or to recover
         elif self.status == sir.SYMPTOMATIC_MILD:
-            n = random.random()
+            n = self.parent.parent.stream('false_alarm', self.parent).random()
             if n < self.cfg.FALSE_ALARM_PROBABILITY:
                 # Recover
                 self.status = sir.RECOVERED
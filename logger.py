@@ -1,9 +1,78 @@
 from datetime import datetime
+import numpy as np
 import os
-class Logger:
+
+# Columns of a log, in order
+COLUMNS = ( 'time_ticks',
+            'susceptible',
+            'infected',
+            'recovered',
+            'infection_rate',
+            'curr_isolated',
+            'total_isolated',
+            'curr_cautious',
+            'total_cautious',
+            'num_tracing_notified',
+            'num_geonotified',
+            'unnecessary_isolations'
+            )
+
+
+class MemoryLogger:
+    """
+    Logger that keeps its rows in memory only, writing no files.
+    """
+
     def __init__(self, log_file_name:str):
         self.filename = None
+        self.subfolder = None
         self.ident = log_file_name
+        self.rows = list()
+
+    def create_log_file(self):
+        pass
+
+    def log_line(self, entry):
+        self.rows.append(self.row_of(entry))
+
+    def log_lines(self, entries):
+        """
+        Write several entries at once, without echoing them.
+        """
+        self.rows.extend(self.row_of(entry) for entry in entries)
+
+    def row_of(self, entry):
+        return (entry.time,
+                entry.susceptible,
+                entry.infected,
+                entry.recovered,
+                entry.infection_rate,
+                entry.curr_isolating,
+                entry.total_isolating,
+                entry.curr_cautious,
+                entry.total_cautious,
+                entry.tracing_notifications,
+                entry.total_geonotified,
+                entry.unnecessary_isolations)
+
+    def arrays(self) -> dict:
+        """
+        Get the rows logged so far as a dict of arrays, keyed by column name.
+        """
+        columns = list(zip(*self.rows)) if self.rows else [()] * len(COLUMNS)
+        return {name: np.array(col, dtype=np.float64 if name == 'infection_rate'
+                                          else np.int64)
+                for name, col in zip(COLUMNS, columns)}
+
+
+class Logger(MemoryLogger):
+    """
+    Logger that writes its rows to log/<ident>/<ident>.csv, echoing each one
+    to stdout, as well as keeping them in memory.
+    """
+
+    def __init__(self, log_file_name:str):
+        super().__init__(log_file_name)
         os.makedirs('log', exist_ok=True)
         self.subfolder = os.path.join('log', self.ident)
         os.makedirs(self.subfolder)
@@ -12,39 +81,29 @@ class Logger:
     def create_log_file(self):
         self.filename = os.path.join(self.subfolder, self.ident + '.csv')
         with open(self.filename, 'w') as f:
-            string = ','.join(( 'time_ticks',
-                                'susceptible',
-                                'infected',
-                                'recovered',
-                                'infection_rate',
-                                'curr_isolated',
-                                'total_isolated',
-                                'curr_cautious',
-                                'total_cautious',
-                                'num_tracing_notified',
-                                'num_geonotified',
-                                'unnecessary_isolations'
-                                ))
+            string = ','.join(COLUMNS)
             f.write(string + '\n')
             print(string.replace(',', '\t'))
 
     def log_line(self, entry):
+        super().log_line(entry)
+        string = self.format_entry(entry)
         with open(self.filename, 'a') as f:
-            string = ','.join(( str(entry.time), 
-                                str(entry.susceptible),
-                                str(entry.infected), 
-                                str(entry.recovered),
-                                str(entry.infection_rate),
-                                str(entry.curr_isolating),
-                                str(entry.total_isolating),
-                                str(entry.curr_cautious),
-                                str(entry.total_cautious),
-                                str(entry.tracing_notifications),
-                                str(entry.total_geonotified),
-                                str(entry.unnecessary_isolations)
-                                ))
             f.write(string+'\n')
-            print(string.replace(',','\t'))
+        print(string.replace(',','\t'))
+
+    def log_lines(self, entries):
+        """
+        Write several entries at once, without echoing them.
+        """
+        entries = list(entries)
+        super().log_lines(entries)
+        with open(self.filename, 'a') as f:
+            for entry in entries:
+                f.write(self.format_entry(entry) + '\n')
+
+    def format_entry(self, entry):
+        return ','.join(str(value) for value in self.row_of(entry))
 
 
 class LogEntry:
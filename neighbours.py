@@ -0,0 +1,121 @@
+"""
+Verlet-style neighbour lists, an alternative to searching the grid around an
+agent every time its neighbours are needed.
+
+Each agent has a reference position, where it last rebuilt its list, and a
+list of every agent whose reference position is within INFECTION_RADIUS +
+skin of its own (by Chebyshev distance). As long as no agent strays more than
+skin/2 from its reference position, any two agents within INFECTION_RADIUS
+of each other are in each other's lists, so a search only has to filter the
+agent's list by exact position. An agent that strays further rebuilds its
+list from a spatial hash of reference positions, and updates the lists of
+the agents it gains or loses as neighbours, so that lists stay symmetric.
+"""
+
+
+class NeighbourLists:
+
+    def __init__(self, width:int, height:int, radius:int, skin:int):
+        """
+        width:  Width of the world
+        height: Height of the world
+        radius: Search radius the lists are kept for
+        skin:   Extra distance covered by the lists, allowing agents to move
+                up to skin // 2 spaces before their list must be rebuilt
+        """
+
+        self.width = width
+        self.height = height
+        self.radius = radius
+        self.reach = radius + skin
+        self.max_drift = skin // 2
+
+        # Neighbour list and reference position of each agent
+        self.lists = dict()
+        self.refs = dict()
+        # Spatial hash of reference positions, in cells of size <reach>
+        self.cells = dict()
+        # Agents that must rebuild their list before the next search
+        self.stale = dict()
+
+
+    def cell_of(self, x:int, y:int) -> tuple:
+        return (x // self.reach, y // self.reach)
+
+
+    def moved(self, agent) -> None:
+        """
+        Note that an agent has been placed or moved; its list will be rebuilt
+        before the next search if it has strayed too far.
+        """
+
+        ref = self.refs.get(agent)
+        if (ref is None or abs(agent.x - ref[0]) > self.max_drift
+                or abs(agent.y - ref[1]) > self.max_drift):
+            self.stale[agent] = None
+
+
+    def refresh(self) -> None:
+        """
+        Rebuild the lists of every stale agent.
+        """
+
+        for agent in self.stale:
+            self.rebuild(agent)
+        self.stale = dict()
+
+
+    def rebuild(self, agent) -> None:
+        """
+        Move an agent's reference position to where it is now, and update its
+        list and those of the agents it gains or loses as neighbours.
+        """
+
+        old_ref = self.refs.get(agent)
+        if old_ref is not None:
+            self.cells[self.cell_of(*old_ref)].discard(agent)
+
+        x, y = agent.x, agent.y
+        self.refs[agent] = (x, y)
+        cell = self.cell_of(x, y)
+        self.cells.setdefault(cell, set()).add(agent)
+
+        reach = self.reach
+        found = set()
+        cx, cy = cell
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for other in self.cells.get((i, j), ()):
+                    ox, oy = self.refs[other]
+                    if abs(ox - x) <= reach and abs(oy - y) <= reach:
+                        found.add(other)
+        found.discard(agent)
+
+        old = self.lists.get(agent, set())
+        for other in old - found:
+            self.lists[other].discard(agent)
+        for other in found - old:
+            self.lists[other].add(agent)
+        self.lists[agent] = found
+
+
+    def search(self, agent, radius:int) -> list:
+        """
+        Get the agents found by Environment.localized_search() for <agent>, in
+        the same order: column by column over the search area.
+        """
+
+        if self.stale:
+            self.refresh()
+
+        x, y = agent.x, agent.y
+        # Same search area as Environment.localized_search()
+        min_x = max(0, x - radius)
+        max_x = min(x + radius, self.width - 1)
+        min_y = max(0, y - radius)
+        max_y = min(y + radius, self.height - 1)
+
+        found = [n for n in self.lists[agent]
+                 if min_x <= n.x < max_x and min_y <= n.y < max_y]
+        found.sort(key=lambda n: (n.x, n.y))
+        return found
@@ -1,15 +1,26 @@
-import numpy as np
-
 class Object:
     """
     Base class for all elements that can exist in an environment.
 
     X and Y coordinates are managed by the environment class but stored in objects
     """
+
+    # Slotted, like all classes that are instantiated once per agent, to keep
+    # large populations compact
+    __slots__ = ('parent', 'x', 'y', 'old_x', 'old_y', 'index')
     
     def __init__(self, parent, x:int, y:int):
         self.parent = parent
         # Object's current position
-        self.pos = np.array([x, y])
-        # Variable containing the object's last position
-        self.old_pos = self.pos 
+        self.x = x
+        self.y = y
+        # Object's last position
+        self.old_x = x
+        self.old_y = y
+
+    @property
+    def pos(self) -> tuple:
+        """
+        The object's current position, as an (x, y) pair.
+        """
+        return (self.x, self.y)
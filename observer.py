@@ -0,0 +1,30 @@
+"""
+Observers watch an environment as it runs, without taking part in the
+simulation: recording it, displaying it, or gathering statistics. Attach
+one with Environment.add_observer().
+"""
+
+
+class Observer:
+    """
+    Abstract class for all observers.
+    """
+
+    def attach(self, env) -> None:
+        """
+        Called when the observer is added to an environment.
+        """
+        pass
+
+    def observe(self, env) -> None:
+        """
+        Called at the end of every tick the environment simulates, once all
+        agents have moved.
+        """
+        pass
+
+    def close(self, env) -> None:
+        """
+        Called when the environment's run ends.
+        """
+        pass
@@ -0,0 +1,404 @@
+"""
+Occupancy backends track which object, if any, sits in each cell of an
+environment. The Environment only talks to its backend through the interface
+of Occupancy, so the grid representation can be chosen to suit the world:
+
+- CellGrid:         A dense 2D grid of Cells. Fast for crowded worlds, but
+                    allocates a Cell for every cell in the world.
+- SparseOccupancy:  A hash map from packed coordinate to object index. Memory
+                    scales with the number of objects rather than the size of
+                    the world, which suits large, thinly-populated worlds.
+- MemmapOccupancy:  A dense grid of object indices stored in memory-mapped
+                    chunk files, for dense worlds too large to hold in RAM.
+"""
+from collections import OrderedDict
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from cell import Cell
+from objects import Object
+from simulation_parameters import SimConfig
+
+
+class Occupancy:
+    """
+    Abstract class for all occupancy backends.
+    """
+
+    # Name of the backend, as given in config.OCCUPANCY_BACKEND
+    name = None
+
+    def __init__(self, width:int, height:int):
+        self.width = width
+        self.height = height
+
+    def add_object(self, obj:Object, x:int, y:int) -> None:
+        """
+        Place an object in the cell at (x, y).
+
+        raises: RuntimeError, if the cell is already occupied.
+        """
+        raise NotImplementedError
+
+    def remove_object(self, x:int, y:int) -> None:
+        """
+        Empty the cell at (x, y).
+        """
+        raise NotImplementedError
+
+    def get_object(self, x:int, y:int) -> Object:
+        """
+        Get the object in the cell at (x, y), or None if the cell is empty.
+        """
+        raise NotImplementedError
+
+    def is_occupied(self, x:int, y:int) -> bool:
+        return self.get_object(x, y) is not None
+
+    def objects_in(self, min_x:int, max_x:int, min_y:int, max_y:int) -> list:
+        """
+        Get all objects in the cells min_x <= x < max_x, min_y <= y < max_y,
+        visiting the cells column by column.
+        """
+
+        found = list()
+        for i in range(min_x, max_x):
+            for j in range(min_y, max_y):
+                obj = self.get_object(i, j)
+                if obj is not None:
+                    found.append(obj)
+        return found
+
+    def visiting_order(self, agents:list) -> list:
+        """
+        Get the order in which the environment should update its agents this
+        tick. Backends that benefit from spatially coherent access may reorder
+        them; by default, agents are visited in the order they were added.
+        """
+        return agents
+
+    def close(self) -> None:
+        """
+        Release any resources held by the backend.
+        """
+        pass
+
+
+class CellGrid(Occupancy):
+    """
+    Dense occupancy backend: a 2D list of Cells covering the whole world.
+    """
+
+    name = 'dense'
+
+    def __init__(self, width:int, height:int):
+        super().__init__(width, height)
+
+        self.cells = list() # 2D list, forming a grid
+        for y in range(height):
+            row = list()
+            for x in range(width):
+                row.append(Cell())
+            self.cells.append(row)
+
+    def add_object(self, obj:Object, x:int, y:int) -> None:
+        self.cells[y][x].add_object(obj)
+
+    def remove_object(self, x:int, y:int) -> None:
+        self.cells[y][x].remove_object()
+
+    def get_object(self, x:int, y:int) -> Object:
+        return self.cells[y][x].object
+
+    def is_occupied(self, x:int, y:int) -> bool:
+        return self.cells[y][x].is_occupied()
+
+
+class SparseOccupancy(Occupancy):
+    """
+    Sparse occupancy backend: a hash map from packed coordinate (y*width + x)
+    to the index of the object in that cell. Empty cells cost nothing.
+    """
+
+    name = 'sparse'
+
+    def __init__(self, width:int, height:int, objects:list):
+        """
+        objects:    The list that object indices refer to. Objects placed
+                    through this backend must have an 'index' attribute giving
+                    their position in this list.
+        """
+
+        super().__init__(width, height)
+        self.objects = objects
+        self.occupants = dict()
+
+    def add_object(self, obj:Object, x:int, y:int) -> None:
+        key = y * self.width + x
+        if key in self.occupants:
+            raise RuntimeError('Cell is already occupied')
+        self.occupants[key] = obj.index
+
+    def remove_object(self, x:int, y:int) -> None:
+        self.occupants.pop(y * self.width + x, None)
+
+    def get_object(self, x:int, y:int) -> Object:
+        index = self.occupants.get(y * self.width + x)
+        if index is None:
+            return None
+        return self.objects[index]
+
+    def is_occupied(self, x:int, y:int) -> bool:
+        return (y * self.width + x) in self.occupants
+
+    def objects_in(self, min_x:int, max_x:int, min_y:int, max_y:int) -> list:
+        found = list()
+        occupants = self.occupants
+        for i in range(min_x, max_x):
+            for key in range(min_y * self.width + i, max_y * self.width + i,
+                             self.width):
+                index = occupants.get(key)
+                if index is not None:
+                    found.append(self.objects[index])
+        return found
+
+
+class MemmapLayer:
+    """
+    A 2D array stored on disk as square chunk files, each mapped into memory
+    with numpy.memmap the first time it is accessed. Chunk files are created
+    lazily, so untouched parts of the world take up no space, and only the
+    <max_open> most recently used chunks are kept mapped; the OS page cache
+    decides how much of those actually stays in RAM.
+    """
+
+    def __init__(self, width:int, height:int, dtype, directory:str, name:str,
+                    chunk_size:int, max_open:int):
+        """
+        width:      Width of the array
+        height:     Height of the array
+        dtype:      Data type of the array's elements
+        directory:  Directory in which to store the chunk files
+        name:       Prefix for the chunk file names
+        chunk_size: Width and height of each chunk
+        max_open:   Maximum number of chunks mapped at once
+        """
+
+        self.width = width
+        self.height = height
+        self.dtype = dtype
+        self.directory = directory
+        self.name = name
+        self.chunk_size = chunk_size
+        self.max_open = max_open
+
+        # Mapped chunks, keyed by (chunk_x, chunk_y), least recently used first
+        self.chunks = OrderedDict()
+
+
+    def chunk(self, cx:int, cy:int) -> np.memmap:
+        """
+        Get the chunk at chunk coordinates (cx, cy), mapping it if necessary.
+        """
+
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        path = os.path.join(self.directory, f'{self.name}_{cx}_{cy}.dat')
+        # Chunks along the far edges of the world may be cut short
+        shape = (min(self.chunk_size, self.height - cy * self.chunk_size),
+                 min(self.chunk_size, self.width - cx * self.chunk_size))
+        mode = 'r+' if os.path.exists(path) else 'w+'
+        chunk = np.memmap(path, dtype=self.dtype, mode=mode, shape=shape)
+
+        self.chunks[key] = chunk
+        if len(self.chunks) > self.max_open:
+            _, evicted = self.chunks.popitem(last=False)
+            evicted.flush()
+        return chunk
+
+
+    def get(self, x:int, y:int):
+        cs = self.chunk_size
+        return self.chunk(x // cs, y // cs)[y % cs, x % cs]
+
+
+    def set(self, x:int, y:int, value) -> None:
+        cs = self.chunk_size
+        self.chunk(x // cs, y // cs)[y % cs, x % cs] = value
+
+
+    def window(self, min_x:int, max_x:int, min_y:int, max_y:int) -> np.ndarray:
+        """
+        Get the contents of the area min_x <= x < max_x, min_y <= y < max_y.
+        """
+
+        if max_x <= min_x or max_y <= min_y:
+            return np.zeros((max(0, max_y - min_y), max(0, max_x - min_x)),
+                            dtype=self.dtype)
+
+        cs = self.chunk_size
+        cx0, cx1 = min_x // cs, (max_x - 1) // cs
+        cy0, cy1 = min_y // cs, (max_y - 1) // cs
+
+        # Usually the whole area lies within a single chunk
+        if cx0 == cx1 and cy0 == cy1:
+            return self.chunk(cx0, cy0)[min_y - cy0*cs:max_y - cy0*cs,
+                                        min_x - cx0*cs:max_x - cx0*cs]
+
+        area = np.empty((max_y - min_y, max_x - min_x), dtype=self.dtype)
+        for cy in range(cy0, cy1 + 1):
+            y0 = max(min_y, cy * cs)
+            y1 = min(max_y, (cy + 1) * cs)
+            for cx in range(cx0, cx1 + 1):
+                x0 = max(min_x, cx * cs)
+                x1 = min(max_x, (cx + 1) * cs)
+                area[y0 - min_y:y1 - min_y, x0 - min_x:x1 - min_x] = \
+                    self.chunk(cx, cy)[y0 - cy*cs:y1 - cy*cs, x0 - cx*cs:x1 - cx*cs]
+        return area
+
+
+    def close(self) -> None:
+        for chunk in self.chunks.values():
+            chunk.flush()
+        self.chunks.clear()
+
+
+class MemmapOccupancy(Occupancy):
+    """
+    Dense occupancy backend held in a MemmapLayer of object indices (plus
+    one, so that 0 means empty).
+
+    To keep the chunks being worked on in the page cache, agents are visited
+    in order of the chunk they are standing in rather than in the order they
+    were added.
+    """
+
+    name = 'memmap'
+
+    def __init__(self, width:int, height:int, objects:list, directory:str,
+                    chunk_size:int, max_open:int):
+        """
+        objects:    The list that object indices refer to; see SparseOccupancy
+        directory:  Directory in which to make the run's own subdirectory
+                    for the chunk files, deleted on close(), so that runs
+                    never see each other's chunks. If None, the system's
+                    temporary directory is used.
+        chunk_size: Width and height of each chunk
+        max_open:   Maximum number of chunks mapped at once
+        """
+
+        super().__init__(width, height)
+        self.objects = objects
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='occupancy-', dir=directory)
+
+        self.layer = MemmapLayer(width, height, np.int32, self.directory,
+                                 'occupancy', chunk_size, max_open)
+        self.order = list()
+
+    def add_object(self, obj:Object, x:int, y:int) -> None:
+        if self.layer.get(x, y):
+            raise RuntimeError('Cell is already occupied')
+        self.layer.set(x, y, obj.index + 1)
+
+    def remove_object(self, x:int, y:int) -> None:
+        self.layer.set(x, y, 0)
+
+    def get_object(self, x:int, y:int) -> Object:
+        code = int(self.layer.get(x, y))
+        if code == 0:
+            return None
+        return self.objects[code - 1]
+
+    def is_occupied(self, x:int, y:int) -> bool:
+        return self.layer.get(x, y) != 0
+
+    def objects_in(self, min_x:int, max_x:int, min_y:int, max_y:int) -> list:
+        # Transposed, to visit cells column by column
+        window = self.layer.window(min_x, max_x, min_y, max_y).T
+        return [self.objects[code - 1]
+                for code in window[window.nonzero()].tolist()]
+
+    def visiting_order(self, agents:list) -> list:
+        """
+        Overrides Occupancy.visiting_order(), sorting agents by the chunk they
+        are standing in. Agents move at most one space per tick, so the order
+        from the last tick is nearly sorted and cheap to re-sort.
+        """
+
+        if len(self.order) != len(agents):
+            self.order = list(agents)
+        cs = self.layer.chunk_size
+        chunks_x = -(-self.width // cs)
+
+        def chunk_of(agent):
+            return (agent.y // cs) * chunks_x + agent.x // cs
+
+        self.order.sort(key=chunk_of)
+        return self.order
+
+    def close(self) -> None:
+        self.layer.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def resolve_backend(width:int, height:int, config:SimConfig) -> str:
+    """
+    Get the name of the occupancy backend that create_occupancy() would use
+    for a world. If config.OCCUPANCY_BACKEND is 'auto', a sparse backend is
+    used when the world would be filled to less than
+    config.SPARSE_OCCUPANCY_DENSITY, and a dense one otherwise; the memmap
+    backend is only used when asked for by name.
+    """
+
+    backend = config.OCCUPANCY_BACKEND
+    if backend == 'auto':
+        density = config.NUM_AGENTS / (width * height)
+        if density < config.SPARSE_OCCUPANCY_DENSITY:
+            backend = 'sparse'
+        else:
+            backend = 'dense'
+    return backend
+
+
+def visiting_order_name(backend:str, config:SimConfig) -> str:
+    """
+    Describe the order in which a backend has the environment visit agents
+    (see Occupancy.visiting_order()). Runs whose descriptions match move
+    their agents in the same order.
+    """
+
+    if backend == 'memmap':
+        return f'by chunks of {config.MEMMAP_CHUNK_SIZE}'
+    return 'as added'
+
+
+def create_occupancy(width:int, height:int, config:SimConfig,
+                        objects:list) -> Occupancy:
+    """
+    Create the occupancy backend named by config.OCCUPANCY_BACKEND (see
+    resolve_backend()).
+
+    objects:    The environment's list of agents, which a sparse backend's
+                indices refer to
+    """
+
+    backend = resolve_backend(width, height, config)
+    if backend == 'dense':
+        return CellGrid(width, height)
+    elif backend == 'sparse':
+        return SparseOccupancy(width, height, objects)
+    elif backend == 'memmap':
+        return MemmapOccupancy(width, height, objects, config.MEMMAP_DIRECTORY,
+                               config.MEMMAP_CHUNK_SIZE,
+                               config.MEMMAP_MAX_OPEN_CHUNKS)
+    else:
+        raise ValueError(f'Unknown occupancy backend: {backend}')
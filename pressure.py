@@ -0,0 +1,77 @@
+"""
+Infection pressure computed over the grid as a whole, rather than one pair of
+agents at a time. Contagious agents are rasterized into a grid, and the number
+of them within reach of any cell is read off a summed-area table (a 2D
+cumulative sum) of that grid, so the cost depends on the area covered rather
+than on how many agents are crowded together.
+"""
+import numpy as np
+
+
+def exposure_counts(source_x:np.ndarray, source_y:np.ndarray,
+                        target_x:np.ndarray, target_y:np.ndarray,
+                        radius:int, width:int, height:int) -> np.ndarray:
+    """
+    Count, for each target position, the source positions within <radius>
+    cells of it (counting diagonals as 1, i.e. within the (2r+1)x(2r+1) box
+    centred on the target).
+
+    source_x, source_y: Coordinates of the sources (e.g. contagious agents)
+    target_x, target_y: Coordinates of the targets (e.g. susceptible agents)
+    radius:             Reach of each source, in cells
+    width, height:      Size of the world
+
+    returns: Array of counts, one per target
+    """
+
+    counts = np.zeros(len(target_x), dtype=np.int64)
+    if len(source_x) == 0 or len(target_x) == 0:
+        return counts
+
+    # Only the area that some source can reach needs rasterizing
+    x0 = max(0, int(source_x.min()) - radius)
+    x1 = min(width, int(source_x.max()) + radius + 1)
+    y0 = max(0, int(source_y.min()) - radius)
+    y1 = min(height, int(source_y.max()) + radius + 1)
+
+    grid = np.zeros((y1 - y0, x1 - x0), dtype=np.int32)
+    np.add.at(grid, (source_y - y0, source_x - x0), 1)
+
+    # Summed-area table, padded with a row and column of zeros so that
+    # table[j, i] is the number of sources in grid[:j, :i]
+    table = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(grid, axis=0), axis=1, out=table[1:, 1:])
+
+    # Box around each target, clipped to the rasterized area; targets the
+    # sources cannot reach end up with an empty box
+    left = np.clip(target_x - radius - x0, 0, x1 - x0)
+    right = np.clip(target_x + radius + 1 - x0, 0, x1 - x0)
+    top = np.clip(target_y - radius - y0, 0, y1 - y0)
+    bottom = np.clip(target_y + radius + 1 - y0, 0, y1 - y0)
+
+    counts[:] = (table[bottom, right] - table[top, right]
+                 - table[bottom, left] + table[top, left])
+    return counts
+
+
+def infection_chances(exposures:np.ndarray, probability:float) -> np.ndarray:
+    """
+    Get the chance of infection of each target, given how many contagious
+    agents each is exposed to. Each exposure is an independent chance of
+    infection, so a target exposed k times is infected with probability
+    1-(1-p)^k.
+    """
+
+    return 1 - (1 - probability) ** exposures
+
+
+def infection_draws(exposures:np.ndarray, probability:float,
+                        rng:np.random.Generator) -> np.ndarray:
+    """
+    Decide which targets become infected, given how many contagious agents
+    each is exposed to (see infection_chances()).
+
+    returns: Boolean array, True for each target that becomes infected
+    """
+
+    return rng.random(len(exposures)) < infection_chances(exposures, probability)
@@ -0,0 +1,148 @@
+"""
+Colours of the simulation's views, and rasterization of its state into
+images, shared by the window, the viewer and the exporters.
+"""
+import numpy as np
+
+from sir import SIR_status as sir
+
+# Colour values
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+GREEN = (0, 255, 0)
+ORANGE = (255, 128, 0)
+YELLOW = (255, 255, 0)
+DARK_YELLOW = (120, 120, 0)
+PURPLE = (255, 0, 255)
+BLUE_GRAY = (70, 70, 80)
+PINK = (255, 128, 200)
+
+
+HOME_COLOR = GREEN
+WORK_COLOR = BLUE
+
+agent_colors = {
+    sir.SUSCEPTIBLE: DARK_YELLOW,
+    sir.INCUBATING_SAFE: YELLOW,
+    sir.INCUBATING_CONTAGIOUS: ORANGE,
+    sir.SYMPTOMATIC_MILD: PINK,
+    sir.SYMPTOMATIC_SEVERE: RED,
+    sir.RECOVERED: PURPLE
+}
+
+# Colour of each SIR status, indexed by the status' value
+PALETTE = np.zeros((max(s.value for s in sir) + 1, 3), dtype=np.uint8)
+for status, color in agent_colors.items():
+    PALETTE[status.value] = color
+
+
+def agent_positions(env) -> np.ndarray:
+    """
+    Get the position of every agent, as an int32 array of shape (agents, 2).
+    """
+
+    n = len(env.agents)
+    positions = np.fromiter((c for a in env.agents for c in (a.x, a.y)),
+                            dtype=np.int32, count=2 * n)
+    return positions.reshape(n, 2)
+
+
+def agent_status(env) -> np.ndarray:
+    """
+    Get the SIR status value of every agent, as a uint8 array.
+    """
+
+    return np.fromiter((a.infection.status.value for a in env.agents),
+                       dtype=np.uint8, count=len(env.agents))
+
+
+def rasterize(width:int, height:int, positions:np.ndarray, status:np.ndarray,
+              home:np.ndarray=None, work:np.ndarray=None,
+              daytime:bool=True, region:tuple=None) -> np.ndarray:
+    """
+    Draw the world at one pixel per cell, as window.py does: home and work
+    points, then agents coloured by status, on a white background (blue-gray
+    at night).
+
+    positions:  Position of each agent, of shape (agents, 2)
+    status:     SIR status value of each agent
+    home, work: Home and work point of each agent, if they are to be drawn
+    region:     Area to draw, as (x0, y0, x1, y1); the whole world if None.
+                Only the points inside it are drawn.
+
+    returns: RGB image as a uint8 array of shape (y1 - y0, x1 - x0, 3)
+    """
+
+    x0, y0, x1, y1 = region if region is not None else (0, 0, width, height)
+    frame = np.empty((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+    frame[:] = WHITE if daytime else BLUE_GRAY
+    if home is not None:
+        home = clip_points(home, region)
+        frame[home[:, 1] - y0, home[:, 0] - x0] = HOME_COLOR
+    if work is not None:
+        work = clip_points(work, region)
+        frame[work[:, 1] - y0, work[:, 0] - x0] = WORK_COLOR
+    if region is not None:
+        inside = in_region(positions, region)
+        positions = positions[inside]
+        status = status[inside]
+    frame[positions[:, 1] - y0, positions[:, 0] - x0] = PALETTE[status]
+    return frame
+
+
+def overview(positions:np.ndarray, status:np.ndarray, region:tuple,
+             factor:int, daytime:bool=True) -> np.ndarray:
+    """
+    Draw an area of the world at one pixel per <factor> x <factor> block of
+    cells. Each pixel is the mean colour of the agents in its block, blended
+    into the background by how crowded the block is compared to the most
+    crowded one.
+
+    positions:  Position of each agent, of shape (agents, 2)
+    status:     SIR status value of each agent
+    region:     Area to draw, as (x0, y0, x1, y1)
+
+    returns: RGB image as a uint8 array of shape
+             (ceil((y1 - y0) / factor), ceil((x1 - x0) / factor), 3)
+    """
+
+    x0, y0, x1, y1 = region
+    bins_x = -(-(x1 - x0) // factor)
+    bins_y = -(-(y1 - y0) // factor)
+    inside = in_region(positions, region)
+    positions = positions[inside]
+    colors = PALETTE[status[inside]].astype(np.float64)
+
+    bins = ((positions[:, 1] - y0) // factor) * bins_x + (positions[:, 0] - x0) // factor
+    # Work on the occupied blocks only; there are far fewer of them than
+    # blocks when zoomed out over a large world
+    occupied, which, counts = np.unique(bins, return_inverse=True, return_counts=True)
+    sums = np.stack([np.bincount(which, weights=colors[:, c], minlength=len(occupied))
+                     for c in range(3)], axis=1)
+    mean = sums / counts[:, None]
+    # Square root, so that sparse blocks still show
+    alpha = np.sqrt(counts / max(counts.max(initial=0), 1))[:, None]
+
+    background = WHITE if daytime else BLUE_GRAY
+    frame = np.empty((bins_y * bins_x, 3), dtype=np.uint8)
+    frame[:] = background
+    blend = np.array(background, dtype=np.float64) * (1 - alpha) + mean * alpha
+    frame[occupied] = blend.astype(np.uint8)
+    return frame.reshape(bins_y, bins_x, 3)
+
+
+def in_region(points:np.ndarray, region:tuple) -> np.ndarray:
+    """
+    Get a mask of the points inside a region (x0, y0, x1, y1).
+    """
+
+    x0, y0, x1, y1 = region
+    x = points[:, 0]
+    y = points[:, 1]
+    return (x >= x0) & (x < x1) & (y >= y0) & (y < y1)
+
+
+def clip_points(points:np.ndarray, region:tuple) -> np.ndarray:
+    return points if region is None else points[in_region(points, region)]
@@ -0,0 +1,171 @@
+"""
+Programmatic interface to the simulation, for running it from other Python
+code (parameter sweeps, calibration, notebooks) without the window, and
+without writing anything to disk.
+
+    sim = Simulation(SimConfig('D', 2))
+    results = sim.run()
+    results['infected']     # Infected count in each tick, as an array
+"""
+import ast
+import math
+import numpy as np
+import random
+
+from environment import Environment
+from simulation_parameters import SimConfig
+from trajectory import ReplayEnvironment, Trajectory
+
+
+def make_config(mode:str, severity:int, overrides:dict=None) -> SimConfig:
+    """
+    Build the SimConfig for a response mode and severity, with some of its
+    parameters overridden.
+
+    overrides:  SimConfig attributes to set, e.g. {'CAUTION_THRESHOLD': 3}.
+                MODEL_D_CONTAGIOUS_TIME is rederived from the stage durations
+                unless it is overridden itself.
+
+    raises: ValueError if an override is not a SimConfig attribute.
+    """
+
+    config = SimConfig(mode, severity)
+    overrides = overrides or dict()
+    for name, value in overrides.items():
+        if name.startswith('_') or not hasattr(config, name):
+            raise ValueError(f'Unknown parameter: {name}')
+        setattr(config, name, value)
+    if 'MODEL_D_CONTAGIOUS_TIME' not in overrides:
+        config.MODEL_D_CONTAGIOUS_TIME = (config.INCUBATION_CONTAGIOUS_TIME
+                                          - config.MILD_SYMPTOM_TIME)
+    return config
+
+
+def parse_overrides(spec:str) -> dict:
+    """
+    Parse SimConfig overrides given as NAME=VALUE[,...], where each value is
+    a Python literal, e.g. 'CAUTION_THRESHOLD=3,SYMPTOM_TESTING_LAG=1'.
+
+    raises: ValueError if a value is not a literal.
+    """
+
+    overrides = dict()
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        try:
+            overrides[name.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            raise ValueError(f'invalid parameter: {item}')
+    return overrides
+
+
+def spawn_agents(env:Environment, config:SimConfig) -> None:
+    """
+    Spawn in agents, assigning them home and work points.
+
+    raises: ValueError if the world has too few spaces for one home and one
+            work point per agent.
+    """
+
+    # Ensure that there are enough spaces in the gridworld to allow for one
+    # work and one home point per agent.
+    if not config.NUM_AGENTS*2 < config.WORLD_HEIGHT*config.WORLD_WIDTH:
+        raise ValueError('Not enough world space to spawn provided number of agents')
+
+    coord_list = list()
+
+    # Generate list of all coordinate pairs (i.e. all cells)
+    for x in range(config.WORLD_WIDTH):
+        for y in range(config.WORLD_HEIGHT):
+            coord_list.append((x, y))
+
+    # Shuffle the list
+    env.stream('spawn').shuffle(coord_list)
+
+    # For each agent, pop two coordinates off the stack to use as their home
+    # and work points. This avoids coordinate re-use and is much more efficient
+    # than checking which coords have been used over and over.
+    for n in range(config.NUM_AGENTS):
+        home_point = coord_list.pop()
+        work_point = coord_list.pop()
+        env.add_agent(home_point, work_point)
+
+
+def infect_initial(env:Environment, config:SimConfig) -> None:
+    """
+    Infect the first INITIAL_INFECTED_PERCENT of the agents.
+    """
+
+    for i in range(int(math.ceil(config.NUM_AGENTS * config.INITIAL_INFECTED_PERCENT))):
+        env.infect_agent(env.agents[i])
+
+
+class Simulation:
+    """
+    One run of the simulation, set up and ready to tick, whose results are
+    returned as arrays rather than written to log/.
+    """
+
+    def __init__(self, config:SimConfig, run_identifier:str='simulation',
+                 output:bool=False, trajectory:Trajectory=None):
+        """
+        config:         Simulation parameters. The random module is seeded
+                        with config.RNG_SEED, if set.
+        run_identifier: Name of the run; only used for its log directory,
+                        where it must be of the form mode<X>_sev<Y>[_...]
+        output:         Whether to also write the log, plot and contact log to
+                        log/<run_identifier>/, as window.py does
+        trajectory:     Recording to replay (mode A only; see trajectory.py),
+                        which brings its own world and agents
+        """
+
+        self.cfg = config
+        if config.RNG_SEED is not None:
+            random.seed(config.RNG_SEED)
+
+        if trajectory is not None:
+            self.env = ReplayEnvironment(trajectory, config, run_identifier,
+                                         output=output)
+        else:
+            self.env = Environment(config.WORLD_WIDTH, config.WORLD_HEIGHT, config,
+                                   run_identifier, output=output)
+            spawn_agents(self.env, config)
+        infect_initial(self.env, config)
+
+
+    def run(self, ticks:int=None) -> dict:
+        """
+        Tick the simulation until it completes, or for at most <ticks> ticks,
+        and return its results so far (see results()). Can be called again to
+        carry on from where the last call stopped.
+        """
+
+        env = self.env
+        stop = math.inf if ticks is None else env.current_time + ticks
+        while not env.complete and env.current_time < stop:
+            env.tick()
+        return self.results()
+
+
+    def results(self) -> dict:
+        """
+        Get the results of the run so far, as a dict of arrays:
+
+        - One per column of the log (logger.COLUMNS), e.g. 'infected', with
+          one element per tick logged
+        - 'status':     SIR_status value of each agent, as ints
+        - 'positions':  Position of each agent, of shape (agents, 2)
+        - 'heatmap_<name>': Each heatmap accumulated so far, if
+          HEATMAP_BIN_SIZE is set (see heatmap.py)
+        """
+
+        results = self.env.logger.arrays()
+        agents = self.env.agents
+        results['status'] = np.array([a.infection.status.value for a in agents],
+                                     dtype=np.int64)
+        results['positions'] = np.array([(a.x, a.y) for a in agents],
+                                        dtype=np.int64).reshape(len(agents), 2)
+        if self.env.heatmaps is not None:
+            for name, grid in self.env.heatmaps.arrays().items():
+                results[f'heatmap_{name}'] = grid
+        return results
@@ -40,6 +40,12 @@ class SimConfig():
 
     # Infection parameters
     INITIAL_INFECTED_PERCENT = 0.02
+    # How infections are decided each tick: 'pairwise' rolls once for every
+    # contagious agent and each of its neighbours in turn; 'field' counts the
+    # contagious agents around every susceptible agent across the whole grid
+    # at once, and infects with probability 1-(1-p)^count in a single
+    # vectorized draw.
+    INFECTION_STAGE = 'pairwise'
     REINFECTION_POSSIBLE = True
     # Chance for agent to go from mild symptoms to recovered state
     # (simulating common flu, etc)
@@ -64,8 +70,60 @@ class SimConfig():
     GEOLOCATION_DISTANCE = 5
 
     RNG_SEED = 2020
+    # Draw random numbers from streams keyed by what they are for, the tick,
+    # and the agents involved, rather than from one global stream, so that
+    # the same agent gets the same draws in runs of every mode (see
+    # streams.py). Runs with the same seed can then be compared in pairs.
+    # Needs an RNG_SEED.
+    COMMON_RANDOM_NUMBERS = False
+
+    # Occupancy backend for the environment's grid: 'dense' (a Cell per grid
+    # space), 'sparse' (a hash map of occupied spaces only), 'memmap' (grid
+    # stored in memory-mapped files, for worlds too large for RAM), or 'auto'
+    # to pick sparse when fewer than SPARSE_OCCUPANCY_DENSITY of the spaces
+    # would be filled by agents, and dense otherwise.
+    OCCUPANCY_BACKEND = 'auto'
+    SPARSE_OCCUPANCY_DENSITY = 0.05
+
+    # Memmap backend settings. Each run keeps its chunk files in a
+    # subdirectory of its own under MEMMAP_DIRECTORY (or the system's
+    # temporary directory if None), deleted at the end of the run. Note that
+    # the memmap backend visits agents in spatial order, so its runs differ
+    # from the other backends' for the same seed.
+    MEMMAP_DIRECTORY = None
+    MEMMAP_CHUNK_SIZE = 512
+    MEMMAP_MAX_OPEN_CHUNKS = 64
+
+    # How agents find their neighbours: 'grid' searches the occupancy grid
+    # around the agent every time, and 'verlet' keeps a list per agent of the
+    # agents within INFECTION_RADIUS + NEIGHBOUR_SKIN, rebuilt only once the
+    # agent has moved more than NEIGHBOUR_SKIN // 2 spaces. Both find the same
+    # neighbours, in the same order.
+    NEIGHBOUR_SEARCH = 'grid'
+    NEIGHBOUR_SKIN = 4
+
+    # What to do once no agent is infected or reacting to the disease, and
+    # nothing but immunity running out can happen: None simulates every tick
+    # in full regardless, 'skip' keeps agents moving but skips contact
+    # tracking, infection and behaviour, and 'stop' ends the run at once,
+    # filling in the rest of the log from the immunity timers. Not used in
+    # tiled runs. Either way the log (every column of logger.COLUMNS) is the
+    # same as a full run's, and with 'skip' so are the agents' final status
+    # and position. Contacts in skipped ticks are not registered, though, so
+    # they are missing from the saved contact log (SAVE_CONTACT_LOG) and the
+    # contacts heatmap, and a stopped run's agents stop moving.
+    QUIESCENCE = None
 
     CONTACT_CULLING = True
+    # Keep every contact in the environment's contact log, and save it to the
+    # run's log directory as .npy files (contacts_tick.npy, contacts_a.npy,
+    # ...) at the end of the run. Not supported in tiled runs.
+    SAVE_CONTACT_LOG = False
+    # Accumulate heatmaps of occupancy, contacts, infections and isolation on
+    # a grid of bins of this many cells square, and save them to the run's
+    # log directory as .npy files (heatmap_occupancy.npy, ...) at the end of
+    # the run (see heatmap.py). None to disable. Not supported in tiled runs.
+    HEATMAP_BIN_SIZE = None
 
     INFECTION_RADIUS = None
     INFECTION_PROBABILITY = None
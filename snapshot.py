@@ -0,0 +1,203 @@
+"""
+Snapshots of a running simulation in shared memory, for viewers in other
+processes (see viewer.py).
+
+A SnapshotPublisher attached to an environment keeps a shared memory block
+holding the home and work point of every agent, and two buffers of their
+positions and statuses. It writes each snapshot into the buffer that is not
+the latest, then marks it the latest, so a viewer always has a complete
+snapshot to read. Each buffer has a sequence number, odd while the buffer is
+being written, so a reader can tell if the publisher lapped it mid-read and
+read again.
+
+The publisher only takes a snapshot once a viewer has read the previous one,
+so a run costs next to nothing to publish while no viewer is watching, and
+no more than one snapshot per frame the viewer draws while one is. Viewers
+attach and detach as they please; neither affects the run.
+"""
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+from observer import Observer
+from render import agent_positions, agent_status
+
+# Fields of the block's header, an array of int64
+NUM_AGENTS = 0
+WIDTH = 1
+HEIGHT = 2
+# Buffer holding the latest complete snapshot
+LATEST = 3
+# Set by readers once they want a new snapshot
+WANTED = 4
+# Set by the publisher once the run has ended
+CLOSED = 5
+# Sequence number, tick, and day/night flag of each buffer
+SEQUENCE = (6, 7)
+TICK = (8, 9)
+DAYTIME = (10, 11)
+HEADER_FIELDS = 12
+
+
+class SnapshotBuffer:
+    """
+    A shared memory block of snapshots, as written by a SnapshotPublisher.
+    """
+
+    def __init__(self, name:str=None, size:tuple=None):
+        """
+        name:   Name of the block: the existing block to attach to, or the
+                name to create a new block under (generated if None)
+        size:   (agents, width, height) of the run to create a new block
+                for; None to attach to an existing block
+        """
+
+        header_bytes = HEADER_FIELDS * np.dtype(np.int64).itemsize
+        if size is not None:
+            num_agents, width, height = size
+            # Home, work, and two buffers of positions (x, y), then two
+            # buffers of statuses
+            total = header_bytes + num_agents * (4 * 2 * np.dtype(np.int32).itemsize + 2)
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=total)
+            self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=self.shm.buf)
+            self.header[:] = 0
+            self.header[NUM_AGENTS] = num_agents
+            self.header[WIDTH] = width
+            self.header[HEIGHT] = height
+        else:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # Before Python 3.13, attaching registers the block with this
+                # process' resource tracker, which would unlink it from under
+                # the publisher when this process exits
+                self.shm = shared_memory.SharedMemory(name=name)
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=self.shm.buf)
+
+        n = int(self.header[NUM_AGENTS])
+        self.num_agents = n
+        self.width = int(self.header[WIDTH])
+        self.height = int(self.header[HEIGHT])
+
+        offset = header_bytes
+        points = list()
+        for i in range(4):
+            points.append(np.ndarray((n, 2), dtype=np.int32, buffer=self.shm.buf,
+                                     offset=offset))
+            offset += n * 2 * np.dtype(np.int32).itemsize
+        self.home, self.work = points[:2]
+        self.positions = points[2:]
+        self.status = list()
+        for i in range(2):
+            self.status.append(np.ndarray(n, dtype=np.uint8, buffer=self.shm.buf,
+                                          offset=offset))
+            offset += n
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+
+    def write(self, positions:np.ndarray, status:np.ndarray, tick:int,
+              daytime:bool) -> None:
+        """
+        Write a snapshot, and make it the latest.
+        """
+
+        b = 1 - int(self.header[LATEST])
+        self.header[SEQUENCE[b]] += 1
+        self.positions[b][:] = positions
+        self.status[b][:] = status
+        self.header[TICK[b]] = tick
+        self.header[DAYTIME[b]] = daytime
+        self.header[SEQUENCE[b]] += 1
+        self.header[LATEST] = b
+        self.header[WANTED] = 0
+
+
+    def read(self) -> tuple:
+        """
+        Copy the latest snapshot, and ask the publisher for a new one.
+
+        returns: (tick, daytime, positions, status), or None if there is no
+                 snapshot yet.
+        """
+
+        while True:
+            b = int(self.header[LATEST])
+            sequence = int(self.header[SEQUENCE[b]])
+            if sequence == 0:
+                return None
+            if sequence % 2:
+                # Lapped by the publisher, which is writing this buffer again
+                continue
+            snapshot = (int(self.header[TICK[b]]), bool(self.header[DAYTIME[b]]),
+                        self.positions[b].copy(), self.status[b].copy())
+            if self.header[SEQUENCE[b]] == sequence:
+                self.header[WANTED] = 1
+                return snapshot
+
+
+    @property
+    def wanted(self) -> bool:
+        return bool(self.header[WANTED])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.header[CLOSED])
+
+
+    def close(self, unlink:bool=False) -> None:
+        # The array views must be released before the block can be closed
+        self.header = None
+        self.home = self.work = None
+        self.positions = self.status = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SnapshotPublisher(Observer):
+    """
+    Observer that publishes snapshots of the agents to a SnapshotBuffer.
+    Attach it once all agents have been added.
+    """
+
+    def __init__(self, name:str=None, interval:int=1):
+        """
+        name:       Name of the shared memory block to create; generated if
+                    None (see .name once attached)
+        interval:   Publish at most once every this many ticks
+        """
+
+        self.name = name
+        self.interval = interval
+        self.buffer = None
+
+
+    def attach(self, env) -> None:
+        self.buffer = SnapshotBuffer(self.name, (len(env.agents), env.canvas_size_x,
+                                                 env.canvas_size_y))
+        self.name = self.buffer.name
+        self.buffer.home[:] = [a.home_point for a in env.agents]
+        self.buffer.work[:] = [a.work_point for a in env.agents]
+        self.publish(env)
+
+
+    def observe(self, env) -> None:
+        if self.buffer.wanted and env.current_time % self.interval == 0:
+            self.publish(env)
+
+
+    def publish(self, env) -> None:
+        self.buffer.write(agent_positions(env), agent_status(env),
+                          env.current_time, env.daytime)
+
+
+    def close(self, env) -> None:
+        # Viewers keep their mapping of the block, and can show the last
+        # snapshot after it is unlinked
+        self.buffer.header[CLOSED] = 1
+        self.buffer.close(unlink=True)
+        self.buffer = None
@@ -0,0 +1,176 @@
+"""
+Keyed random streams, for runs with common random numbers.
+
+Ordinarily, every random draw in a run comes from the global `random` stream,
+in whatever order the draws happen to be made. Runs of different response
+modes make different draws (contact tracing, false alarms, ...) at different
+times, so even with the same seed, the same agent soon sees different
+numbers in each mode, and the noise in the runs is independent.
+
+With common random numbers, each draw instead comes from a stream keyed by
+what the draw is for, the tick it is made in, and the agents involved (e.g.
+('move', tick, agent) or ('infect', tick, target, source)). The same agent
+in the same situation then gets the same draw in every mode, so differences
+between paired runs reflect the modes rather than the noise, and far fewer
+replicates are needed to tell modes apart.
+
+Streams are counter-based, after SplitMix64: a stream's key is a hash of its
+seed and keys, and its n-th number is a hash of the key and n. A stream holds
+nothing but its key and a counter, so streams can be created anywhere, in any
+order, at the cost of a few integer operations.
+"""
+import numpy as np
+
+MASK64 = (1 << 64) - 1
+# Increment of the SplitMix64 counter (2^64 / golden ratio)
+GOLDEN = 0x9E3779B97F4A7C15
+
+# Code of each kind of draw, mixed into the keys of its streams
+KINDS = {
+    'spawn': 1,
+    'move': 2,
+    'infect': 3,
+    'false_alarm': 4,
+}
+
+
+def mix64(z):
+    """
+    SplitMix64 output function; scrambles a 64-bit integer, or each element
+    of an array of np.uint64.
+    """
+
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def combine(key, value):
+    """
+    Mix a value into a key; works on integers and arrays of np.uint64 alike.
+    """
+
+    return mix64(((key ^ value) + GOLDEN) & MASK64)
+
+
+class KeyedStream:
+    """
+    One keyed stream. Provides the part of the random.Random interface that
+    the simulation uses, so that it can stand in for the `random` module.
+    """
+
+    __slots__ = ('key', 'counter')
+
+    def __init__(self, key:int):
+        self.key = key
+        self.counter = 0
+
+    def getrandbits64(self) -> int:
+        self.counter += 1
+        return mix64((self.key + self.counter * GOLDEN) & MASK64)
+
+    def random(self) -> float:
+        """
+        Get a float in [0, 1), with 53 bits of precision.
+        """
+        return (self.getrandbits64() >> 11) * (1.0 / (1 << 53))
+
+    def randbelow(self, n:int) -> int:
+        # Multiply-shift; the bias, at most n / 2^64, is negligible for the
+        # sizes used here
+        return (self.getrandbits64() * n) >> 64
+
+    def randint(self, a:int, b:int) -> int:
+        return a + self.randbelow(b - a + 1)
+
+    def choice(self, seq):
+        return seq[self.randbelow(len(seq))]
+
+    def choices(self, population, weights) -> list:
+        """
+        Pick one element of <population>, with the given relative weights.
+        Returns a list of one element, as random.choices() does.
+        """
+
+        total = 0
+        cumulative = list()
+        for w in weights:
+            total += w
+            cumulative.append(total)
+        point = self.random() * total
+        for i, c in enumerate(cumulative):
+            if point < c:
+                return [population[i]]
+        return [population[-1]]
+
+    def randoms(self, count:int) -> np.ndarray:
+        """
+        Get the next <count> numbers of the stream at once, as an array of
+        floats in [0, 1). Equivalent to calling random() <count> times.
+        """
+
+        counters = np.arange(self.counter + 1, self.counter + count + 1, dtype=np.uint64)
+        self.counter += count
+        bits = mix64(np.uint64(self.key) + counters * np.uint64(GOLDEN))
+        return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
+
+    def shuffle(self, x:list) -> None:
+        """
+        Shuffle a list in place (Fisher-Yates, as random.shuffle()).
+        """
+
+        n = len(x)
+        if n < 2:
+            return
+        # Position to swap each of x[n-1], ..., x[1] with
+        picks = (self.randoms(n - 1) * np.arange(n, 1, -1)).astype(np.int64).tolist()
+        for i, j in zip(range(n - 1, 0, -1), picks):
+            x[i], x[j] = x[j], x[i]
+
+
+class KeyedStreams:
+    """
+    Source of the keyed streams of one run.
+    """
+
+    def __init__(self, seed:int):
+        """
+        seed:   Seed shared by all the streams. Runs to be compared should use
+                the same seed.
+        """
+
+        self.seed = mix64((int(seed) + GOLDEN) & MASK64)
+        # Keys of the (kind, tick) pairs used most recently; draws of a kind
+        # come in bursts within a tick
+        self.prefixes = dict()
+
+    def prefix(self, kind:str, tick:int) -> int:
+        key = self.prefixes.get((kind, tick))
+        if key is None:
+            if len(self.prefixes) >= 2 * len(KINDS):
+                self.prefixes.clear()
+            key = combine(combine(self.seed, KINDS[kind]), tick & MASK64)
+            self.prefixes[(kind, tick)] = key
+        return key
+
+    def stream(self, kind:str, tick:int, *ids:int) -> KeyedStream:
+        """
+        Get the stream for a kind of draw (one of KINDS), made at <tick> and
+        involving the agents with the given global indices.
+        """
+
+        key = self.prefix(kind, tick)
+        for i in ids:
+            key = combine(key, i & MASK64)
+        return KeyedStream(key)
+
+    def uniforms(self, kind:str, tick:int, ids:np.ndarray) -> np.ndarray:
+        """
+        Get the first number of stream(kind, tick, i) for each i in <ids>, in
+        one vectorized step.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64).astype(np.uint64)
+        keys = combine(np.uint64(self.prefix(kind, tick)), ids)
+        bits = mix64(keys + np.uint64(GOLDEN))
+        return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
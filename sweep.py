@@ -0,0 +1,380 @@
+"""
+Adaptive parameter sweeps, for finding where the outcome of a run changes
+sharply with its parameters (e.g. the CAUTION_THRESHOLD past which cautious
+isolation stops containing an outbreak):
+
+    python3 sweep.py D 2 --param CAUTION_THRESHOLD=1:12
+        --param SYMPTOM_TESTING_LAG=0:10 --budget 400
+
+A sweep starts with a coarse grid of LEVELS values per parameter, running
+every point of it a few times with different seeds. It then spends the rest
+of its budget of runs where they tell the most, one batch at a time:
+
+- Between two neighbouring points along one parameter (same values of all
+  the others) whose metrics differ most, by running the point halfway. Each
+  segment is scored by its length in the graph of the metric, with both axes
+  scaled to the ranges seen so far, so steep segments are split first, but
+  long flat ones are not neglected.
+- At points whose mean metrics are most uncertain, by running them again
+  with more seeds, so that noise is not mistaken for a steep change.
+
+Replicate r of every point uses the seed seed+r, so that points are compared
+with common random numbers. Results go to
+log/sweep_mode<mode>_sev<severity>.csv (e.g. log/sweep_modeD_sev2.csv), one
+row per point, with the mean and standard deviation of each metric.
+"""
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+import os
+
+from calibrate import parse_param
+from frames import FrameExporter
+from simulation import Simulation, make_config, parse_overrides
+
+# Outcome metrics a sweep can track, computed from the results of a run
+METRICS = {
+    'peak_infection_rate': lambda r: r['infection_rate'].max(),
+    'peak_tick': lambda r: r['time_ticks'][r['infection_rate'].argmax()],
+    'final_infection_rate': lambda r: r['infection_rate'][-1],
+    'total_isolations': lambda r: r['total_isolated'][-1],
+    'total_cautious': lambda r: r['total_cautious'][-1],
+    'unnecessary_isolations': lambda r: r['unnecessary_isolations'][-1],
+}
+
+# Values per parameter in the initial grid
+LEVELS = 5
+# Segments narrower than this fraction of their parameter's range are not
+# split any further
+MIN_WIDTH = 0.01
+# Weight of a point's uncertainty (standard error of its mean, scaled like
+# the segments) against the length of segments, when choosing what to run
+NOISE_WEIGHT = 2.0
+
+
+# State of each worker process, set by init_worker()
+worker = dict()
+
+
+def init_worker(mode:str, severity:int, fixed:dict, metrics:list, seed:int,
+                export:str, export_every:int) -> None:
+    worker.update(mode=mode, severity=severity, fixed=fixed, metrics=metrics,
+                  seed=seed, export=export, export_every=export_every)
+
+
+def run_point(task:tuple) -> tuple:
+    """
+    Run one replicate of one point, in a worker process.
+
+    task:   (point, overrides, seed)
+
+    returns: (point, metrics), the metrics being in the order of the sweep's.
+    """
+
+    point, overrides, seed = task
+    config = make_config(worker['mode'], worker['severity'],
+                         dict(worker['fixed'], **overrides, RNG_SEED=seed))
+    sim = Simulation(config)
+    if worker['export'] is not None and seed == worker['seed']:
+        # Animate the first replicate of each point
+        name = '_'.join(f'{name}={value}' for name, value in overrides.items())
+        path = os.path.join(worker['export'], name + '.mp4')
+        sim.env.add_observer(FrameExporter(path, worker['export_every']))
+    results = sim.run()
+    return point, [float(METRICS[m](results)) for m in worker['metrics']]
+
+
+class Sweep:
+
+    def __init__(self, mode:str, severity:int, params:list, metrics:list,
+                 fixed:dict=None, replicates:int=3, seed:int=2020,
+                 export:str=None, export_every:int=10):
+        """
+        params:     Parameters to sweep (calibrate.Parameter), with their
+                    ranges
+        metrics:    Names of the METRICS to track
+        fixed:      Other SimConfig overrides, the same for every run
+        replicates: Runs per point to start with
+        seed:       Seed of the first replicate of every point
+        export:     Directory to export an animation of the first replicate
+                    of every point to (see frames.py), if any
+        export_every:
+                    Ticks between the frames of animations
+        """
+
+        self.mode = mode
+        self.severity = severity
+        self.params = params
+        self.metrics = metrics
+        self.fixed = fixed or dict()
+        self.replicates = replicates
+        self.seed = seed
+        self.export = export
+        self.export_every = export_every
+
+        # Metrics of each run of each point, keyed by the tuple of the point's
+        # parameter values
+        self.runs = dict()
+        self.spent = 0
+
+
+    def grid(self) -> list:
+        """
+        Get the points of the initial grid.
+        """
+
+        axes = [sorted(set(p.value(x) for x in np.linspace(p.low, p.high, LEVELS)))
+                for p in self.params]
+        return list(itertools.product(*axes))
+
+
+    def stats(self) -> tuple:
+        """
+        Get the mean and standard error of each metric at each point, as two
+        dicts of arrays keyed by point. The standard error is 0 for points
+        run only once.
+        """
+
+        means = dict()
+        errors = dict()
+        for point, runs in self.runs.items():
+            runs = np.array(runs)
+            means[point] = runs.mean(axis=0)
+            if len(runs) > 1:
+                errors[point] = runs.std(axis=0, ddof=1) / np.sqrt(len(runs))
+            else:
+                errors[point] = np.zeros(len(self.metrics))
+        return means, errors
+
+
+    def scales(self, means:dict) -> np.ndarray:
+        """
+        Get the range of each metric over all points, for scaling them.
+        """
+
+        values = np.array(list(means.values()))
+        scale = values.max(axis=0) - values.min(axis=0)
+        scale[scale == 0] = 1
+        return scale
+
+
+    def segments(self) -> list:
+        """
+        Get every pair of neighbouring points along one parameter, as
+        (axis, a, b) with a below b.
+        """
+
+        segments = list()
+        for axis in range(len(self.params)):
+            lines = dict()
+            for point in self.runs:
+                rest = point[:axis] + point[axis+1:]
+                lines.setdefault(rest, list()).append(point)
+            for line in lines.values():
+                line.sort(key=lambda point: point[axis])
+                for a, b in zip(line, line[1:]):
+                    segments.append((axis, a, b))
+        return segments
+
+
+    def midpoint(self, axis:int, a:tuple, b:tuple) -> tuple:
+        """
+        Get the point halfway along a segment, or None if the segment is too
+        short to split.
+        """
+
+        p = self.params[axis]
+        if (b[axis] - a[axis]) < MIN_WIDTH * (p.high - p.low):
+            return None
+        value = p.value((a[axis] + b[axis]) / 2)
+        if value in (a[axis], b[axis]):
+            return None
+        return a[:axis] + (value,) + a[axis+1:]
+
+
+    def choose(self, count:int) -> list:
+        """
+        Choose up to <count> points to run next, each either new or to be
+        run with more seeds, most informative first.
+        """
+
+        means, errors = self.stats()
+        scale = self.scales(means)
+
+        choices = list()
+        for axis, a, b in self.segments():
+            point = self.midpoint(axis, a, b)
+            if point is None or point in self.runs:
+                continue
+            p = self.params[axis]
+            width = (b[axis] - a[axis]) / (p.high - p.low)
+            height = np.max(np.abs(means[b] - means[a]) / scale)
+            choices.append((np.hypot(width, height), point))
+        for point, error in errors.items():
+            choices.append((NOISE_WEIGHT * np.max(error / scale), point))
+
+        choices.sort(key=lambda choice: -choice[0])
+        chosen = list()
+        for score, point in choices:
+            if score > 0 and point not in chosen:
+                chosen.append(point)
+            if len(chosen) == count:
+                break
+        return chosen
+
+
+    def tasks(self, point:tuple) -> list:
+        """
+        Get the next <replicates> runs of a point.
+        """
+
+        start = len(self.runs.get(point, ()))
+        overrides = {p.name: value for p, value in zip(self.params, point)}
+        return [(point, overrides, self.seed + r)
+                for r in range(start, start + self.replicates)]
+
+
+    def run(self, budget:int, batch:int=None, workers:int=None) -> None:
+        """
+        Run the sweep until <budget> runs have been made, or no point is
+        left worth running.
+
+        batch:      Points to run at a time after the initial grid; one per
+                    worker process by default
+        workers:    Worker processes; one per CPU by default
+
+        raises: ValueError if the budget does not cover the initial grid.
+        """
+
+        grid = self.grid()
+        if len(grid) * self.replicates > budget:
+            raise ValueError(f'Budget of {budget} runs is too small for a grid '
+                             f'of {len(grid)} points with {self.replicates} '
+                             f'replicates')
+        workers = workers or os.cpu_count() or 1
+        batch = batch or workers
+
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(self.mode, self.severity, self.fixed,
+                                            self.metrics, self.seed, self.export,
+                                            self.export_every)) as pool:
+            points = grid
+            while points:
+                tasks = [task for point in points for task in self.tasks(point)]
+                for point, metrics in pool.imap_unordered(run_point, tasks):
+                    self.runs.setdefault(point, list()).append(metrics)
+                self.spent += len(tasks)
+                print(f'{self.spent}/{budget} runs, {len(self.runs)} points')
+
+                count = min(batch, (budget - self.spent) // self.replicates)
+                points = self.choose(count) if count > 0 else list()
+
+
+    def steepest(self, count:int) -> list:
+        """
+        Get the <count> segments over which the metrics change the most,
+        relative to their ranges, as (change, axis, a, b), steepest first.
+        """
+
+        means, _ = self.stats()
+        scale = self.scales(means)
+        changes = [(float(np.max(np.abs(means[b] - means[a]) / scale)), axis, a, b)
+                   for axis, a, b in self.segments()]
+        changes.sort(key=lambda change: -change[0])
+        return changes[:count]
+
+
+    def save(self, path:str) -> None:
+        """
+        Write the mean and standard deviation of each metric at each point to
+        a CSV file.
+        """
+
+        columns = [p.name for p in self.params] + ['runs']
+        for m in self.metrics:
+            columns += [f'mean_{m}', f'sd_{m}']
+        with open(path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for point in sorted(self.runs):
+                runs = np.array(self.runs[point])
+                sd = runs.std(axis=0, ddof=1) if len(runs) > 1 else np.zeros(len(self.metrics))
+                row = list(point) + [len(runs)]
+                for mean, deviation in zip(runs.mean(axis=0), sd):
+                    row += [mean, deviation]
+                f.write(','.join(str(value) for value in row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sweep SimConfig parameters, refining where outcomes '
+                    'change fastest')
+    parser.add_argument('mode')
+    parser.add_argument('severity', type=int)
+    parser.add_argument('--param', action='append', required=True,
+                        metavar='NAME=LOW:HIGH',
+                        help='parameter to sweep, and its range; may be given '
+                             'several times')
+    parser.add_argument('--metric', action='append', choices=METRICS,
+                        help='outcome metric to track; may be given several '
+                             'times (default: peak_infection_rate and '
+                             'total_isolations)')
+    parser.add_argument('--set', action='append', default=list(),
+                        metavar='NAME=VALUE[,...]',
+                        help='other parameters to override in every run, e.g. '
+                             'NUM_AGENTS=2000,WORLD_WIDTH=1200')
+    parser.add_argument('--budget', type=int, required=True,
+                        help='total number of runs')
+    parser.add_argument('--replicates', type=int, default=3,
+                        help='runs per point, and per extra round of a point')
+    parser.add_argument('--seed', type=int, default=2020)
+    parser.add_argument('--export', metavar='DIR',
+                        help='export an animation of the first replicate of '
+                             'every point to DIR')
+    parser.add_argument('--export-every', type=int, default=10, metavar='K',
+                        help='ticks between frames of animations (default: 10)')
+    parser.add_argument('--batch', type=int,
+                        help='points to run at a time (default: one per worker)')
+    parser.add_argument('--workers', type=int,
+                        help='worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    if args.replicates < 1:
+        parser.error(f'invalid number of replicates: {args.replicates}')
+    if args.export_every < 1:
+        parser.error(f'invalid export interval: {args.export_every}')
+    metrics = args.metric or ['peak_infection_rate', 'total_isolations']
+    try:
+        fixed = dict()
+        for spec in args.set:
+            fixed.update(parse_overrides(spec))
+        params = [parse_param(spec, args.mode, args.severity, fixed)
+                  for spec in args.param]
+    except ValueError as e:
+        parser.error(str(e))
+
+    sweep = Sweep(args.mode, args.severity, params, metrics, fixed=fixed,
+                  replicates=args.replicates, seed=args.seed,
+                  export=args.export, export_every=args.export_every)
+    try:
+        sweep.run(args.budget, batch=args.batch, workers=args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.makedirs('log', exist_ok=True)
+    path = os.path.join('log', f'sweep_mode{args.mode}_sev{args.severity}.csv')
+    sweep.save(path)
+    print(f'Results written to {path}')
+
+    print('Steepest changes:')
+    for change, axis, a, b in sweep.steepest(5):
+        name = sweep.params[axis].name
+        others = ', '.join(f'{p.name}={value}' for i, (p, value)
+                           in enumerate(zip(sweep.params, a)) if i != axis)
+        print(f'\t{name} {a[axis]} -> {b[axis]}'
+              + (f' (at {others})' if others else '')
+              + f': {change:.0%} of range')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Tests of calibrate.py. Run with: python3 -m pytest
+"""
+import math
+import numpy as np
+
+import calibrate
+
+
+def test_rejection_limit_scales_cutoff():
+    assert calibrate.rejection_limit(2.0) == calibrate.REJECT_FACTOR * 2.0
+    assert calibrate.rejection_limit(math.inf) == math.inf
+
+
+def test_zero_cutoff_rejects_nothing():
+    # An elite that fits the target exactly leaves a cutoff of zero, after
+    # which candidates must still run in full rather than all be rejected
+    assert calibrate.rejection_limit(0.0) == math.inf
+
+    fixed = {'NUM_AGENTS': 40, 'WORLD_WIDTH': 40, 'WORLD_HEIGHT': 40}
+    # No run infects no one, so every candidate has some error
+    target = np.zeros(2 * calibrate.CHECK_INTERVAL)
+    calibrate.init_worker('A', 2, fixed, target, 'infected', [1])
+    index, error, rejected = calibrate.evaluate(
+        (0, {}, calibrate.rejection_limit(0.0)))
+    assert error > 0
+    assert not rejected
@@ -0,0 +1,57 @@
+"""
+Tests of contactlog.py. Run with: python3 -m pytest
+"""
+import numpy as np
+
+from contactlog import COLUMNS, ContactLog
+
+
+def contact_log(ticks:int=5, agents:int=20, contacts:int=30) -> ContactLog:
+    """
+    Build a log of random contacts between <agents> agents.
+    """
+
+    rng = np.random.default_rng(1)
+    log = ContactLog()
+    for tick in range(ticks):
+        a = rng.integers(0, agents, contacts)
+        b = rng.integers(0, agents, contacts)
+        x, y = rng.integers(0, 50, (2, contacts))
+        log.append(tick, a, b, x, y, rng.integers(0, 3, contacts))
+    return log
+
+
+def test_extract_insert_round_trip():
+    log = contact_log()
+    before = {a: log.contacts_of(a, 0, 4) for a in range(20)}
+
+    moved = log.extract([3, 11, 12])
+    log.remove([3, 11, 12])
+    for a in (3, 11, 12):
+        assert len(log.contacts_of(a, 0, 4)['tick']) == 0
+
+    other = ContactLog()
+    for columns in moved.values():
+        other.insert(columns)
+        log.insert(columns)
+    for a in range(20):
+        for name in COLUMNS:
+            np.testing.assert_array_equal(log.contacts_of(a, 0, 4)[name],
+                                          before[a][name])
+            if a in moved:
+                np.testing.assert_array_equal(other.contacts_of(a, 0, 4)[name],
+                                              before[a][name])
+    # One part per tick, however many agents were inserted
+    assert all(len(parts) == 1 for parts in log.chunks.values())
+
+
+def test_adjacency_round_trip():
+    log = contact_log()
+    indptr, indices, ticks = log.adjacency(1, 3, 20)
+    window = log.window(1, 3)
+    assert indptr[-1] == len(window['a'])
+
+    for a in range(20):
+        mine = log.contacts_of(a, 1, 3)
+        np.testing.assert_array_equal(indices[indptr[a]:indptr[a + 1]], mine['b'])
+        np.testing.assert_array_equal(ticks[indptr[a]:indptr[a + 1]], mine['tick'])
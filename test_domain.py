@@ -0,0 +1,70 @@
+"""
+Tests of the tiled environment of domain.py. Run with: python3 -m pytest
+"""
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+import random
+
+import domain
+from simulation import make_config, spawn_agents, infect_initial
+
+SMALL = {'NUM_AGENTS': 200, 'WORLD_WIDTH': 80, 'WORLD_HEIGHT': 60,
+         'MAXIMUM_TIME': 800}
+
+
+def tiled(iden:str, **overrides) -> domain.TiledEnvironment:
+    config = make_config('D', 2, dict(SMALL, **overrides))
+    # As window.py does; spawning draws from the random module
+    random.seed(config.RNG_SEED)
+    env = domain.TiledEnvironment(config.WORLD_WIDTH, config.WORLD_HEIGHT,
+                                  config, iden, 2, 2)
+    spawn_agents(env, config)
+    infect_initial(env, config)
+    return env
+
+
+def test_reproducible_for_seed_and_layout(tmp_path, monkeypatch):
+    # Tiled runs always log to log/
+    monkeypatch.chdir(tmp_path)
+    logs = list()
+    for iden in ('modeD_sev2_first', 'modeD_sev2_second'):
+        env = tiled(iden)
+        try:
+            for _ in range(100):
+                env.tick()
+        finally:
+            env.shutdown()
+        logs.append(env.logger.arrays())
+    for column, values in logs[0].items():
+        np.testing.assert_array_equal(values, logs[1][column], err_msg=column)
+
+
+def test_failed_worker_releases_halos(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    names = list()
+
+    class RecordedHaloBuffer(domain.HaloBuffer):
+        def __init__(self, *args):
+            super().__init__(*args)
+            names.append(self.name)
+
+    def fail(self, current_time, toggle, notices):
+        if self.tile == 1 and current_time == 3:
+            raise ZeroDivisionError('tile failure')
+        return step(self, current_time, toggle, notices)
+
+    step = domain.TileEnvironment.step
+    # Workers are forked, so they see the patched classes too
+    monkeypatch.setattr(domain, 'HaloBuffer', RecordedHaloBuffer)
+    monkeypatch.setattr(domain.TileEnvironment, 'step', fail)
+
+    env = tiled('modeD_sev2_failing')
+    with pytest.raises(RuntimeError, match='ZeroDivisionError: tile failure'):
+        for _ in range(10):
+            env.tick()
+    assert env.workers is None and env.halos == list()
+    assert len(names) == 4
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
@@ -0,0 +1,23 @@
+"""
+Tests of ensemble.py. Run with: python3 -m pytest
+"""
+import numpy as np
+
+from ensemble import Ensemble
+from simulation import make_config
+
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def test_replicate_independent_of_others(tmp_path, monkeypatch):
+    # Ensembles always log to log/
+    monkeypatch.chdir(tmp_path)
+    config = make_config('B', 2, SMALL)
+    seeds = np.random.SeedSequence(5).spawn(3)
+    alone = Ensemble(config, 'modeB_sev2_alone', 1, seeds=seeds[:1])
+    together = Ensemble(config, 'modeB_sev2_together', 3, seeds=seeds)
+    for _ in range(300):
+        alone.tick()
+        together.tick()
+    np.testing.assert_array_equal(alone.log[0], together.log[0])
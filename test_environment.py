@@ -0,0 +1,58 @@
+"""
+Tests of environment.py. Run with: python3 -m pytest
+"""
+import numpy as np
+import pytest
+
+from logger import COLUMNS
+from simulation import Simulation, make_config
+from trajectory import Trajectory, TrajectoryRecorder
+
+MODES = ('A', 'B', 'C', 'D')
+# A small, crowded world, so that runs are quick but agents often meet, with
+# an epidemic that dies out well before the end
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def simulate(mode:str, **overrides) -> Simulation:
+    return Simulation(make_config(mode, 2, dict(SMALL, **overrides)))
+
+
+def assert_same_logs(results:dict, other:dict) -> None:
+    for column in COLUMNS:
+        np.testing.assert_array_equal(results[column], other[column], err_msg=column)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_quiescence_matches_full_run(mode):
+    full = simulate(mode, HEATMAP_BIN_SIZE=5).run()
+
+    # Skipping quiescent ticks keeps the log, statuses, positions and every
+    # heatmap but the contacts one, which misses the skipped ticks' contacts
+    skipped = simulate(mode, QUIESCENCE='skip', HEATMAP_BIN_SIZE=5).run()
+    assert_same_logs(full, skipped)
+    for name in ('status', 'positions', 'heatmap_occupancy',
+                 'heatmap_infections', 'heatmap_isolation'):
+        np.testing.assert_array_equal(full[name], skipped[name], err_msg=name)
+    assert np.all(skipped['heatmap_contacts'] <= full['heatmap_contacts'])
+
+    # Stopping keeps the log only
+    stopped = simulate(mode, QUIESCENCE='stop')
+    ticks = 0
+    while not stopped.env.complete:
+        stopped.env.tick()
+        ticks += 1
+    # The run must actually have stopped early for this to test anything
+    assert ticks < SMALL['MAXIMUM_TIME']
+    assert_same_logs(full, stopped.results())
+
+
+def test_branching_closes_observers(tmp_path):
+    sim = simulate('D', MAXIMUM_TIME=60)
+    sim.env.add_observer(TrajectoryRecorder(str(tmp_path)))
+    sim.run(30)
+    sim.env.run_branches([{'CAUTION_THRESHOLD': 3}, {'CAUTION_THRESHOLD': 8}])
+    assert sim.env.complete
+    # Closing the recorder writes how many ticks it recorded
+    assert Trajectory(str(tmp_path)).ticks == 30
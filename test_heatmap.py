@@ -0,0 +1,30 @@
+"""
+Tests of heatmap.py. Run with: python3 -m pytest
+"""
+from simulation import Simulation, make_config
+
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'INFECTION_PROBABILITY': 0.02}
+
+
+def run(mode:str, **overrides) -> dict:
+    return Simulation(make_config(mode, 2, dict(SMALL, **overrides))).run()
+
+
+def test_occupancy_counts_agent_ticks():
+    ticks = 200
+    results = run('D', MAXIMUM_TIME=ticks, HEATMAP_BIN_SIZE=7)
+    occupancy = results['heatmap_occupancy']
+    assert occupancy.shape == (8, 8)
+    assert occupancy.sum() == SMALL['NUM_AGENTS'] * ticks
+    assert results['heatmap_isolation'].sum() <= occupancy.sum()
+
+
+def test_infections_counts_every_infection():
+    # Without loss of immunity, every agent that is not susceptible at the end
+    # was infected exactly once, the initial infections included
+    results = run('B', MAXIMUM_TIME=300, IMMUNITY_DURATION=1000,
+                  INFECTION_PROBABILITY=0.1, HEATMAP_BIN_SIZE=7)
+    infections = results['heatmap_infections'].sum()
+    assert infections == SMALL['NUM_AGENTS'] - results['susceptible'][-1]
+    assert infections > results['infected'][0]
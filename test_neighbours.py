@@ -0,0 +1,29 @@
+"""
+Tests of the Verlet neighbour lists in neighbours.py. Run with:
+python3 -m pytest
+"""
+import numpy as np
+import pytest
+
+from logger import COLUMNS
+from simulation import Simulation, make_config
+
+MODES = ('A', 'B', 'C', 'D')
+# A small, crowded world, so that runs are quick but agents often meet
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def run(mode:str, **overrides) -> dict:
+    return Simulation(make_config(mode, 2, dict(SMALL, **overrides))).run()
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_verlet_matches_grid(mode):
+    # Both searches find the same neighbours in the same order, so every
+    # random draw, and so every log column, must be the same
+    grid = run(mode, NEIGHBOUR_SEARCH='grid')
+    verlet = run(mode, NEIGHBOUR_SEARCH='verlet')
+    for column in COLUMNS:
+        np.testing.assert_array_equal(grid[column], verlet[column], err_msg=column)
+    np.testing.assert_array_equal(grid['status'], verlet['status'])
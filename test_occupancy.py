@@ -0,0 +1,48 @@
+"""
+Tests of the occupancy backends in occupancy.py. Run with: python3 -m pytest
+"""
+import numpy as np
+import pytest
+
+from logger import COLUMNS
+from simulation import Simulation, make_config
+
+MODES = ('A', 'B', 'C', 'D')
+# A small, crowded world, so that runs are quick but agents often meet
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def run(mode:str, **overrides) -> dict:
+    return Simulation(make_config(mode, 2, dict(SMALL, **overrides))).run()
+
+
+def assert_same_logs(results:dict, other:dict) -> None:
+    for column in COLUMNS:
+        np.testing.assert_array_equal(results[column], other[column], err_msg=column)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_sparse_matches_dense(mode):
+    dense = run(mode, OCCUPANCY_BACKEND='dense')
+    sparse = run(mode, OCCUPANCY_BACKEND='sparse')
+    assert_same_logs(dense, sparse)
+    np.testing.assert_array_equal(dense['positions'], sparse['positions'])
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_single_chunk_memmap_matches_dense(mode):
+    # With one chunk, visiting agents by chunk is visiting them as added
+    dense = run(mode, OCCUPANCY_BACKEND='dense')
+    memmap = run(mode, OCCUPANCY_BACKEND='memmap', MEMMAP_CHUNK_SIZE=64)
+    assert_same_logs(dense, memmap)
+
+
+def test_memmap_runs_share_directory(tmp_path):
+    # Each run must start from an empty grid, not the last run's chunks
+    first = run('A', OCCUPANCY_BACKEND='memmap', MEMMAP_DIRECTORY=str(tmp_path),
+                MEMMAP_CHUNK_SIZE=16)
+    second = run('A', OCCUPANCY_BACKEND='memmap', MEMMAP_DIRECTORY=str(tmp_path),
+                 MEMMAP_CHUNK_SIZE=16)
+    assert_same_logs(first, second)
+    assert list(tmp_path.iterdir()) == []
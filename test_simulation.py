@@ -0,0 +1,38 @@
+"""
+Tests of the in-memory Simulation API of simulation.py. Run with:
+python3 -m pytest
+"""
+import numpy as np
+import pytest
+
+from logger import COLUMNS
+from simulation import Simulation, make_config, parse_overrides
+
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def simulate(mode:str, **overrides) -> Simulation:
+    return Simulation(make_config(mode, 2, dict(SMALL, **overrides)))
+
+
+def test_run_in_steps_matches_one_run():
+    sim = simulate('D')
+    sim.run(100)
+    sim.run(250)
+    stepped = sim.run()
+    whole = simulate('D').run()
+    for column in COLUMNS:
+        np.testing.assert_array_equal(stepped[column], whole[column], err_msg=column)
+
+
+def test_make_config_rejects_unknown_parameter():
+    with pytest.raises(ValueError):
+        make_config('A', 2, {'NO_SUCH_PARAMETER': 1})
+
+
+def test_parse_overrides():
+    assert parse_overrides('CAUTION_THRESHOLD=3, SYMPTOM_TESTING_LAG=1.5') == \
+        {'CAUTION_THRESHOLD': 3, 'SYMPTOM_TESTING_LAG': 1.5}
+    with pytest.raises(ValueError):
+        parse_overrides('CAUTION_THRESHOLD=three')
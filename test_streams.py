@@ -0,0 +1,37 @@
+"""
+Tests of the keyed streams of streams.py. Run with: python3 -m pytest
+"""
+import numpy as np
+
+from simulation import Simulation, make_config
+from streams import KeyedStreams
+
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def test_streams_independent_of_order():
+    ids = np.arange(50)
+    forward = KeyedStreams(7)
+    first = [forward.stream('move', 3, i).random() for i in ids.tolist()]
+
+    # Interleaving draws of other kinds and ticks, in reverse, changes nothing
+    backward = KeyedStreams(7)
+    last = list()
+    for i in reversed(ids.tolist()):
+        backward.stream('infect', 4, i, i + 1).random()
+        last.append(backward.stream('move', 3, i).random())
+        backward.stream('false_alarm', 2, i).random()
+    assert first == last[::-1]
+
+    np.testing.assert_array_equal(KeyedStreams(7).uniforms('move', 3, ids), first)
+    assert first != [KeyedStreams(8).stream('move', 3, i).random() for i in ids.tolist()]
+
+
+def test_common_random_numbers_spawn_alike_in_every_mode():
+    homes = list()
+    for mode in ('A', 'B', 'C', 'D'):
+        config = make_config(mode, 2, dict(SMALL, COMMON_RANDOM_NUMBERS=True))
+        env = Simulation(config).env
+        homes.append([(a.home_point, a.work_point) for a in env.agents])
+    assert all(h == homes[0] for h in homes[1:])
@@ -0,0 +1,35 @@
+"""
+Tests of trajectory recording and replay. Run with: python3 -m pytest
+"""
+import numpy as np
+import pytest
+
+from simulation import Simulation, make_config
+from trajectory import Trajectory, TrajectoryRecorder
+
+SMALL = {'NUM_AGENTS': 60, 'WORLD_WIDTH': 50, 'WORLD_HEIGHT': 50,
+         'MAXIMUM_TIME': 800, 'INFECTION_PROBABILITY': 0.02}
+
+
+def record(directory:str, **overrides) -> dict:
+    """
+    Run mode A, recording it to <directory>, and return its results.
+    """
+
+    sim = Simulation(make_config('A', 2, dict(SMALL, **overrides)))
+    sim.env.add_observer(TrajectoryRecorder(directory))
+    return sim.run()
+
+
+def test_replay_moves_as_recorded(tmp_path):
+    recorded = record(str(tmp_path))
+    replayed = Simulation(make_config('A', 2, SMALL),
+                          trajectory=Trajectory(str(tmp_path))).run()
+    np.testing.assert_array_equal(recorded['positions'], replayed['positions'])
+
+
+def test_replay_refuses_other_visiting_order(tmp_path):
+    record(str(tmp_path), OCCUPANCY_BACKEND='sparse')
+    config = make_config('A', 2, dict(SMALL, OCCUPANCY_BACKEND='memmap'))
+    with pytest.raises(ValueError):
+        Simulation(config, trajectory=Trajectory(str(tmp_path)))
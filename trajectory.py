@@ -0,0 +1,176 @@
+"""
+Recording and replay of agent movement.
+
+In mode A (SimulationMode.NO_REACTION), the disease never affects how agents
+move, so the movement of a seeded run is the same whatever the infection
+parameters. A TrajectoryRecorder records it once; a ReplayEnvironment then
+plays it back under any number of infection parameters, doing only the
+infection work each tick.
+
+A recording is a directory holding:
+
+- trajectory.json:          Size of the world, number of agents, number of
+                            ticks recorded, and the occupancy backend and
+                            order of visiting agents the recording was made
+                            with
+- trajectory_points.npy:    Start, home and work point of each agent, as an
+                            int32 array of shape (3, agents, 2)
+- trajectory.dat:           Each agent's move in each tick, as a memory-mapped
+                            int16 array of (dx, dy) of shape (ticks, agents, 2)
+"""
+import json
+import numpy as np
+import os
+
+from environment import Environment
+from observer import Observer
+from occupancy import resolve_backend, visiting_order_name
+from render import agent_positions
+from simulation_parameters import SimConfig, SimulationMode
+
+
+class TrajectoryRecorder(Observer):
+    """
+    Observer that records the moves of every agent. Attach it once all agents
+    have been added, before the first tick.
+    """
+
+    def __init__(self, directory:str):
+        """
+        directory:  Directory to write the recording to
+        """
+
+        self.directory = directory
+        self.deltas = None
+        self.positions = None
+        self.ticks = 0
+
+
+    def attach(self, env) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.positions = agent_positions(env)
+        points = np.stack((self.positions,
+                           np.array([a.home_point for a in env.agents], dtype=np.int32),
+                           np.array([a.work_point for a in env.agents], dtype=np.int32)))
+        np.save(os.path.join(self.directory, 'trajectory_points.npy'), points)
+
+        # Room for every tick of the run; close() records how many were used
+        self.deltas = np.memmap(os.path.join(self.directory, 'trajectory.dat'),
+                                dtype=np.int16, mode='w+',
+                                shape=(env.cfg.MAXIMUM_TIME, len(env.agents), 2))
+        self.ticks = 0
+        self.write_header(env)
+
+
+    def observe(self, env) -> None:
+        positions = agent_positions(env)
+        self.deltas[env.current_time - 1] = positions - self.positions
+        self.positions = positions
+        self.ticks = env.current_time
+
+
+    def close(self, env) -> None:
+        self.deltas.flush()
+        self.deltas = None
+        self.write_header(env)
+
+
+    def write_header(self, env) -> None:
+        header = {'width': env.canvas_size_x,
+                  'height': env.canvas_size_y,
+                  'agents': len(env.agents),
+                  'ticks': self.ticks,
+                  'backend': env.occupancy.name,
+                  'visiting_order': visiting_order_name(env.occupancy.name, env.cfg)}
+        with open(os.path.join(self.directory, 'trajectory.json'), 'w') as f:
+            json.dump(header, f)
+
+
+class Trajectory:
+    """
+    A recording made by a TrajectoryRecorder, opened for replay.
+    """
+
+    def __init__(self, directory:str):
+        with open(os.path.join(directory, 'trajectory.json')) as f:
+            header = json.load(f)
+        self.width = header['width']
+        self.height = header['height']
+        self.num_agents = header['agents']
+        self.ticks = header['ticks']
+        # Recordings made before these were stored can only have been made
+        # with a backend that visits agents in the order they were added
+        self.backend = header.get('backend')
+        self.visiting_order = header.get('visiting_order', 'as added')
+
+        points = np.load(os.path.join(directory, 'trajectory_points.npy'))
+        self.start_points, self.home_points, self.work_points = points
+        # The file may have room for more ticks than were recorded
+        path = os.path.join(directory, 'trajectory.dat')
+        total = os.path.getsize(path) // (np.dtype(np.int16).itemsize * 2 * self.num_agents)
+        self.deltas = np.memmap(path, dtype=np.int16, mode='r',
+                                shape=(total, self.num_agents, 2))
+
+
+class ReplayEnvironment(Environment):
+    """
+    Mode A environment whose agents follow a recorded trajectory rather than
+    choosing their own moves. Everything else (infection, logging) works as
+    in Environment.
+    """
+
+    def __init__(self, trajectory:Trajectory, config:SimConfig, run_identifier:str,
+                 output:bool=True):
+        """
+        trajectory: The recording to replay
+        config:     Simulation parameters. Must be for mode A, with the same
+                    number of agents as the recording, and no more ticks. Its
+                    occupancy backend must visit agents in the same order as
+                    the recording's; dense and sparse visit them in the same
+                    order, memmap does not.
+        output:     See Environment
+        """
+
+        if config.RESPONSE_MODE != SimulationMode.NO_REACTION:
+            raise ValueError('Only mode A runs can be replayed')
+        if config.NUM_AGENTS != trajectory.num_agents:
+            raise ValueError(f'Recording has {trajectory.num_agents} agents, '
+                             f'not {config.NUM_AGENTS}')
+        if config.MAXIMUM_TIME > trajectory.ticks:
+            raise ValueError(f'Recording only has {trajectory.ticks} ticks')
+        # Recorded moves are only into free spaces if agents make them in the
+        # order they were recorded in
+        backend = resolve_backend(trajectory.width, trajectory.height, config)
+        order = visiting_order_name(backend, config)
+        if order != trajectory.visiting_order:
+            raise ValueError(f'Recording was made with the '
+                             f'{trajectory.backend or "dense or sparse"} occupancy '
+                             f'backend, which visits agents '
+                             f'{trajectory.visiting_order}, but the {backend} '
+                             f'backend visits them {order}')
+
+        self.trajectory = trajectory
+        super().__init__(trajectory.width, trajectory.height, config,
+                         run_identifier, output=output)
+
+        for start, home, work in zip(trajectory.start_points.tolist(),
+                                     trajectory.home_points.tolist(),
+                                     trajectory.work_points.tolist()):
+            self.add_agent(tuple(home), tuple(work))
+            agent = self.agents[-1]
+            if tuple(start) != tuple(home):
+                self.move_object(agent, *start)
+
+
+    def move_agents(self, visiting_order:list) -> None:
+        """
+        Overrides Environment.move_agents(), making the recorded moves. Agents
+        move in the same order as when the recording was made, so every move
+        is into a space that is free at that point.
+        """
+
+        deltas = self.trajectory.deltas[self.current_time - 1].tolist()
+        for agent in visiting_order:
+            dx, dy = deltas[agent.index]
+            if dx or dy:
+                self.move_object(agent, agent.x + dx, agent.y + dy)
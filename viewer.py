@@ -0,0 +1,244 @@
+"""
+Viewer for a run published with `window.py --publish NAME`: attaches to the
+run's snapshots in shared memory, and draws the latest one at up to FPS
+frames a second. Closing the viewer detaches from the run without affecting
+it; a viewer can be started again at any time.
+
+    python3 viewer.py NAME
+
+Controls:
+- Mouse wheel, or + and -:  Zoom in and out
+- Drag, or arrow keys:      Pan
+- 0 or Home:                Show the whole world
+
+Only the part of the world in view is drawn. Zoomed in, it is drawn cell by
+cell; zoomed out past one cell per pixel, each pixel instead shows the mean
+status colour and density of the agents in the block of cells it covers
+(see render.overview()), so large worlds stay smooth to view.
+"""
+import argparse
+import math
+import pygame
+import sys
+import time
+
+from render import BLACK, overview, rasterize
+from snapshot import SnapshotBuffer
+
+# Largest window size; worlds are scaled down to fit
+MAX_RES_HORIZ = 1920
+MAX_RES_VERT = 1080
+FPS = 30
+# Seconds between attempts to attach to a run that has not started yet
+RETRY_DELAY = 0.5
+# Largest zoom, as a power of two of pixels per cell
+MAX_ZOOM_LEVEL = 6
+# Fraction of the window panned by each press of an arrow key
+PAN_STEP = 0.25
+
+
+def attach(name:str) -> SnapshotBuffer:
+    """
+    Attach to a run's snapshots, waiting for the run to start if need be.
+    """
+
+    waiting = False
+    while True:
+        try:
+            return SnapshotBuffer(name)
+        except FileNotFoundError:
+            if not waiting:
+                print(f'Waiting for run {name} to start')
+                waiting = True
+            time.sleep(RETRY_DELAY)
+
+
+class Viewport:
+    """
+    The part of the world shown in the window: the world coordinates of its
+    top left corner, and its zoom, in powers of two of pixels per cell.
+    """
+
+    def __init__(self, world:tuple, window:tuple):
+        """
+        world:  Size of the world, in cells
+        window: Size of the window, in pixels
+        """
+
+        self.world = world
+        self.window = window
+        # Zoomed out far enough for the whole world to fit in one pixel
+        self.min_level = -math.ceil(math.log2(max(world)))
+        self.fit()
+
+
+    def fit(self) -> None:
+        """
+        Zoom to the largest zoom that shows the whole world, centred.
+        """
+
+        scale = min(w / c for w, c in zip(self.window, self.world))
+        self.level = max(self.min_level, min(math.floor(math.log2(scale)),
+                                             MAX_ZOOM_LEVEL))
+        self.x = (self.world[0] - self.window[0] / self.zoom) / 2
+        self.y = (self.world[1] - self.window[1] / self.zoom) / 2
+
+
+    @property
+    def zoom(self) -> float:
+        return 2.0 ** self.level
+
+
+    def zoom_at(self, steps:int, pixel:tuple) -> None:
+        """
+        Zoom in (or out, for negative <steps>) by powers of two, keeping the
+        cell under <pixel> in place.
+        """
+
+        level = max(self.min_level, min(self.level + steps, MAX_ZOOM_LEVEL))
+        px, py = pixel
+        cx = self.x + px / self.zoom
+        cy = self.y + py / self.zoom
+        self.level = level
+        self.x = cx - px / self.zoom
+        self.y = cy - py / self.zoom
+
+
+    def pan(self, dx:float, dy:float) -> None:
+        """
+        Pan by a number of pixels.
+        """
+
+        self.x += dx / self.zoom
+        self.y += dy / self.zoom
+
+
+    def draw(self, screen, snapshot:tuple, home, work) -> None:
+        """
+        Draw the part of a snapshot in view.
+        """
+
+        screen.fill(BLACK)
+        _, daytime, positions, status = snapshot
+        width, height = self.world
+
+        if self.level >= 0:
+            # Whole cells in view, each drawn as a zoom x zoom square
+            zoom = int(self.zoom)
+            x0, y0 = math.floor(self.x), math.floor(self.y)
+            x1 = x0 + math.ceil(self.window[0] / zoom) + 1
+            y1 = y0 + math.ceil(self.window[1] / zoom) + 1
+            factor = 1
+        else:
+            # Blocks of factor x factor cells, each drawn as one pixel; blocks
+            # are aligned to the world, so they do not shimmer as the view pans
+            factor = 2 ** -self.level
+            zoom = 1
+            x0 = math.floor(self.x / factor) * factor
+            y0 = math.floor(self.y / factor) * factor
+            x1 = x0 + (self.window[0] + 1) * factor
+            y1 = y0 + (self.window[1] + 1) * factor
+        region = (max(x0, 0), max(y0, 0), min(x1, width), min(y1, height))
+        if region[0] >= region[2] or region[1] >= region[3]:
+            return
+
+        if factor == 1:
+            frame = rasterize(width, height, positions, status, home, work,
+                              daytime, region)
+        else:
+            frame = overview(positions, status, region, factor, daytime)
+        # Surfaces are indexed by (x, y)
+        surface = pygame.surfarray.make_surface(frame.swapaxes(0, 1))
+        if zoom > 1:
+            surface = pygame.transform.scale(surface, (surface.get_width() * zoom,
+                                                       surface.get_height() * zoom))
+        # Position of the region's corner in the window
+        left = round((region[0] - self.x) * self.zoom)
+        top = round((region[1] - self.y) * self.zoom)
+        screen.blit(surface, (left, top))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='View a published run')
+    parser.add_argument('name', help='name given to window.py --publish')
+    parser.add_argument('--fps', type=int, default=FPS)
+    args = parser.parse_args()
+
+    buffer = attach(args.name)
+    # Fit the window to the world, with square cells, as far as the largest
+    # window allows
+    scale = min(MAX_RES_HORIZ / buffer.width, MAX_RES_VERT / buffer.height)
+    size = (max(1, min(MAX_RES_HORIZ, round(buffer.width * scale))),
+            max(1, min(MAX_RES_VERT, round(buffer.height * scale))))
+    view = Viewport((buffer.width, buffer.height), size)
+
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+    clock = pygame.time.Clock()
+
+    home = buffer.home.copy()
+    work = buffer.work.copy()
+    snapshot = None
+    ended = False
+    dragging = False
+    running = True
+    while running:
+        # Redraw if the view changes, or a new snapshot arrives
+        moved = False
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.MOUSEWHEEL:
+                view.zoom_at(event.y, pygame.mouse.get_pos())
+                moved = True
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                dragging = True
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                dragging = False
+            elif event.type == pygame.MOUSEMOTION and dragging:
+                view.pan(-event.rel[0], -event.rel[1])
+                moved = True
+            elif event.type == pygame.KEYDOWN:
+                centre = (size[0] // 2, size[1] // 2)
+                step_x = size[0] * PAN_STEP
+                step_y = size[1] * PAN_STEP
+                if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    view.zoom_at(1, centre)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    view.zoom_at(-1, centre)
+                elif event.key in (pygame.K_0, pygame.K_HOME):
+                    view.fit()
+                elif event.key == pygame.K_LEFT:
+                    view.pan(-step_x, 0)
+                elif event.key == pygame.K_RIGHT:
+                    view.pan(step_x, 0)
+                elif event.key == pygame.K_UP:
+                    view.pan(0, -step_y)
+                elif event.key == pygame.K_DOWN:
+                    view.pan(0, step_y)
+                moved = True
+
+        if not ended:
+            # A snapshot published just before the end is still read
+            ended = buffer.closed
+            latest = buffer.read()
+            if latest is not None and (snapshot is None or latest[0] != snapshot[0]):
+                snapshot = latest
+                moved = True
+            tick = snapshot[0] if snapshot is not None else None
+            caption = f'Agent Simulation: {args.name}, tick {tick}'
+            pygame.display.set_caption(caption + (' (ended)' if ended else ''))
+
+        if moved and snapshot is not None:
+            view.draw(screen, snapshot, home, work)
+            pygame.display.update()
+
+        clock.tick(args.fps)
+
+    buffer.close()
+    pygame.quit()
+    sys.exit()
+
+
+if __name__ == '__main__':
+    main()
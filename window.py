@@ -1,6 +1,9 @@
 # TODO: More decoupling between this view, and the model
 import argparse
+from domain import TiledEnvironment
+from ensemble import Ensemble
 from environment import Environment
+from frames import FrameExporter
 import math
 import numpy as np
 import pygame
@@ -10,46 +13,100 @@ import sys
 
 from logger import Logger
 from plotter import Plotter
-from simulation_parameters import SimConfig
+from render import *
+from simulation import infect_initial, parse_overrides, spawn_agents
+from simulation_parameters import SimConfig, SimulationMode
 from sir import SIR_status as sir
-
-# Colour values
-BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
-RED = (255, 0, 0)
-BLUE = (0, 0, 255)
-GREEN = (0, 255, 0)
-ORANGE = (255, 128, 0)
-YELLOW = (255, 255, 0)
-DARK_YELLOW = (120, 120, 0)
-PURPLE = (255, 0, 255)
-BLUE_GRAY = (70, 70, 80)
-PINK = (255, 128, 200)
-
-
-HOME_COLOR = GREEN
-WORK_COLOR = BLUE
-
-agent_colors = {
-    sir.SUSCEPTIBLE: DARK_YELLOW,
-    sir.INCUBATING_SAFE: YELLOW,
-    sir.INCUBATING_CONTAGIOUS: ORANGE,
-    sir.SYMPTOMATIC_MILD: PINK,
-    sir.SYMPTOMATIC_SEVERE: RED,
-    sir.RECOVERED: PURPLE
-}
+from snapshot import SnapshotPublisher
+from trajectory import ReplayEnvironment, Trajectory, TrajectoryRecorder
 
 parser = argparse.ArgumentParser()
 parser.add_argument('mode')
 parser.add_argument('severity', type=int)
 parser.add_argument('--headless', action='store_true')
+parser.add_argument('--tiles', metavar='COLSxROWS',
+                    help='split the world into tiles simulated in parallel '
+                         'worker processes (headless only)')
+parser.add_argument('--record', metavar='DIR',
+                    help='record the movement of the agents to DIR')
+parser.add_argument('--replay', metavar='DIR',
+                    help='replay the movement recorded in DIR instead of '
+                         'simulating it (mode A only)')
+parser.add_argument('--publish', metavar='NAME',
+                    help='publish snapshots of the run to shared memory under '
+                         'NAME, for viewer.py to display')
+parser.add_argument('--export', metavar='PATH',
+                    help='export frames of the run to a video file (e.g. '
+                         'run.mp4, needs ffmpeg) or a directory of images')
+parser.add_argument('--export-every', type=int, default=10, metavar='K',
+                    help='export a frame every K ticks (default: 10)')
+parser.add_argument('--fork-at', type=int, metavar='T',
+                    help='at tick T, split the run into the branches given by '
+                         '--branch, simulating the ticks before T only once '
+                         '(headless only)')
+parser.add_argument('--branch', action='append', metavar='NAME=VALUE[,...]',
+                    help='parameters to override in one branch of --fork-at, '
+                         'e.g. CAUTION_THRESHOLD=3,SYMPTOM_TESTING_LAG=1; '
+                         'may be given several times')
+parser.add_argument('--replicates', type=int, metavar='R',
+                    help='simulate R replicates with different seeds together, '
+                         'as one vectorized ensemble (headless, modes A and B '
+                         'only)')
 args = parser.parse_args()
 headless = args.headless
 if(headless):
     print("Running in headless mode")
 
+tiles = None
+if args.tiles is not None:
+    if not headless:
+        parser.error('--tiles requires --headless')
+    try:
+        tiles = tuple(int(n) for n in args.tiles.lower().split('x'))
+    except ValueError:
+        tiles = ()
+    if len(tiles) != 2 or min(tiles) < 1:
+        parser.error(f'invalid tile layout: {args.tiles}')
+    if (args.record is not None or args.replay is not None
+            or args.publish is not None or args.export is not None):
+        parser.error('--tiles cannot be combined with --record, --replay, '
+                     '--publish or --export')
+
+if args.export_every < 1:
+    parser.error(f'invalid export interval: {args.export_every}')
+
+branches = None
+if args.fork_at is not None or args.branch is not None:
+    if args.fork_at is None or args.branch is None:
+        parser.error('--fork-at and --branch must be given together')
+    if not headless or args.tiles is not None or args.replicates is not None:
+        parser.error('--fork-at requires --headless, and cannot be combined '
+                     'with --tiles or --replicates')
+    branches = list()
+    for spec in args.branch:
+        try:
+            branches.append(parse_overrides(spec))
+        except ValueError as e:
+            parser.error(f'--branch: {e}')
+
 cfg = SimConfig(args.mode, args.severity)
 
+if args.replay is not None and cfg.RESPONSE_MODE != SimulationMode.NO_REACTION:
+    parser.error('--replay only supports mode A')
+
+if args.replicates is not None:
+    if not headless:
+        parser.error('--replicates requires --headless')
+    if args.replicates < 1:
+        parser.error(f'invalid number of replicates: {args.replicates}')
+    if cfg.RESPONSE_MODE not in (SimulationMode.NO_REACTION,
+                                 SimulationMode.SELF_ISOLATION):
+        parser.error('--replicates only supports modes A and B')
+    if (tiles is not None or args.record is not None or args.replay is not None
+            or args.publish is not None or args.export is not None):
+        parser.error('--replicates cannot be combined with --tiles, --record, '
+                     '--replay, --publish or --export')
+
 
 # Window properties
 # Maximum window resolution
@@ -90,19 +147,46 @@ def main():
 
     run_identifier = f'mode{args.mode}_sev{args.severity}'
 
-    # Build the Evironment / world
-    env = Environment(cfg.WORLD_WIDTH, cfg.WORLD_HEIGHT, cfg, run_identifier)
-   
-    # Ensure that there are enough spaces in the gridworld to allow for one
-    # work and one home point per agent.
-    if not cfg.NUM_AGENTS*2 < cfg.WORLD_HEIGHT*cfg.WORLD_WIDTH:
-        print('Not enough world space to spawn provided number of agents')
+    if args.replicates is not None:
+        # Each replicate logs to its own subdirectory, <run_identifier>_rep<r>
+        ensemble = Ensemble(cfg, run_identifier, args.replicates)
+        while not ensemble.complete:
+            ensemble.tick()
         sys.exit()
-    spawn_agents(env)
+
+    # Build the Evironment / world
+    if args.replay is not None:
+        # The recording brings its own world and agents
+        try:
+            env = ReplayEnvironment(Trajectory(args.replay), cfg, run_identifier)
+        except ValueError as e:
+            print(e)
+            sys.exit()
+    else:
+        if tiles is not None:
+            env = TiledEnvironment(cfg.WORLD_WIDTH, cfg.WORLD_HEIGHT, cfg,
+                                   run_identifier, *tiles)
+        else:
+            env = Environment(cfg.WORLD_WIDTH, cfg.WORLD_HEIGHT, cfg, run_identifier)
+
+        try:
+            spawn_agents(env, cfg)
+        except ValueError as e:
+            print(e)
+            sys.exit()
 
     # Infect some of the agents
-    for i in range(int(math.ceil(cfg.NUM_AGENTS * cfg.INITIAL_INFECTED_PERCENT))):
-        env.infect_agent(env.agents[i])
+    infect_initial(env, cfg)
+
+    if args.record is not None:
+        env.add_observer(TrajectoryRecorder(args.record))
+
+    if args.publish is not None:
+        # Closing a viewer (python3 viewer.py NAME) never affects the run
+        env.add_observer(SnapshotPublisher(args.publish))
+
+    if args.export is not None:
+        env.add_observer(FrameExporter(args.export, args.export_every))
 
     if not headless:
         pygame.display.update()
@@ -120,7 +204,13 @@ def main():
 
             elif event.type == TICK_EVENT:
                 # Tick simulation forward
-                if not env.complete:
+                if branches is not None and env.current_time == args.fork_at:
+                    # Each branch logs to <run_identifier>_branch<i>
+                    env.run_branches(branches)
+                    running = False
+                    # Later tick events in this batch would branch again
+                    break
+                elif not env.complete:
                     env.tick()
                 else:
                     running = False
@@ -161,46 +251,19 @@ def draw_view(env):
         global screen
         screen.fill(BLUE_GRAY)
 
-    for p in env.home_points:
-        x, y = p.tolist()
+    for x, y in env.home_points:
         draw_square(x, y, HOME_COLOR)
 
-    for p in env.work_points:
-        x, y = p.tolist()
+    for x, y in env.work_points:
         draw_square(x, y, WORK_COLOR)
 
     # Get list of agents and display them all
     for a in env.agents:
-        x, y = a.pos.tolist()
+        x, y = a.x, a.y
         color = agent_colors[a.infection.status]
         draw_square(x, y, color)
     pygame.display.update()
 
 
-def spawn_agents(env):
-    """
-    Spawn in agents, assigning them home and work points.
-    """
-    coord_list = list()
-
-    # Generate list of all coordinate pairs (i.e. all cells)
-    for x in range(cfg.WORLD_WIDTH):
-        for y in range(cfg.WORLD_HEIGHT):
-            coord_list.append(np.array([x,y]))
-
-    # Shuffle the list
-    random.shuffle(coord_list)
-
-    # For each agent, pop two coordinates off the stack to use as their home
-    # and work points. This avoids coordinate re-use and is much more efficient
-    # than checking which coords have been used over and over.
-    for n in range(cfg.NUM_AGENTS):
-        home_point = coord_list.pop()
-        work_point = coord_list.pop()
-        # env.home_points.append(home_point)
-        # env.work_points.append(work_point)
-        env.add_agent(home_point, work_point)
-
-
 if __name__ == '__main__':
     main()